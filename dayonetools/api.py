@@ -0,0 +1,205 @@
+"""
+Library API for embedding the importers in a long running process
+
+The command line scripts read sys.argv and print progress, which means a
+service has to fork a subprocess per import.  This module runs imports in
+background threads instead and never touches sys.argv or prints:
+
+    from dayonetools import api
+
+    job = api.import_service('sleep_cycle', '/data/sleep.csv', journal,
+                             {'start_date': datetime(2014, 1, 1)})
+    for file_name in job:
+        ...
+
+Every job is an iterator streaming the file names of the entries written into
+the sink folder as soon as they exist.  A job can be cancelled at any time
+and errors of the import are raised by the iterator.  An Importer bounds the
+number of imports running at once, jobs submitted beyond that wait for a free
+slot.
+
+options are passed as keyword arguments to the import_entries() function of
+the service, e.g. start_date for all services and timeline_file for
+habit_list.  pedometerpp reads device backups instead of a single source and
+is not available here.
+"""
+
+import Queue
+import sys
+import threading
+
+# datetime.strptime() imports this lazily which is not thread safe in Python 2
+import _strptime  # pylint: disable=unused-import
+
+from dayonetools import services
+
+DEFAULT_CONCURRENCY = 4
+
+# Entries a job buffers before the import waits for the consumer
+DEFAULT_QUEUE_SIZE = 100
+
+# Seconds between checks for cancellation while waiting on the queue
+_POLL = 0.1
+
+_DONE = object()
+
+
+class ImportJob(object):
+    """
+    One import running in a background thread
+
+    Iterate over the job to get the file names of the written entries.
+    """
+
+    def __init__(self, service, source, sink, options=None, slots=None,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        module = services.get_service_module(service)
+        if not hasattr(module, 'import_entries'):
+            raise ValueError('Service %s has no library import' % (service))
+
+        self.service = service
+        self.source = source
+        self.sink = sink
+        self.count = 0
+
+        self._import = module.import_entries
+        self._options = options or {}
+        self._slots = slots
+        self._queue = Queue.Queue(max(1, queue_size))
+        self._error = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=_POLL)
+            except Queue.Empty:
+                if self._cancelled.is_set():
+                    break
+                continue
+
+            if item is _DONE:
+                break
+
+            yield item
+
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+
+    @property
+    def cancelled(self):
+        """True if cancel() was called"""
+
+        return self._cancelled.is_set()
+
+    @property
+    def done(self):
+        """True once the import thread finished"""
+
+        return self._done.is_set()
+
+    def cancel(self):
+        """Stop the import after the entry being written right now"""
+
+        self._cancelled.set()
+
+    def wait(self, timeout=None):
+        """Wait for the import thread to finish, return True if it did"""
+
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def result(self):
+        """Return list of all file names written, raise errors of the import"""
+
+        return list(self)
+
+    def _put(self, item):
+        """Queue item for the consumer, return False if cancelled meanwhile"""
+
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=_POLL)
+                return True
+            except Queue.Full:
+                continue
+
+        return False
+
+    def _run(self):
+        """Run the import while holding a concurrency slot"""
+
+        if self._slots is not None:
+            self._slots.acquire()
+
+        try:
+            if not self._cancelled.is_set():
+                entries = self._import(self.source, self.sink, **self._options)
+                for file_name in entries:
+                    self.count += 1
+                    if not self._put(file_name):
+                        entries.close()
+                        break
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+            self._put(_DONE)
+            self._done.set()
+
+
+class Importer(object):
+    """Runs import jobs with at most max_concurrent of them at once"""
+
+    def __init__(self, max_concurrent=DEFAULT_CONCURRENCY,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._jobs = []
+        self._lock = threading.Lock()
+
+    def submit(self, service, source, sink, options=None):
+        """Start importing source into sink folder, return the ImportJob"""
+
+        job = ImportJob(service, source, sink, options, self._slots,
+                        self.queue_size)
+
+        with self._lock:
+            self._jobs = [running for running in self._jobs
+                          if not running.done]
+            self._jobs.append(job)
+
+        return job
+
+    def cancel_all(self):
+        """Cancel all jobs that did not finish yet"""
+
+        with self._lock:
+            for job in self._jobs:
+                job.cancel()
+
+
+_DEFAULT_IMPORTER = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def import_service(service, source, sink, options=None):
+    """
+    Start importing source with service into sink folder and return the
+    ImportJob, at most DEFAULT_CONCURRENCY of these run at once
+    """
+
+    global _DEFAULT_IMPORTER
+
+    with _DEFAULT_LOCK:
+        if _DEFAULT_IMPORTER is None:
+            _DEFAULT_IMPORTER = Importer()
+
+    return _DEFAULT_IMPORTER.submit(service, source, sink, options)
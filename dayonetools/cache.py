@@ -0,0 +1,85 @@
+"""
+Cache of parsed input records keyed by a fingerprint of the export
+
+Parsing an export (JSON decoding, timezone conversion, all the strptime calls)
+is often the most expensive part of a run.  When the same export is imported
+again, e.g. to try a different --since or template, the normalized records are
+loaded from a pickle in the state folder instead.
+
+The cache key is made of the size, mtime and content hash of the input file,
+the parser version of the service and any settings the parser depends on, so
+changing any of them parses the input again.
+"""
+
+import cPickle
+import hashlib
+import os
+
+from dayonetools import inputs
+from dayonetools.mmapfile import MappedFile
+from dayonetools.services import get_state_folder
+
+
+def add_arguments(parser):
+    """Add cache related arguments to given argparse parser"""
+
+    parser.add_argument('--cache', default=False, action='store_true',
+                        dest='cache', required=False,
+                        help=('Cache parsed input in the state folder to '
+                              'speed up re-runs on the same export'))
+
+
+def fingerprint(filename):
+    """Return (size, mtime, sha1 hex digest) tuple of given file"""
+
+    stat = os.stat(filename)
+
+    # Hash through mmap so the page cache is used directly instead of
+    # copying the file through read() buffers.
+    with MappedFile(filename) as mapped:
+        digest = hashlib.sha1(mapped.view())
+
+    return stat.st_size, stat.st_mtime, digest.hexdigest()
+
+
+def cached_records(service, filename, version, settings, parse):
+    """
+    Return list of records parse(filename) produces, from the cache if the
+    same input was parsed before with the same version and settings
+
+    settings should be a dict of everything the parser output depends on
+    besides the input file itself.  Records must be picklable.  Compressed
+    inputs are fingerprinted by their archive file.
+    """
+
+    # Standard input can't be fingerprinted without consuming it
+    path = inputs.source_path(filename)
+    if path is None:
+        return list(parse(filename))
+
+    source = hashlib.sha1(os.path.abspath(filename)).hexdigest()[:16]
+    key = hashlib.sha1(repr((service, fingerprint(path), version,
+                             sorted(settings.items())))).hexdigest()[:16]
+
+    prefix = '%s-%s-' % (service, source)
+    folder = get_state_folder('cache')
+    cache_file = os.path.join(folder, prefix + key + '.pickle')
+
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as file_obj:
+            return cPickle.load(file_obj)
+
+    records = list(parse(filename))
+
+    temp_name = cache_file + '.tmp'
+    with open(temp_name, 'wb') as file_obj:
+        cPickle.dump(records, file_obj, cPickle.HIGHEST_PROTOCOL)
+
+    os.rename(temp_name, cache_file)
+
+    # Only keep the newest cache of every input file around
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name != os.path.basename(cache_file):
+            os.remove(os.path.join(folder, name))
+
+    return records
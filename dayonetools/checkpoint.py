@@ -0,0 +1,150 @@
+"""
+Checkpoints so an interrupted import can be resumed instead of restarted
+
+Every service records how far it got in the source (a row index, the last day
+written or a ZTIMESTAMP watermark).  The checkpoint is flushed to the state
+folder every few entries and when the run stops for any reason, so running the
+service again with --resume continues from the last committed point instead
+of creating duplicates.  A run that completes removes its checkpoint, there's
+nothing left to resume and a later --resume must not skip anything of a new
+export at the same path.
+"""
+
+import hashlib
+import json
+import os
+import signal
+
+from dayonetools.services import get_state_folder
+
+# Number of committed entries between two writes of the checkpoint file
+DEFAULT_INTERVAL = 100
+
+
+def add_arguments(parser):
+    """Add checkpoint related arguments to given argparse parser"""
+
+    parser.add_argument('--resume', default=False, action='store_true',
+                        dest='resume', required=False,
+                        help=('Continue an interrupted import from the last '
+                              'committed checkpoint'))
+
+    parser.add_argument('--checkpoint-every', default=DEFAULT_INTERVAL,
+                        type=int, dest='checkpoint_every', required=False,
+                        help=('Number of entries between checkpoint writes, '
+                              'default: %d' % (DEFAULT_INTERVAL)))
+
+
+def _terminate(signum, frame):
+    """Turn SIGTERM into SystemExit so pending checkpoints get flushed"""
+
+    raise SystemExit(128 + signum)
+
+
+class Checkpoint(object):
+    """
+    Position in a source up to which all entries are written
+
+    position is opaque to this class, it only has to be JSON serializable.
+    A disabled checkpoint is never written and leaves SIGTERM alone.
+    """
+
+    def __init__(self, service, source, interval=DEFAULT_INTERVAL,
+                 enabled=True):
+        key = hashlib.sha1(os.path.abspath(source)).hexdigest()[:16]
+        file_name = '%s-%s.json' % (service, key)
+
+        self.path = os.path.join(get_state_folder('checkpoints'), file_name)
+        self.service = service
+        self.source = os.path.abspath(source)
+        self.interval = max(1, interval)
+        self.position = None
+        self.enabled = enabled
+        self._uncommitted = 0
+
+        # Keep the checkpoint of a completed run, for the watermarks of
+        # incremental imports
+        self.keep = False
+
+        # Called before every write, e.g. to flush buffered entries first so
+        # the checkpoint never gets ahead of what's really written
+        self.before_flush = None
+
+        self._previous_handler = None
+        if not enabled:
+            return
+
+        try:
+            self._previous_handler = signal.signal(signal.SIGTERM,
+                                                   _terminate)
+        except ValueError:
+            # Only possible from the main thread, embedding callers have to
+            # stop us themselves.
+            pass
+
+    def load(self):
+        """Load previous checkpoint for this source and return position"""
+
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'r') as file_obj:
+            state = json.load(file_obj)
+
+        self.position = state['position']
+
+        return self.position
+
+    def commit(self, position):
+        """Mark everything up to position as done"""
+
+        self.position = position
+
+        self._uncommitted += 1
+        if self._uncommitted >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """Atomically write checkpoint file"""
+
+        if not self.enabled or self.position is None:
+            return
+
+        if self.before_flush is not None:
+            self.before_flush()
+
+        state = {'service': self.service, 'source': self.source,
+                 'position': self.position}
+
+        # Write a temp file and rename it so a crash or full disk during the
+        # write can never leave a truncated checkpoint behind.
+        temp_name = self.path + '.tmp'
+        with open(temp_name, 'w') as file_obj:
+            json.dump(state, file_obj)
+            file_obj.flush()
+            os.fsync(file_obj.fileno())
+
+        os.rename(temp_name, self.path)
+        self._uncommitted = 0
+
+    def remove(self):
+        """Remove checkpoint file"""
+
+        if self.enabled and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self, completed=False):
+        """
+        Write checkpoint a last time and restore previous SIGTERM handler, the
+        checkpoint of a completed run is removed unless keep is set
+        """
+
+        try:
+            if completed and not self.keep:
+                self.remove()
+            else:
+                self.flush()
+        finally:
+            if self._previous_handler is not None:
+                signal.signal(signal.SIGTERM, self._previous_handler)
+                self._previous_handler = None
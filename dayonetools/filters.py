@@ -0,0 +1,265 @@
+"""
+Record filters pushed down into the readers
+
+Besides --since every service takes --until and, where the records have
+them, filters on their fields:
+
+    --match FIELD=REGEX             records with FIELD matching REGEX
+    --min FIELD=NUMBER              records with FIELD at least NUMBER
+    --tag/--exclude-tag TAG         iDoneThis dones with/without #TAG
+    --device/--exclude-device NAME  Nike+ activities of/not of a device
+
+Fields are the columns of the export.  Case doesn't matter and spaces are the
+same as underscores, so 'sleep_quality' is the 'Sleep quality' column.  Habit
+List records only have a 'name', iDoneThis dones a 'text' and pedometerpp days
+'steps'.  The value of a field for --min is the first number in it, so '53%'
+is 53 and fields without a number never pass.  Every option can be given more
+than once, a record has to pass all of them.  Fields a service doesn't have
+are reported when the arguments are parsed, see check_fields().
+
+The options are compiled once into a predicate which each reader applies at
+the cheapest point it has: CSV rows are dropped before they become records,
+Habit List skips whole habits by name before converting any completion and
+pedometerpp turns the dates into WHERE clauses.  --shard is checked at the
+same point, see dayonetools.shard.  pedometerpp still sums the steps of days
+that don't pass for its weekly and monthly entries, it only doesn't write
+their own entries.
+"""
+
+import argparse
+import re
+from datetime import datetime
+
+from dayonetools import shard
+
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+_TAG_RE = re.compile(r'#(\w+)', re.UNICODE)
+
+
+def _field_key(name):
+    """Return name of a field as it's compared"""
+
+    return re.sub(r'[()]', '', name).strip().lower().replace(' ', '_')
+
+
+def day(str_):
+    """Check date string in YYYY-MM-DD format, an argparse type"""
+
+    try:
+        datetime.strptime(str_, '%Y-%m-%d')
+    except ValueError:
+        msg = 'Invalid date format, should be YYYY-MM-DD'
+        raise argparse.ArgumentTypeError(msg)
+
+    return str_
+
+
+def _field_regex(str_):
+    """Convert 'FIELD=REGEX' string to (field, compiled regex)"""
+
+    field, sep, pattern = str_.partition('=')
+    if not sep or not field:
+        raise argparse.ArgumentTypeError(
+                                    'Invalid match, should be FIELD=REGEX')
+
+    try:
+        return _field_key(field), re.compile(pattern)
+    except re.error as err:
+        raise argparse.ArgumentTypeError('Invalid regex %r: %s' % (pattern,
+                                                                   err))
+
+
+def _field_number(str_):
+    """Convert 'FIELD=NUMBER' string to (field, number)"""
+
+    field, sep, number = str_.partition('=')
+
+    try:
+        if not sep or not field:
+            raise ValueError
+        return _field_key(field), float(number)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+                                    'Invalid minimum, should be FIELD=NUMBER')
+
+
+def add_arguments(parser, fields=True, tags=False, devices=False):
+    """
+    Add filter related arguments to given argparse parser, fields, tags and
+    devices tell which filters the records of the service support
+    """
+
+    parser.add_argument('--until', default=None, type=day,
+                        dest='until', required=False, metavar='YYYY-MM-DD',
+                        help='Only process entries up to YYYY-MM-DD')
+
+    if fields:
+        parser.add_argument('--match', default=[], type=_field_regex,
+                            action='append', dest='match', required=False,
+                            metavar='FIELD=REGEX',
+                            help='Only process records with FIELD matching '
+                                 'REGEX')
+
+        parser.add_argument('--min', default=[], type=_field_number,
+                            action='append', dest='min', required=False,
+                            metavar='FIELD=NUMBER',
+                            help='Only process records with FIELD at least '
+                                 'NUMBER')
+
+    if tags:
+        parser.add_argument('--tag', default=[], action='append',
+                            dest='tag', required=False,
+                            help='Only process records with this #tag')
+
+        parser.add_argument('--exclude-tag', default=[], action='append',
+                            dest='exclude_tag', required=False, metavar='TAG',
+                            help='Skip records with this #tag')
+
+    if devices:
+        parser.add_argument('--device', default=[], action='append',
+                            dest='include_device', required=False,
+                            help='Only process records of this device')
+
+        parser.add_argument('--exclude-device', default=[], action='append',
+                            dest='exclude_device', required=False,
+                            metavar='DEVICE',
+                            help='Skip records of this device')
+
+
+def check_fields(parser, args, fields):
+    """
+    Exit with an error of argparse parser if --match or --min of the parsed
+    arguments dict args name a field that isn't in fields, the fields of the
+    records of the service
+    """
+
+    keys = [_field_key(name) for name in fields]
+    for key, _ in (args.get('match') or []) + (args.get('min') or []):
+        if key not in keys:
+            parser.error('No field %r to filter on, fields are: %s' % (
+                         key, ', '.join(keys)))
+
+
+def number(value):
+    """Return first number in string value as float, None if there is none"""
+
+    match = _NUMBER_RE.search(value)
+    return match and float(match.group())
+
+
+class Filter(object):
+    """Compiled record filters of the arguments of a run"""
+
+    def __init__(self, until=None, matches=(), minimums=(), tags=(),
+                 exclude_tags=(), devices=(), exclude_devices=(),
+                 shard_spec=None):
+        self.until = until
+        self.matches = list(matches)
+        self.minimums = list(minimums)
+        self.tags = frozenset(tag.lstrip('#').lower() for tag in tags)
+        self.exclude_tags = frozenset(tag.lstrip('#').lower()
+                                      for tag in exclude_tags)
+        self.devices = frozenset(device.lower() for device in devices)
+        self.exclude_devices = frozenset(device.lower()
+                                         for device in exclude_devices)
+        self.shard = shard_spec
+
+    @classmethod
+    def from_args(cls, args):
+        """Return Filter for the parsed arguments dict args"""
+
+        return cls(args.get('until'), args.get('match') or (),
+                   args.get('min') or (), args.get('tag') or (),
+                   args.get('exclude_tag') or (),
+                   args.get('include_device') or (),
+                   args.get('exclude_device') or (), args.get('shard'))
+
+    def day_ok(self, day_str):
+        """True if the day of 'YYYY-MM-DD...' string day_str is kept"""
+
+        return self.until is None or day_str[:10] <= self.until
+
+    def shard_ok(self, key):
+        """True if the record with shard key key is in the shard of the run"""
+
+        return shard.in_shard(self.shard, key)
+
+    def minimum(self, field):
+        """Return the minimum given for field, None if there is none"""
+
+        values = [value for key, value in self.minimums
+                  if key == _field_key(field)]
+        return max(values) if values else None
+
+    def row_predicate(self, header, date_field=None, shard_key=None):
+        """
+        Return function telling if a row with the columns named in header is
+        kept, None if every row is
+
+        date_field is the column holding the 'YYYY-MM-DD...' date --until
+        compares to.  shard_key is a function returning the shard key of a
+        row, rows of other shards are dropped if given.  Raises ValueError if
+        a filter names a field that isn't in header.
+        """
+
+        keys = [_field_key(name) for name in header]
+
+        def _index(key):
+            """Return index of field key in rows"""
+
+            try:
+                return keys.index(key)
+            except ValueError:
+                raise ValueError('No field %r to filter on, fields are: %s' % (
+                                 key, ', '.join(keys)))
+
+        checks = []
+
+        if self.until is not None and date_field is not None:
+            index = _index(_field_key(date_field))
+            checks.append(lambda row, index=index, until=self.until:
+                          row[index][:10] <= until)
+
+        for key, regex in self.matches:
+            index, search = _index(key), regex.search
+            checks.append(lambda row, index=index, search=search:
+                          search(row[index]) is not None)
+
+        for key, minimum in self.minimums:
+            index = _index(key)
+            checks.append(lambda row, index=index, minimum=minimum:
+                          number(row[index]) >= minimum)
+
+        if self.tags or self.exclude_tags:
+            def _tags_ok(row, index=_index('text'), tags=self.tags,
+                         exclude_tags=self.exclude_tags):
+                """True if the #tags of the text column are wanted"""
+
+                found = set(tag.lower() for tag in _TAG_RE.findall(row[index]))
+                return tags <= found and not found & exclude_tags
+
+            checks.append(_tags_ok)
+
+        if self.devices or self.exclude_devices:
+            def _device_ok(row, index=_index('device'), devices=self.devices,
+                           exclude_devices=self.exclude_devices):
+                """True if the device column is a wanted device"""
+
+                device = row[index].lower()
+                return ((not devices or device in devices) and
+                        device not in exclude_devices)
+
+            checks.append(_device_ok)
+
+        if self.shard is not None and shard_key is not None:
+            checks.append(lambda row, spec=self.shard, shard_key=shard_key:
+                          shard.in_shard(spec, shard_key(row)))
+
+        if not checks:
+            return None
+
+        if len(checks) == 1:
+            return checks[0]
+
+        return lambda row: all(check(row) for check in checks)
@@ -0,0 +1,251 @@
+"""
+Opening export files given with -f/--file
+
+Plain files are memory mapped (see mmapfile).  Compressed exports are
+decompressed on the fly instead of being extracted to disk first:
+
+    export.csv.gz, export.csv.bz2, export.csv.xz
+    archive.zip               the only member of the archive
+    archive.zip:export.csv    a member of the archive
+    -                         standard input, e.g. piped from a mail filter
+
+A background thread decompresses/reads ahead in chunks so that work overlaps
+with parsing.  Line iteration streams, everything needing the whole input
+(find(), count(), ...) reads it into memory first.  .xz needs the lzma module
+which Python 2 only has with the backports.lzma package.
+"""
+
+import bz2
+import gzip
+import Queue
+import sys
+import threading
+import zipfile
+
+try:
+    from backports import lzma
+except ImportError:
+    try:
+        import lzma
+    except ImportError:
+        lzma = None
+
+from dayonetools.mmapfile import MappedFile
+
+STDIN = '-'
+
+CHUNK_SIZE = 256 * 1024
+
+# Chunks read ahead of the parser before the reader thread waits
+READ_AHEAD = 16
+
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zip')
+
+# Seconds between checks for close() while waiting on the queue
+_POLL = 0.1
+
+
+def _split_zip_name(filename):
+    """Return (archive, member or None) if filename names a zip archive"""
+
+    if filename.lower().endswith('.zip'):
+        return filename, None
+
+    pos = filename.lower().rfind('.zip:')
+    if pos != -1:
+        return filename[:pos + 4], filename[pos + 5:]
+
+    return None
+
+
+def is_stream(filename):
+    """True if filename can only be read sequentially, i.e. not mapped"""
+
+    return (filename == STDIN or _split_zip_name(filename) is not None or
+            filename.lower().endswith(COMPRESSED_SUFFIXES))
+
+
+def source_path(filename):
+    """
+    Return path of the file on disk holding filename, the archive for zip
+    members, or None for standard input
+    """
+
+    if filename == STDIN:
+        return None
+
+    zip_name = _split_zip_name(filename)
+    return filename if zip_name is None else zip_name[0]
+
+
+def open_input(filename):
+    """Return MappedFile or StreamedFile for filename"""
+
+    if is_stream(filename):
+        return StreamedFile(filename)
+
+    return MappedFile(filename)
+
+
+def _open_stream(filename):
+    """Return (file object, objects to close when done) for filename"""
+
+    if filename == STDIN:
+        return sys.stdin, []
+
+    zip_name = _split_zip_name(filename)
+    if zip_name is not None:
+        archive_name, member = zip_name
+        archive = zipfile.ZipFile(archive_name, 'r')
+
+        if member is None:
+            members = [info.filename for info in archive.infolist()
+                       if not info.filename.endswith('/')]
+            if len(members) != 1:
+                archive.close()
+                raise IOError('%s has %d members, name one with %s:MEMBER' % (
+                              archive_name, len(members), archive_name))
+            member = members[0]
+
+        file_obj = archive.open(member, 'r')
+        return file_obj, [file_obj, archive]
+
+    lower = filename.lower()
+    if lower.endswith('.gz'):
+        file_obj = gzip.open(filename, 'rb')
+    elif lower.endswith('.bz2'):
+        file_obj = bz2.BZ2File(filename, 'rb')
+    elif lower.endswith('.xz'):
+        if lzma is None:
+            raise IOError('Reading %s needs the backports.lzma package' % (
+                          filename))
+        file_obj = lzma.LZMAFile(filename, 'rb')
+    else:
+        file_obj = open(filename, 'rb')
+
+    return file_obj, [file_obj]
+
+
+class StreamedFile(MappedFile):
+    """
+    Sequential input with the same interface as MappedFile
+
+    lines() from the start streams chunks as the reader thread produces
+    them.  Any other access reads the rest of the input into data first, so
+    it is not possible after streaming lines.
+    """
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, filename):
+        self.name = filename
+        self.offset = 0
+
+        self._file, self._to_close = _open_stream(filename)
+        self._chunks = Queue.Queue(READ_AHEAD)
+        self._closed = threading.Event()
+        self._error = None
+        self._data = None
+        self._streamed = False
+
+        self._thread = threading.Thread(target=self._reader)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def data(self):
+        """Whole input as a string"""
+
+        if self._data is None:
+            if self._streamed:
+                raise IOError('%s was already streamed' % (self.name))
+
+            self._data = ''.join(self._iter_chunks())
+
+        return self._data
+
+    @property
+    def size(self):
+        """Length of the whole input"""
+
+        return len(self.data)
+
+    def close(self):
+        """Stop the reader thread and close the input"""
+
+        self._closed.set()
+
+        # Standard input can block forever, there's nothing to close anyway
+        if self._to_close:
+            self._thread.join()
+
+        for file_obj in self._to_close:
+            file_obj.close()
+
+    def lines(self, start=0, end=None):
+        """
+        Yield lines, including line endings, from start up to end
+
+        Streams without keeping the input in memory when reading from the
+        start to the end for the first time.
+        """
+
+        if self._data is not None or start != 0 or end is not None:
+            for line in super(StreamedFile, self).lines(start, end):
+                yield line
+            return
+
+        if self._streamed:
+            raise IOError('%s was already streamed' % (self.name))
+
+        self._streamed = True
+        pending = ''
+
+        for chunk in self._iter_chunks():
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+
+            for line in lines:
+                self.offset += len(line) + 1
+                yield line + '\n'
+
+        if pending:
+            self.offset += len(pending)
+            yield pending
+
+    def _iter_chunks(self):
+        """Yield chunks from the reader thread, raise its errors"""
+
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                break
+
+            yield chunk
+
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+
+    def _put(self, chunk):
+        """Queue chunk, return False if closed meanwhile"""
+
+        while not self._closed.is_set():
+            try:
+                self._chunks.put(chunk, timeout=_POLL)
+                return True
+            except Queue.Full:
+                continue
+
+        return False
+
+    def _reader(self):
+        """Read chunks into the queue until the input ends or is closed"""
+
+        try:
+            while True:
+                chunk = self._file.read(CHUNK_SIZE)
+                if not chunk or not self._put(chunk):
+                    break
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            self._put(None)
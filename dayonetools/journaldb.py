@@ -0,0 +1,434 @@
+"""
+Bulk output of entries into a SQLite journal database
+
+Newer Day One versions keep a journal in a SQLite database instead of one
+plist file per entry.  With --journal-db FILE the services write entries,
+their tags and any other metadata straight into such a database:
+
+    entries         name, uuid, creation_date, time_zone, starred, text
+    tags            id, name
+    entry_tags      entry, tag
+    entry_metadata  entry, key, value (JSON)
+
+Entries are identified by the name their file would have had without the
+.doentry extension, so rewriting an entry, e.g. with --upsert or an
+incremental pedometerpp run, replaces it just like it replaces the file.  An
+existing database with these tables is used as is, otherwise they are
+created.
+
+Entries are never rendered into plist text and parsed back.  The plist of an
+entry template is parsed once with markers in place of its fields, every
+entry fills the values of that skeleton with its fields as they are, so text
+like 'Wine & cheese' needs no escaping.
+
+Rows are queued and inserted with executemany() in one transaction per
+--journal-db-batch entries, with the pragmas set for bulk loading: no fsync,
+a write-ahead log and a big page cache.  The checkpoint flushes the queue
+before it's written so a resumed import never misses an entry.
+"""
+
+import datetime
+import json
+import logging
+import os
+import plistlib
+import re
+import sqlite3
+import string
+from xml.etree import cElementTree
+
+import pytz
+
+from dayonetools import templates
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    uuid TEXT NOT NULL,
+    creation_date TEXT NOT NULL,
+    time_zone TEXT,
+    starred INTEGER NOT NULL DEFAULT 0,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_creation_date ON entries (creation_date);
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS entry_tags (
+    entry TEXT NOT NULL,
+    tag INTEGER NOT NULL,
+    PRIMARY KEY (entry, tag)
+);
+CREATE TABLE IF NOT EXISTS entry_metadata (
+    entry TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (entry, key)
+);
+"""
+
+PRAGMAS = ('PRAGMA journal_mode = WAL',
+           'PRAGMA synchronous = OFF',
+           'PRAGMA temp_store = MEMORY',
+           'PRAGMA cache_size = -65536')
+
+# Plist keys stored in the entries table, everything else is metadata
+_COLUMNS = ('UUID', 'Creation Date', 'Time Zone', 'Starred', 'Entry Text',
+            'Tags')
+
+# Stands in for field number n of a template while its plist is parsed
+_MARKER = 'DAYONETOOLS-FIELD-%d-'
+_MARKER_RE = re.compile(r'DAYONETOOLS-FIELD-(\d+)-')
+
+# Converters of the rendered text of plist values, dates stay strings as
+# they are already in the format of the creation_date column
+_CONVERTERS = {
+    'string': lambda text: text,
+    'date': lambda text: text,
+    'integer': int,
+    'real': float,
+    'data': lambda text: plistlib.Data(text.decode('base64')),
+}
+
+
+def add_arguments(parser):
+    """Add journal database related arguments to given argparse parser"""
+
+    parser.add_argument('--journal-db', default=None, action='store',
+                        dest='journal_db', required=False, metavar='FILE',
+                        help=('Write entries into this SQLite journal '
+                              'database instead of .doentry files'))
+
+    parser.add_argument('--journal-db-batch', default=DEFAULT_BATCH_SIZE,
+                        type=int, dest='journal_db_batch', required=False,
+                        help=('Entries inserted per transaction, default: '
+                              '%d' % (DEFAULT_BATCH_SIZE)))
+
+
+def _date_string(value):
+    """Return plist date as 'YYYY-MM-DDTHH:MM:SSZ' string in UTC"""
+
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(pytz.utc)
+        return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    return value
+
+
+def _json_default(value):
+    """Encode plist values json doesn't know"""
+
+    if isinstance(value, datetime.datetime):
+        return _date_string(value)
+
+    if isinstance(value, plistlib.Data):
+        return value.data.encode('base64')
+
+    raise TypeError('Cannot store %r' % (value))
+
+
+class PlistTemplate(object):
+    """
+    Plist skeleton of an entry template, a templates.Template
+
+    fill(values) returns the plist dict of an entry just like parsing the
+    text template.render(values) would, but every value is rendered from its
+    own part of the template without any XML.  Raises ValueError if the
+    template isn't a plist or has fields outside of plist values.
+    """
+
+    def __init__(self, template, name='<template>'):
+        self.name = name
+        self.template = template
+        self._fields = []
+
+        try:
+            parsed = list(string.Formatter().parse(template.text))
+        except ValueError as err:
+            raise ValueError('%s: %s' % (name, err))
+
+        marked = []
+        for literal, field, spec, conversion in parsed:
+            marked.append(literal)
+            if field is not None:
+                marked.append(_MARKER % (len(self._fields)))
+                self._fields.append('{%s%s%s}' % (
+                                    field, '!' + conversion if conversion
+                                    else '', ':' + spec if spec else ''))
+
+        # Entry templates start with a blank line before the XML declaration
+        try:
+            root = cElementTree.fromstring(''.join(marked).lstrip())
+        except SyntaxError as err:
+            raise ValueError('%s: not a plist: %s' % (name, err))
+
+        self._skeleton = self._compile(root[0])
+
+    def _check_no_field(self, text):
+        """Raise ValueError if text contains a field"""
+
+        if text and _MARKER_RE.search(text):
+            raise ValueError('%s: fields must be inside plist values for '
+                             '--journal-db' % (self.name))
+
+    def _compile(self, element):
+        """
+        Return skeleton node of plist element: (kind, children) for dict and
+        array, (None, value) for a constant and (kind, render) otherwise
+        """
+
+        self._check_no_field(element.tail)
+        for value in element.attrib.itervalues():
+            self._check_no_field(value)
+
+        tag = element.tag
+        if tag == 'dict':
+            self._check_no_field(element.text)
+            children = list(element)
+            for key in children[::2]:
+                self._check_no_field(key.text)
+                self._check_no_field(key.tail)
+
+            return 'dict', [(key.text, self._compile(value)) for key, value
+                            in zip(children[::2], children[1::2])]
+
+        if tag == 'array':
+            self._check_no_field(element.text)
+            return 'array', [self._compile(child) for child in element]
+
+        if tag in ('true', 'false'):
+            return None, tag == 'true'
+
+        if tag not in _CONVERTERS:
+            raise ValueError('%s: unknown plist element <%s>' % (self.name,
+                                                                   tag))
+
+        text = element.text or ''
+        parts = _MARKER_RE.split(text)
+        if len(parts) == 1:
+            return None, _CONVERTERS[tag](text)
+
+        # Literals and field numbers alternate, literals become format
+        # strings again
+        pieces = []
+        for num, part in enumerate(parts):
+            if num % 2:
+                pieces.append(self._fields[int(part)])
+            else:
+                pieces.append(part.replace('{', '{{').replace('}', '}}'))
+
+        render = templates.Template(''.join(pieces), self.template.fields,
+                                    self.template.title, self.name).render
+        return tag, render
+
+    def fill(self, values):
+        """Return plist dict of the entry with values"""
+
+        return self._fill(self._skeleton, values)
+
+    def _fill(self, node, values):
+        """Return value of skeleton node for values"""
+
+        kind, content = node
+        if kind is None:
+            return content
+        if kind == 'dict':
+            return dict((key, self._fill(child, values))
+                        for key, child in content)
+        if kind == 'array':
+            return [self._fill(child, values) for child in content]
+
+        return _CONVERTERS[kind](content(values))
+
+
+class JournalDB(object):
+    """Journal database with batched inserts of entries"""
+
+    def __init__(self, filename, batch_size=DEFAULT_BATCH_SIZE):
+        self.filename = filename
+        self.batch_size = max(1, batch_size)
+        self.count = 0
+
+        self._entries = []
+        self._tags = []
+        self._metadata = []
+
+        self.connection = sqlite3.connect(filename)
+        for pragma in PRAGMAS:
+            self.connection.execute(pragma)
+        self.connection.executescript(SCHEMA)
+
+        self._tag_ids = dict((name, tag_id) for tag_id, name in
+                             self.connection.execute('SELECT id, name '
+                                                     'FROM tags'))
+
+    def _add_tag(self, name):
+        """Insert new tag name and return its id"""
+
+        cursor = self.connection.execute('INSERT INTO tags (name) VALUES (?)',
+                                         (name,))
+        return cursor.lastrowid
+
+    def add(self, name, entry):
+        """
+        Queue entry named name, entry is a dict with the keys of a Day One
+        plist
+        """
+
+        self._entries.append((name, entry['UUID'],
+                              _date_string(entry['Creation Date']),
+                              entry.get('Time Zone'),
+                              int(bool(entry.get('Starred'))),
+                              entry.get('Entry Text', '')))
+
+        for tag in entry.get('Tags', []):
+            self._tags.append((name, tag))
+
+        for key, value in entry.iteritems():
+            if key not in _COLUMNS:
+                self._metadata.append((name, key,
+                                       json.dumps(value,
+                                                  default=_json_default)))
+
+        self.count += 1
+        if len(self._entries) >= self.batch_size:
+            self.flush()
+
+        return os.path.join(self.filename, name)
+
+    def pending(self):
+        """Number of entries queued"""
+
+        return len(self._entries)
+
+    def flush(self):
+        """Insert all queued entries in one transaction"""
+
+        if not self._entries:
+            return
+
+        names = [(row[0],) for row in self._entries]
+        new_tags = {}
+
+        with self.connection:
+            tags = []
+            for name, tag in self._tags:
+                tag_id = self._tag_ids.get(tag) or new_tags.get(tag)
+                if tag_id is None:
+                    tag_id = new_tags[tag] = self._add_tag(tag)
+                tags.append((name, tag_id))
+
+            # Tags and metadata of entries being replaced go with them
+            self.connection.executemany(
+                'DELETE FROM entry_tags WHERE entry = ?', names)
+            self.connection.executemany(
+                'DELETE FROM entry_metadata WHERE entry = ?', names)
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                self._entries)
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO entry_tags VALUES (?, ?)', tags)
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO entry_metadata VALUES (?, ?, ?)',
+                self._metadata)
+
+        # Only known once the transaction adding them went through
+        self._tag_ids.update(new_tags)
+
+        self._entries = []
+        self._tags = []
+        self._metadata = []
+
+    def close(self):
+        """Insert remaining entries and close the database"""
+
+        self.flush()
+        self.connection.close()
+
+
+def write_entry(directory, file_name, text):
+    """
+    Write rendered plist text of an entry as file_name into directory and
+    return its path
+    """
+
+    full_file_name = os.path.join(directory, file_name)
+    with open(full_file_name, 'w') as file_obj:
+        file_obj.write(text)
+
+    return full_file_name
+
+
+def write_plist(directory, file_name, entry):
+    """write_entry() for an entry given as plist dict"""
+
+    full_file_name = os.path.join(directory, file_name)
+    plistlib.writePlist(entry, full_file_name)
+
+    return full_file_name
+
+
+class JournalDBOutput(object):
+    """
+    Output writing entries into a journal database
+
+    Same interface as the outputs of dayonetools.staging, entries are named
+    after their file name without the extension.
+    """
+
+    def __init__(self, filename, batch_size=DEFAULT_BATCH_SIZE):
+        self.db = JournalDB(filename, batch_size)
+        self._plists = {}
+
+        # Called with the name of every entry added
+        self.on_written = None
+
+    def _plist(self, template):
+        """Return PlistTemplate of templates.Template template"""
+
+        # Keyed by id, the template is kept alive with its skeleton
+        try:
+            return self._plists[id(template)][1]
+        except KeyError:
+            plist = PlistTemplate(template)
+            self._plists[id(template)] = (template, plist)
+            return plist
+
+    def add_entry(self, file_name, template, values):
+        """
+        Queue entry of templates.Template template with values named after
+        file_name and return its name in the database
+        """
+
+        return self.add_plist(file_name, self._plist(template).fill(values))
+
+    def add_plist(self, file_name, entry):
+        """Queue entry given as plist dict, see add_entry()"""
+
+        name = self.db.add(os.path.splitext(file_name)[0], entry)
+        if self.on_written is not None:
+            self.on_written(name)
+
+        return name
+
+    def pending(self):
+        """Number of entries waiting to be inserted"""
+
+        return self.db.pending()
+
+    def flush(self):
+        """Insert queued entries, called before a checkpoint is written"""
+
+        self.db.flush()
+
+    def close(self):
+        """Insert remaining entries and close the database"""
+
+        self.db.close()
+        LOG.info('Wrote %d entries into %s', self.db.count, self.db.filename)
@@ -0,0 +1,119 @@
+"""
+Leveled, buffered logging for the import scripts
+
+All modules log to loggers below 'dayonetools' instead of printing.  Runs are
+quiet by default and only show warnings and errors, -v/--verbose shows
+details about every record and --log-level picks any level in between.
+Messages are buffered and written in batches, a warning or worse flushes the
+buffer right away so nothing important shows up late.
+
+Per-record messages use the lazy logging arguments and RateLimited checks the
+level once up front, so a quiet run doesn't format anything per record.  When
+dayonetools is used as a library nothing is configured and the application's
+logging setup applies.
+"""
+
+import logging
+import logging.handlers
+import sys
+import time
+
+LEVELS = ('debug', 'info', 'warning', 'error')
+
+# Records buffered before they are written
+BUFFER_SIZE = 200
+
+# Seconds between two progress summaries of a RateLimited
+DEFAULT_SUMMARY_INTERVAL = 5.0
+
+ROOT = 'dayonetools'
+
+logging.getLogger(ROOT).addHandler(logging.NullHandler())
+
+
+def add_arguments(parser):
+    """Add logging related arguments to given argparse parser"""
+
+    parser.add_argument('-q', '--quiet', default=False, action='store_true',
+                        dest='quiet', required=False,
+                        help='Only log errors')
+
+    parser.add_argument('--log-level', default=None, choices=LEVELS,
+                        dest='log_level', required=False,
+                        help=('Log level, default: warning or debug with '
+                              '--verbose'))
+
+    parser.add_argument('--log-file', default=None, action='store',
+                        dest='log_file', required=False,
+                        help='Append log to this file instead of stderr')
+
+
+def setup(args):
+    """Configure dayonetools logging according to parsed command line args"""
+
+    if args.get('log_level'):
+        level = getattr(logging, args['log_level'].upper())
+    elif args.get('quiet'):
+        level = logging.ERROR
+    elif args.get('verbose'):
+        level = logging.DEBUG
+    else:
+        level = logging.WARNING
+
+    if args.get('log_file'):
+        target = logging.FileHandler(args['log_file'])
+    else:
+        target = logging.StreamHandler(sys.stderr)
+    target.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+
+    # logging flushes and closes all handlers at exit
+    handler = logging.handlers.MemoryHandler(BUFFER_SIZE, logging.WARNING,
+                                             target)
+
+    logger = logging.getLogger(ROOT)
+    for old in logger.handlers[:]:
+        logger.removeHandler(old)
+
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+class RateLimited(object):
+    """
+    Counter logging an info summary at most every interval seconds
+
+    Does nothing but count if info messages aren't enabled.
+    """
+
+    def __init__(self, logger, what, interval=DEFAULT_SUMMARY_INTERVAL):
+        self.logger = logger
+        self.what = what
+        self.interval = interval
+        self.count = 0
+        self.enabled = logger.isEnabledFor(logging.INFO)
+        self._started = self._last = time.time()
+
+    def add(self, count=1):
+        """Count count more and log a summary if it's time for one"""
+
+        self.count += count
+
+        if self.enabled:
+            now = time.time()
+            if now - self._last >= self.interval:
+                self._last = now
+                self._log(now)
+
+    def done(self):
+        """Log the final summary"""
+
+        if self.enabled:
+            self._log(time.time())
+
+    def _log(self, now):
+        """Log count and rate"""
+
+        elapsed = max(now - self._started, 1e-6)
+        self.logger.info('%d %s, %.1f/s', self.count, self.what,
+                         self.count / elapsed)
@@ -1,17 +1,23 @@
 """Entry point for dayonetools import process"""
 
+import importlib
 import sys
 
 import dayonetools.services as services
 
+# Commands working on the journal instead of importing a service
+COMMANDS = ['rollback', 'verify']
+
 
 def _show_help():
     """Print help"""
 
-    _help = "{doc}\n\nUsage: {usage}\nSupported service arguments: {services}"
+    _help = ("{doc}\n\nUsage: {usage}\nSupported service arguments: "
+             "{services}\nOther commands: {commands}")
     args = {'doc': __doc__,
             'usage': '[--version] [%s <service_name>]' % (sys.argv[0]),
-            'services': services.AVAILABLE_SERVICES}
+            'services': services.AVAILABLE_SERVICES,
+            'commands': COMMANDS}
 
     print _help.format(**args)
 
@@ -45,12 +51,17 @@ def _parse_args():
     if valid_service:
         args['service_module'] = services.get_service_module(
                                                         args['service_name'])
+    elif args['service_name'] in COMMANDS:
+        valid_service = True
+        args['service_module'] = importlib.import_module(
+                                    'dayonetools.' + args['service_name'])
 
     # Manually handle -h so we can pass it to other scripts instead of this
     # main entry point stealing it.
     if '-h' in sys.argv and valid_service:
         pass
-    elif '-h' in sys.argv or len(sys.argv) == 2 or not valid_service:
+    elif ('-h' in sys.argv or not valid_service or
+          (len(sys.argv) == 2 and args['service_name'] not in COMMANDS)):
         _show_help()
         sys.exit(0)
 
@@ -0,0 +1,177 @@
+"""
+Checksum manifests of the entries written by each import run
+
+Every run writing into a journal gets a run id like
+'nikeplus-20140105-213000' and a manifest in the manifests state folder with
+the name and SHA-1 of every entry as it was placed into the journal.
+'dayonetools verify' uses them to find entries that went missing or were
+changed afterwards and 'dayonetools rollback' to undo a run.
+
+A manifest is a text file with '#key value' header lines followed by one
+'name<TAB>sha1<TAB>prior sha1' line per entry, the prior SHA-1 is '-' for
+entries the run created.  Entries written twice in a run, e.g. merged by
+--upsert, are listed again and the last line counts.
+
+The prior version of every entry a run replaces is kept in the objects
+folder next to the manifests under its SHA-1, as a hard link when possible so
+keeping it costs neither time nor space.
+"""
+
+import datetime
+import errno
+import hashlib
+import os
+import shutil
+
+from dayonetools.services import get_state_folder
+
+SUFFIX = '.manifest'
+
+# Prior SHA-1 of entries that didn't exist before
+CREATED = '-'
+
+
+def _folder():
+    """Return folder of all manifests"""
+
+    return get_state_folder('manifests')
+
+
+def object_path(sha1):
+    """Return path of kept entry content with given SHA-1"""
+
+    return os.path.join(get_state_folder('manifests', 'objects'), sha1)
+
+
+def _keep(file_name, sha1):
+    """Keep the content of file_name as object sha1 before it's replaced"""
+
+    path = object_path(sha1)
+    if os.path.exists(path):
+        return
+
+    try:
+        os.link(file_name, path)
+    except OSError:
+        # Other filesystem or no hard links there
+        shutil.copyfile(file_name, path)
+
+
+def file_checksum(file_name):
+    """Return SHA-1 hex digest of the contents of file_name"""
+
+    with open(file_name, 'rb') as file_obj:
+        return hashlib.sha1(file_obj.read()).hexdigest()
+
+
+class Manifest(object):
+    """Manifest of a new run writing entries into destination"""
+
+    def __init__(self, service, destination):
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.run_id, self._file = self._create('%s-%s' % (service, stamp))
+        self.count = 0
+
+        started = datetime.datetime.utcnow().isoformat()
+        for key, value in (('service', service),
+                           ('destination', os.path.abspath(destination)),
+                           ('started', started)):
+            self._file.write('#%s %s\n' % (key, value))
+
+    @staticmethod
+    def _create(run_id):
+        """Create manifest file for run_id, numbered if it already exists"""
+
+        base, number = run_id, 1
+        while True:
+            path = os.path.join(_folder(), run_id + SUFFIX)
+            try:
+                handle = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+
+                number += 1
+                run_id = '%s-%d' % (base, number)
+                continue
+
+            # Line buffered so an interrupted run keeps what it wrote
+            return run_id, os.fdopen(handle, 'w', 1)
+
+    def place(self, src, dst, move=os.rename):
+        """
+        Move entry src written by this run into the journal as dst and record
+        it, keeping the prior version if dst exists
+        """
+
+        sha1 = file_checksum(src)
+        prior = CREATED
+
+        if os.path.exists(dst):
+            prior = file_checksum(dst)
+            _keep(dst, prior)
+
+        move(src, dst)
+
+        self._file.write('%s\t%s\t%s\n' % (os.path.basename(dst), sha1,
+                                            prior))
+        self.count += 1
+
+    def close(self):
+        """Write everything to disk"""
+
+        self._file.close()
+
+
+def load(run_id):
+    """
+    Return (header dict, list of (name, sha1, prior sha1)) from manifest of
+    run_id, entries in the order they were placed
+
+    Raises IOError if there is no such run.
+    """
+
+    header = {}
+    entries = []
+
+    with open(os.path.join(_folder(), run_id + SUFFIX), 'r') as file_obj:
+        for line in file_obj:
+            line = line.rstrip('\n')
+            if line.startswith('#'):
+                key, _, value = line[1:].partition(' ')
+                header[key] = value
+            elif line:
+                entries.append(tuple(line.split('\t')))
+
+    return header, entries
+
+
+def append_header(run_id, key, value):
+    """Add header line to the manifest of a finished run"""
+
+    with open(os.path.join(_folder(), run_id + SUFFIX), 'a') as file_obj:
+        file_obj.write('#%s %s\n' % (key, value))
+
+
+def _started(path):
+    """Return start time of the run of manifest path as ISO string"""
+
+    with open(path, 'r') as file_obj:
+        for line in file_obj:
+            if line.startswith('#started '):
+                return line.split(' ', 1)[1].strip()
+
+            if not line.startswith('#'):
+                break
+
+    return ''
+
+
+def run_ids():
+    """Return ids of all recorded runs, oldest first"""
+
+    paths = [os.path.join(_folder(), name) for name in os.listdir(_folder())
+             if name.endswith(SUFFIX)]
+    paths.sort(key=_started)
+
+    return [os.path.basename(path)[:-len(SUFFIX)] for path in paths]
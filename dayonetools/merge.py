@@ -0,0 +1,181 @@
+"""
+Importing several overlapping exports in one run
+
+nikeplus, sleep_cycle, idonethis and habit_list take more than one export
+with -f, e.g. monthly snapshots that each contain the whole history or the
+exports of several phones:
+
+    nikeplus -f 2014-01.csv 2014-02.csv.gz phone2.csv
+
+Every export is read and parsed by its own thread, like pedometerpp reads
+its backups, into a queue of READ_AHEAD records.  The records are merged in
+date order and only written once, no matter how many exports have them.
+Threads overlap reading and decompressing one export with parsing the
+others, the parsing itself still takes turns.
+
+Records are told apart by a stable key, e.g. the whole row of a CSV export.
+The keys seen are kept in a spill.KeySet as short digests, about 80 bytes
+each, which moves them into a temporary file beyond --max-memory.  iDoneThis
+days are merged one date at a time instead, so only the dones of the current
+day have to be remembered.
+"""
+
+import heapq
+import logging
+import os
+import Queue
+import sys
+import threading
+
+# datetime.strptime() imports this lazily which is not thread safe in Python 2
+import _strptime  # pylint: disable=unused-import
+
+from dayonetools import spill
+
+LOG = logging.getLogger(__name__)
+
+# Records parsed ahead by every thread before it waits
+READ_AHEAD = 1024
+
+# Seconds between checks for close() while waiting on the queue
+_POLL = 0.1
+
+# Put into the queue after the last record
+_END = object()
+
+
+def source(filenames):
+    """Return checkpoint source of filenames, the file itself if it's one"""
+
+    if len(filenames) == 1:
+        return filenames[0]
+
+    return ';'.join(os.path.abspath(filename) for filename in filenames)
+
+
+class _Descending(object):
+    """Sort key ordering value the other way round"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class _Reader(object):
+    """Thread putting the records of an iterable into a bounded queue"""
+
+    def __init__(self, records):
+        self._records = records
+        self._queue = Queue.Queue(READ_AHEAD)
+        self._closed = threading.Event()
+        self._error = None
+
+        self._thread = threading.Thread(target=self._reader)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __iter__(self):
+        """Yield records from the thread, raise its errors"""
+
+        while True:
+            record = self._queue.get()
+            if record is _END:
+                break
+
+            yield record
+
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+
+    def close(self):
+        """Stop the thread"""
+
+        self._closed.set()
+        self._thread.join()
+
+    def _put(self, record):
+        """Queue record, return False if closed meanwhile"""
+
+        while not self._closed.is_set():
+            try:
+                self._queue.put(record, timeout=_POLL)
+                return True
+            except Queue.Full:
+                continue
+
+        return False
+
+    def _reader(self):
+        """Queue records until there are no more or closed"""
+
+        records = iter(self._records)
+        try:
+            for record in records:
+                if not self._put(record):
+                    break
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            # Closes the input of a generator stopped early
+            if hasattr(records, 'close'):
+                records.close()
+            self._put(_END)
+
+
+def merged(filenames, read, order=None, reverse=False):
+    """
+    Yield the records of read(filename) for all filenames, every export is
+    read by its own thread
+
+    With order the records are merged by order(record), the records of every
+    export have to be in that order already, descending with reverse.
+    Otherwise all records of the first export come first, then the ones of
+    the second and so on.
+    """
+
+    def _tagged(rank, records):
+        """Yield (sort key, rank, record) so records are never compared"""
+
+        for record in records:
+            value = order(record) if order is not None else None
+            if reverse:
+                value = _Descending(value)
+            yield value, rank, record
+
+    readers = [_Reader(read(filename)) for filename in filenames]
+    LOG.info('Merging %d exports', len(readers))
+
+    try:
+        for _, _, record in heapq.merge(*[_tagged(rank, reader)
+                                          for rank, reader
+                                          in enumerate(readers)]):
+            yield record
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+def unique(records, key, max_memory=None):
+    """
+    Yield the records whose key(record) string wasn't seen before, the keys
+    are kept in a spill.KeySet within max_memory bytes
+    """
+
+    duplicates = 0
+
+    with spill.KeySet(max_memory) as seen:
+        for record in records:
+            if seen.add(key(record)):
+                yield record
+            else:
+                duplicates += 1
+
+        LOG.info('Skipped %d duplicate records, %d unique', duplicates,
+                 len(seen))
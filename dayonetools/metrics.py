@@ -0,0 +1,216 @@
+"""
+Live throughput metrics for long running imports
+
+Services count what they do in a Metrics object (records parsed, entries
+rendered, files and bytes written, errors) and can register gauges such as
+queue depths.  A background thread samples everything at a fixed interval and
+emits one JSON object per line to a file or a UDP socket (--metrics) and/or
+draws a compact progress line with rate and ETA on stderr (--progress).
+
+When neither is asked for nothing is sampled and counting is a plain dict
+update, so the overhead for normal runs is negligible.
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 1.0
+
+COUNTERS = ('records_parsed', 'entries_rendered', 'files_written',
+            'bytes_written', 'errors')
+
+
+def add_arguments(parser):
+    """Add metrics related arguments to given argparse parser"""
+
+    parser.add_argument('--metrics', default=None, action='store',
+                        dest='metrics', required=False,
+                        help=('Emit JSON lines with metrics to this file or '
+                              'to udp://host:port'))
+
+    parser.add_argument('--metrics-interval', default=DEFAULT_INTERVAL,
+                        type=float, dest='metrics_interval', required=False,
+                        help=('Seconds between metrics samples, default: '
+                              '%.1f' % (DEFAULT_INTERVAL)))
+
+    parser.add_argument('--progress', default=False, action='store_true',
+                        dest='progress', required=False,
+                        help='Show progress line with rate and ETA on stderr')
+
+
+def get_metrics(service, args):
+    """Return started Metrics for service according to args"""
+
+    metrics = Metrics(service, args.get('metrics'),
+                      args.get('metrics_interval', DEFAULT_INTERVAL),
+                      args.get('progress', False))
+    metrics.start()
+    return metrics
+
+
+class _UDPSink(object):
+    """File like object sending every write as one UDP datagram"""
+
+    def __init__(self, address):
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def write(self, data):
+        try:
+            self.sock.sendto(data, self.address)
+        except socket.error:
+            # Metrics must never break an import
+            pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.sock.close()
+
+
+class Metrics(object):
+    """Counters and gauges of one import run plus the sampling thread"""
+
+    def __init__(self, service, target=None, interval=DEFAULT_INTERVAL,
+                 progress=False):
+        self.service = service
+        self.interval = max(0.1, interval)
+        self.progress = progress
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self.total = None
+        self.total_counter = 'entries_rendered'
+
+        self._gauges = {}
+        self._started = time.time()
+        self._last = (self._started, 0)
+        self._stop = threading.Event()
+        self._thread = None
+
+        if target is None:
+            self._sink = None
+        elif target.startswith('udp://'):
+            self._sink = _UDPSink(target[len('udp://'):])
+        else:
+            self._sink = open(target, 'a')
+
+    def start(self):
+        """Start sampling thread if there is anywhere to report to"""
+
+        if self._sink is None and not self.progress:
+            return
+
+        self._thread = threading.Thread(target=self._sampler)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def incr(self, name, value=1):
+        """Increase counter name by value"""
+
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Set counter name to value, for counts the caller keeps itself"""
+
+        self.counters[name] = value
+
+    def gauge(self, name, func):
+        """Register gauge name, func is called without arguments to sample"""
+
+        self._gauges[name] = func
+
+    def set_total(self, total, counter='entries_rendered'):
+        """Set expected final value of counter used for the ETA"""
+
+        self.total = total
+        self.total_counter = counter
+
+    def entry_written(self, file_name):
+        """Count one rendered entry written to file_name"""
+
+        self.counters['entries_rendered'] += 1
+        self.counters['files_written'] += 1
+
+        try:
+            self.counters['bytes_written'] += os.path.getsize(file_name)
+        except OSError:
+            # Already moved away by a staged output
+            pass
+
+    def sample(self):
+        """Return dict with the current value of all counters and gauges"""
+
+        now = time.time()
+        done = self.counters['entries_rendered']
+        last_time, last_done = self._last
+        self._last = (now, done)
+
+        gauges = {}
+        for name, func in self._gauges.iteritems():
+            try:
+                gauges[name] = func()
+            except Exception:
+                gauges[name] = None
+
+        return {'service': self.service, 'time': now,
+                'elapsed': now - self._started,
+                'rate': (done - last_done) / max(now - last_time, 1e-6),
+                'counters': dict(self.counters), 'gauges': gauges}
+
+    def close(self):
+        """Stop sampling and report the final values"""
+
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._report(final=True)
+
+        if self._sink is not None:
+            self._sink.close()
+
+        if self.progress:
+            sys.stderr.write('\n')
+
+    def _sampler(self):
+        """Report a sample every interval until stopped"""
+
+        while not self._stop.wait(self.interval):
+            self._report()
+
+    def _report(self, final=False):
+        """Write one sample to the sink and the progress line"""
+
+        sample = self.sample()
+        if final:
+            sample['final'] = True
+
+        if self._sink is not None:
+            self._sink.write(json.dumps(sample) + '\n')
+            self._sink.flush()
+
+        if self.progress:
+            sys.stderr.write('\r' + self._progress_line(sample))
+            sys.stderr.flush()
+
+    def _progress_line(self, sample):
+        """Return compact progress text for given sample"""
+
+        elapsed = max(sample['elapsed'], 1e-6)
+        done = self.counters.get(self.total_counter, 0)
+        line = '%s: %d entries, %.1f/s' % (
+            self.service, self.counters['entries_rendered'],
+            self.counters['entries_rendered'] / elapsed)
+
+        if self.total and done:
+            remaining = max(self.total - done, 0) * elapsed / done
+            line += ', %d%%, ETA %d:%02d' % (min(100, 100 * done / self.total),
+                                            remaining // 60, remaining % 60)
+
+        return line.ljust(72)
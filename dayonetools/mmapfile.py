@@ -0,0 +1,126 @@
+"""
+Memory-mapped, read-only access to export files
+
+Service readers use MappedFile instead of regular file objects so big exports
+are served straight from the page cache without repeated read() calls and
+buffer copies.  It supports zero-copy views for scanning records, line
+iteration from any byte offset (for seeking to a checkpoint) and splitting the
+file into line aligned chunks that can be parsed in parallel.
+"""
+
+import mmap
+import os
+
+
+class MappedFile(object):
+    """
+    Read-only memory map of a file
+
+    Use as a context manager or call close() when done.  offset is the byte
+    offset following the last line returned by lines().
+    """
+
+    def __init__(self, filename):
+        self.name = filename
+        self._file = open(filename, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.offset = 0
+
+        # Zero length files cannot be mapped but behave the same as an empty
+        # string for everything we do with them.
+        if self.size:
+            self.data = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            self.data = ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmap and close the file"""
+
+        if self.size:
+            self.data.close()
+
+        self._file.close()
+
+    def find(self, sub, start=0, end=None):
+        """Return lowest offset of sub in [start, end) or -1"""
+
+        return self.data.find(sub, start, self.size if end is None else end)
+
+    def rfind(self, sub, start=0, end=None):
+        """Return highest offset of sub in [start, end) or -1"""
+
+        return self.data.rfind(sub, start, self.size if end is None else end)
+
+    def count(self, sub, start=0, end=None):
+        """Count non-overlapping occurrences of sub in [start, end)"""
+
+        end = self.size if end is None else end
+        found = 0
+        pos = self.data.find(sub, start, end)
+
+        while pos != -1:
+            found += 1
+            pos = self.data.find(sub, pos + len(sub), end)
+
+        return found
+
+    def view(self, start=0, end=None):
+        """Return zero-copy buffer of the bytes in [start, end)"""
+
+        end = self.size if end is None else end
+        return buffer(self.data, start, end - start)
+
+    def read(self, start=0, end=None):
+        """Return bytes in [start, end) as a string"""
+
+        return self.data[start:self.size if end is None else end]
+
+    def lines(self, start=0, end=None):
+        """
+        Yield lines, including line endings, from start up to end
+
+        start must be at the beginning of a line.  The generator can be given
+        straight to csv.reader and offset can be saved after every row to
+        continue reading from there later.
+        """
+
+        data = self.data
+        end = self.size if end is None else end
+        pos = start
+
+        while pos < end:
+            newline = data.find('\n', pos, end)
+            if newline == -1:
+                newline = end - 1
+
+            self.offset = newline + 1
+            yield data[pos:self.offset]
+            pos = self.offset
+
+    def split(self, count, start=0):
+        """
+        Return up to count (start, end) byte ranges covering the file from
+        start, each beginning at a line boundary
+
+        Each range can be handed to a separate worker which maps the file
+        itself and reads its lines().  Records spanning several lines, like
+        quoted newlines in CSV, are not taken into account.
+        """
+
+        chunk_size = max(1, (self.size - start) // max(1, count))
+        ranges = []
+
+        while start < self.size:
+            end = self.find('\n', min(start + chunk_size, self.size) - 1)
+            end = self.size if end == -1 else end + 1
+            ranges.append((start, end))
+            start = end
+
+        return ranges
@@ -0,0 +1,85 @@
+"""
+Fast preview of the first entries of an import
+
+--preview N renders only the first N entries and stops reading the input as
+soon as they are produced, so checking a template change against a huge
+export takes a moment instead of a full run.  The entries are printed to
+stdout, or with --sample written into a new temporary folder that can be
+inspected or copied into Day One.  Nothing is written to the journal,
+checkpoints or any other state.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+from dayonetools import staging
+
+
+def add_arguments(parser):
+    """Add preview related arguments to given argparse parser"""
+
+    parser.add_argument('--preview', default=None, type=int,
+                        dest='preview', required=False, metavar='N',
+                        help=('Only render the first N entries and print them '
+                              'instead of importing'))
+
+    parser.add_argument('--sample', default=False, action='store_true',
+                        dest='sample', required=False,
+                        help=('With --preview write the entries into a new '
+                              'temporary folder instead of printing them'))
+
+
+class Preview(staging.FolderOutput):
+    """
+    Output collecting the first count entries in a temporary folder
+
+    Same interface as the staging outputs plus done() telling when enough
+    entries were written.
+    """
+
+    def __init__(self, count, keep=False):
+        self.count = max(1, count)
+        self.keep = keep
+        self.folder = tempfile.mkdtemp(prefix='dayonetools-preview-')
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, file_name):
+        """Print entry written to file_name unless entries are kept"""
+
+        self.written += 1
+
+        if not self.keep:
+            with open(file_name, 'r') as file_obj:
+                sys.stdout.write(file_obj.read())
+
+        return file_name
+
+    def pending(self):
+        """Number of entries waiting to be moved, always 0"""
+
+        return 0
+
+    def flush(self):
+        """Nothing buffered to write"""
+
+    def done(self):
+        """True once count entries were written"""
+
+        return self.written >= self.count
+
+    def close(self):
+        """Remove the printed entries or tell where the kept ones are"""
+
+        if self.keep:
+            print 'Wrote %d preview entries to %s' % (self.written,
+                                                      self.folder)
+        elif os.path.exists(self.folder):
+            shutil.rmtree(self.folder)
@@ -0,0 +1,136 @@
+"""
+Tolerant parsing with bad records routed to a reject file
+
+By default the first record of an export that can't be parsed aborts the run,
+e.g. a short Sleep Cycle row, a Habit List completion with a broken date or
+an iDoneThis continuation line without a done before it.  With --max-errors
+N up to N such records are skipped, with --rejects FILE without a limit.  A
+run giving up because it found more than N is an error like before, resume
+it with --resume after fixing the export.
+
+Skipped records are appended to the reject file, by default
+'rejects/<service>.rejects' in the state folder.  Every run adds '#key value'
+header lines like a manifest followed by one line per record:
+
+    <location><TAB><reason><TAB><record as JSON>
+
+The location is 'line N' for CSV exports and 'byte N' for JSON ones.  Records
+of an input loaded from --cache were skipped when it was parsed and aren't
+written again.
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+
+from dayonetools.services import get_state_folder
+
+LOG = logging.getLogger(__name__)
+
+SUFFIX = '.rejects'
+
+
+def add_arguments(parser):
+    """Add reject related arguments to given argparse parser"""
+
+    parser.add_argument('--max-errors', default=None, type=int,
+                        dest='max_errors', required=False, metavar='N',
+                        help=('Skip up to N records that can\'t be parsed '
+                              'instead of stopping at the first one'))
+
+    parser.add_argument('--rejects', default=None, action='store',
+                        dest='rejects', required=False, metavar='FILE',
+                        help=('Append skipped records to FILE, default: '
+                              'rejects/<service>%s in the state folder' % (
+                                                                    SUFFIX)))
+
+
+class RejectFile(object):
+    """
+    Reject file of a run skipping up to max_errors bad records, None for no
+    limit
+    """
+
+    def __init__(self, filename, service, max_errors=None):
+        self.filename = filename
+        self.service = service
+        self.max_errors = max_errors
+        self.count = 0
+        self._file = None
+        self._input = None
+
+        # Exports merged with several -f are parsed by several threads
+        self._lock = threading.Lock()
+
+    def _write_header(self, input_file):
+        """Start the records of this run and input_file"""
+
+        if self._file is None:
+            self._file = open(self.filename, 'a')
+            for key, value in (('service', self.service),
+                               ('started',
+                                datetime.datetime.utcnow().isoformat())):
+                self._file.write('#%s %s\n' % (key, value))
+
+        if input_file != self._input:
+            self._input = input_file
+            self._file.write('#input %s\n' % (input_file))
+
+    def add(self, input_file, location, err, record):
+        """
+        Skip bad record at location of input_file which failed with exception
+        err, raises ValueError if that's more than max_errors
+        """
+
+        try:
+            record = json.dumps(record)
+        except UnicodeDecodeError:
+            # Not UTF-8, the bytes are still there escaped
+            record = json.dumps(repr(record))
+
+        with self._lock:
+            self.count += 1
+            self._write_header(input_file)
+            self._file.write('%s\t%s: %s\t%s\n' % (
+                             location, err.__class__.__name__,
+                             str(err).replace('\n', ' '), record))
+            over_budget = (self.max_errors is not None and
+                           self.count > self.max_errors)
+
+        LOG.debug('Skipped %s %s: %s', input_file, location, err)
+
+        if over_budget:
+            self.close()
+            raise ValueError('More than %d bad records, the last at %s %s: '
+                             '%s, see %s' % (self.max_errors, input_file,
+                                             location, err, self.filename))
+
+    def close(self):
+        """Close the reject file and log how many records were skipped"""
+
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._file.close()
+            self._file = None
+
+        LOG.warning('Skipped %d bad records, see %s', self.count,
+                    self.filename)
+
+
+def from_args(args, state_name):
+    """
+    Return RejectFile for the --max-errors and --rejects arguments in args,
+    None if bad records should stop the run
+    """
+
+    if args.get('max_errors') is None and not args.get('rejects'):
+        return None
+
+    filename = args.get('rejects') or os.path.join(get_state_folder('rejects'),
+                                                   state_name + SUFFIX)
+
+    return RejectFile(filename, state_name, args.get('max_errors'))
@@ -0,0 +1,167 @@
+"""
+Undo an import run
+
+    dayonetools rollback --list         recorded runs, newest last
+    dayonetools rollback RUN_ID         undo the given run
+
+Entries the run created are removed and entries it replaced get their prior
+version back.  Only the files listed in the manifest of the run are touched,
+nothing else in the journal is read.  Entries that changed after the run, by
+a later run or by hand, are left alone and reported unless --force is given.
+
+State kept between runs like checkpoints, API cursors, the pedometerpp
+watermark and --upsert indexes isn't rolled back, import again with --full,
+--api-full or without --resume to write the entries anew.
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import shutil
+import sys
+
+from dayonetools import log
+from dayonetools import manifest
+
+LOG = logging.getLogger(__name__)
+
+
+def _parse_args():
+    """Parse sys.argv arguments"""
+
+    parser = argparse.ArgumentParser(description='Undo an import run')
+
+    parser.add_argument('run', nargs='?', default=None, metavar='RUN_ID',
+                        help='Id of the run to undo')
+
+    parser.add_argument('-l', '--list', default=False, action='store_true',
+                        dest='list', required=False,
+                        help='List recorded runs')
+
+    parser.add_argument('-n', '--dry-run', default=False, action='store_true',
+                        dest='dry_run', required=False,
+                        help='Only show what would be done')
+
+    parser.add_argument('--force', default=False, action='store_true',
+                        dest='force', required=False,
+                        help='Also undo entries that changed after the run')
+
+    parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                        dest='verbose', required=False,
+                        help='Verbose debugging information')
+
+    log.add_arguments(parser)
+
+    args = parser.parse_args()
+    if not args.list and args.run is None:
+        parser.error('RUN_ID or --list is required')
+
+    return vars(args)
+
+
+def _list_runs():
+    """Print recorded runs"""
+
+    for run_id in manifest.run_ids():
+        header, entries = manifest.load(run_id)
+        note = ''
+        if 'rolled_back' in header:
+            note = ', rolled back'
+
+        print '%s: %d entries in %s%s' % (run_id, len(entries),
+                                          header.get('destination'), note)
+
+
+def _restore(sha1, path):
+    """Atomically replace path with the kept object sha1"""
+
+    temp_name = path + '.rollback'
+    try:
+        os.link(manifest.object_path(sha1), temp_name)
+    except OSError:
+        shutil.copyfile(manifest.object_path(sha1), temp_name)
+
+    os.rename(temp_name, path)
+
+
+def rollback(run_id, dry_run=False, force=False):
+    """
+    Undo run_id and return (removed, restored, skipped) lists of entry paths
+
+    Raises IOError if there is no such run and ValueError if it was already
+    rolled back.
+    """
+
+    header, entries = manifest.load(run_id)
+    if 'rolled_back' in header:
+        raise ValueError('Run %s was already rolled back %s' % (
+                         run_id, header['rolled_back']))
+
+    # The first prior version of an entry is what it was before the run and
+    # the last checksum what the run left behind.
+    prior = {}
+    written = {}
+    for name, sha1, prior_sha1 in entries:
+        prior.setdefault(name, prior_sha1)
+        written[name] = sha1
+
+    removed, restored, skipped = [], [], []
+
+    for name in sorted(written):
+        path = os.path.join(header['destination'], name)
+
+        current = None
+        if os.path.exists(path):
+            current = manifest.file_checksum(path)
+
+        if current != written[name] and not force:
+            LOG.warning('%s changed after run %s, skipped', path, run_id)
+            skipped.append(path)
+            continue
+
+        if prior[name] == manifest.CREATED:
+            if current is not None and not dry_run:
+                os.remove(path)
+            removed.append(path)
+        else:
+            if not dry_run:
+                _restore(prior[name], path)
+            restored.append(path)
+
+        LOG.debug('%s %s', 'Removed' if prior[name] == manifest.CREATED
+                  else 'Restored', path)
+
+    if not dry_run:
+        manifest.append_header(run_id, 'rolled_back',
+                               datetime.datetime.utcnow().isoformat())
+
+    return removed, restored, skipped
+
+
+def main():
+    args = _parse_args()
+    log.setup(args)
+
+    if args['list']:
+        _list_runs()
+        return
+
+    try:
+        removed, restored, skipped = rollback(args['run'], args['dry_run'],
+                                              args['force'])
+    except IOError:
+        sys.exit('No run %s' % (args['run']))
+    except ValueError as err:
+        sys.exit(str(err))
+
+    print '%s %d, restored %d, skipped %d entries of run %s' % (
+            'Would remove' if args['dry_run'] else 'Removed', len(removed),
+            len(restored), len(skipped), args['run'])
+
+    if skipped:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
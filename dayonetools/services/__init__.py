@@ -2,10 +2,12 @@
 
 """Common services code"""
 
+import errno
+import logging
 import os
 
-AVAILABLE_SERVICES = ['habit_list', 'idonethis', 'nikeplus', 'pedometerpp',
-                      'sleep_cycle']
+AVAILABLE_SERVICES = ['digest', 'habit_list', 'idonethis', 'nikeplus',
+                      'pedometerpp', 'sleep_cycle']
 
 
 def get_service_module(service_name):
@@ -94,6 +96,171 @@ def get_outfolder_names(service, outfolderseed, verbose=False):
     return d1folder, tempfolder
 
 
+def get_state_folder(*parts):
+    """
+    Ensure existence of the dayonetools state folder and return the path
+
+    The state folder keeps data that must survive between runs such as
+    checkpoints.  It defaults to ~/.dayonetools but can be moved with the
+    DAYONETOOLS_HOME environment variable.
+    :param parts: Optional sub folder names below the state folder
+    """
+
+    home = os.environ.get('DAYONETOOLS_HOME',
+                          os.path.expanduser('~/.dayonetools'))
+    folder = os.path.join(home, *parts)
+    if not os.path.exists(folder):
+        try:
+            os.makedirs(folder)
+        except OSError as err:
+            # Created by another thread meanwhile
+            if err.errno != errno.EEXIST:
+                raise
+
+    return folder
+
+
+# Modules of the run wiring below use get_state_folder() from here
+from dayonetools import checkpoint
+from dayonetools import log
+from dayonetools import metrics
+from dayonetools import preview
+from dayonetools import rejects
+from dayonetools import shard
+from dayonetools import staging
+from dayonetools import timeseries
+from dayonetools import upsert
+
+LOG = logging.getLogger(__name__)
+
+
+def journal_folder(args, default):
+    """
+    Return folder to write entries into, './test' in the current directory
+    with -t and default otherwise
+    """
+
+    if not args.get('test'):
+        return default
+
+    directory = './test'
+    try:
+        os.mkdir(directory)
+    except OSError as err:
+        LOG.warning('%s', err)
+
+    return directory
+
+
+class ImportRun(object):
+    """
+    Everything an import run of service writes through, set up from the
+    parsed arguments dict args
+
+    output is the staging output for the journal folder directory, or a
+    preview.Preview with --preview, entries are written with its add_entry()
+    or add_plist().  progress is the checkpoint of source and
+    position what it loaded with --resume, None otherwise.  reject_file,
+    store and index are the rejects.RejectFile, timeseries store and
+    upsert.DayIndex of the run if their options were given.
+
+    Use as a context manager around writing the entries, everything is closed
+    at the end and an exception is counted as error.  The checkpoint of a run
+    is only left behind if it stopped early.
+    """
+
+    def __init__(self, service, args, directory, source):
+        self.service = service
+        self.args = args
+        self.state_name = shard.qualify(service, args.get('shard'))
+        self.preview = bool(args.get('preview'))
+        self.store = None
+        self.index = None
+
+        # A preview must not leave anything behind besides its own entries
+        if self.preview:
+            self.output = preview.Preview(args['preview'], args.get('sample'))
+        else:
+            self.output = staging.get_output(self.state_name, directory, args)
+            self.store = timeseries.open_store(args)
+
+        interval = args.get('checkpoint_every', checkpoint.DEFAULT_INTERVAL)
+        self.progress = checkpoint.Checkpoint(self.state_name, source,
+                                              interval, not self.preview)
+        self.progress.before_flush = self.output.flush
+
+        self.position = None
+        if args.get('resume') and not self.preview:
+            self.position = self.progress.load()
+
+        if args.get('upsert') and not self.preview:
+            self.index = upsert.DayIndex(self.state_name, directory, interval)
+
+        self.reject_file = rejects.from_args(args, self.state_name)
+        self.stats = metrics.get_metrics(self.state_name, args)
+        self.stats.gauge('staging_queue', self.output.pending)
+        self.output.on_written = self.stats.entry_written
+        self.summary = log.RateLimited(
+                        logging.getLogger('%s.%s' % (__name__, service)),
+                        'entries written')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.stats.incr('errors')
+
+        self.close(exc_type is None)
+
+    def entry_uuid(self, key):
+        """
+        Return uuid string for the entry of key, derived from the key in a
+        sharded run and None for a random one otherwise
+        """
+
+        if self.args.get('shard') is None:
+            return None
+
+        return shard.entry_uuid(self.service, key)
+
+    def written(self, position):
+        """
+        Count an entry added to output and mark everything up to position as
+        done
+        """
+
+        self.summary.add()
+        self.progress.commit(position)
+
+    def done(self):
+        """True once a preview has all its entries"""
+
+        return self.preview and self.output.done()
+
+    def close(self, completed=False):
+        """
+        Flush the checkpoint, or remove it if the run completed, and close
+        everything of the run
+        """
+
+        try:
+            self.progress.close(completed)
+            self.output.close()
+        finally:
+            self.stats.close()
+            self.summary.done()
+
+            if self.index is not None:
+                self.index.close()
+
+            if self.store is not None:
+                self.store.close()
+
+            if self.reject_file is not None:
+                self.reject_file.close()
+
+
 # Make all services available from this level
 for service_name in AVAILABLE_SERVICES:
     service = get_service_module(service_name)
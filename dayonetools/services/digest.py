@@ -0,0 +1,268 @@
+"""
+Script to combine the exports of several services into one Day One entry per
+day, e.g.:
+
+    dayonetools digest --sleep-cycle sleep.csv --nikeplus fuel.csv \
+        --habit-list habits.json --idonethis done.csv
+
+Every service reader yields its days in date order, the streams are merged
+with a heap so only the day currently being written is held in memory (besides
+what a reader needs itself, the iDoneThis export is newest first and Habit
+List is organized by habit so both are read completely).  All exports are
+read in a single pass and one entry with a section per service is written for
+every day instead of one entry per service.
+"""
+
+import argparse
+from datetime import datetime
+import heapq
+import itertools
+import logging
+import os
+import re
+import uuid
+
+from dayonetools import checkpoint
+from dayonetools import filters
+from dayonetools import journaldb
+from dayonetools import log
+from dayonetools import metrics
+from dayonetools import preview
+from dayonetools import rejects
+from dayonetools import shard
+from dayonetools import staging
+from dayonetools import templates
+from dayonetools import timeline
+from dayonetools.services import ImportRun
+from dayonetools.services import convert_to_dayone_date_string
+from dayonetools.services import journal_folder
+from dayonetools.services import habit_list
+from dayonetools.services import idonethis
+from dayonetools.services import nikeplus
+from dayonetools.services import sleep_cycle
+
+LOG = logging.getLogger(__name__)
+
+SERVICENAME = 'digest'
+
+DAYONE_ENTRIES = '/Users/durden/Dropbox/Apps/Day One/Journal.dayone/entries/'
+
+# This text will be inserted into the first line of all entries created, set to
+# '' to remove this completely.
+HEADER_FOR_DAYONE_ENTRIES = 'Daily digest'
+
+# Services in the order of their sections in an entry
+DIGEST_SERVICES = (sleep_cycle, nikeplus, habit_list, idonethis)
+
+# Note the strange lack of indentation on the {entry_text} b/c day one will
+# display special formatting to text that is indented, which we want to avoid.
+ENTRY_TEMPLATE = """
+<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+    <key>Creation Date</key>
+    <date>{date}</date>
+    <key>Entry Text</key>
+    <string> {entry_title}
+<![CDATA[
+{sections}]]>
+#digest
+    </string>
+    <key>Starred</key>
+    <false/>
+    <key>Tags</key>
+    <array>
+        <string>digest</string>
+    </array>
+    <key>UUID</key>
+    <string>{uuid_str}</string>
+</dict>
+</plist>
+"""
+
+# ENTRY_TEMPLATE compiled, --template and --title replace it
+TEMPLATE = templates.Template(ENTRY_TEMPLATE, ('date', 'sections', 'uuid_str'),
+                              HEADER_FOR_DAYONE_ENTRIES)
+
+
+def _parse_args():
+    """Parse sys.argv arguments"""
+
+    parser = argparse.ArgumentParser(
+                description=('Export several services as one Day One entry '
+                             'per day'))
+
+    for service in DIGEST_SERVICES:
+        parser.add_argument('--%s' % (service.SERVICENAME.replace('_', '-')),
+                            action='store', dest=service.SERVICENAME,
+                            metavar='FILE', required=False,
+                            help='%s export to include' % (
+                                service.HEADER_FOR_DAYONE_ENTRIES))
+
+    parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                        dest='verbose', required=False,
+                        help='Verbose debugging information')
+
+    parser.add_argument('-t', '--test', default=False, action='store_true',
+                        dest='test', required=False,
+                        help=('Test import by creating Day one files in local '
+                              'directory for inspect'))
+
+    def _datetime(str_):
+        """Convert date string in YYYY-MM-DD format to datetime object"""
+
+        if not str_:
+            return None
+
+        try:
+            date = datetime.strptime(str_, '%Y-%m-%d')
+        except ValueError:
+            msg = 'Invalid date format, should be YYYY-MM-DD'
+            raise argparse.ArgumentTypeError(msg)
+
+        return date
+
+    parser.add_argument('-s', '--since', type=_datetime,
+                        help=('Only process entries starting with YYYY-MM-DD '
+                              'and newer'))
+
+    checkpoint.add_arguments(parser)
+    filters.add_arguments(parser, fields=False)
+    journaldb.add_arguments(parser)
+    log.add_arguments(parser)
+    metrics.add_arguments(parser)
+    preview.add_arguments(parser)
+    rejects.add_arguments(parser)
+    shard.add_arguments(parser)
+    staging.add_arguments(parser)
+    templates.add_arguments(parser)
+    timeline.add_arguments(parser)
+
+    args = vars(parser.parse_args())
+    if not any(args[service.SERVICENAME] for service in DIGEST_SERVICES):
+        parser.error('Give at least one export to include')
+
+    return args
+
+
+def _create_digest_entry(day_str, sections, output, uuid_str=None,
+                         template=TEMPLATE):
+    """
+    Create/write day one file for day_str with given list of (header, text)
+    sections rendered with the templates.Template template into the staging
+    output output and return its name in the journal
+    """
+
+    # Create unique uuid without any specific machine information
+    # (uuid() vs.  uuid()) and strip any '-' characters to be
+    # consistent with dayone format.
+    if uuid_str is None:
+        uuid_str = re.sub('-', '', str(uuid.uuid4()))
+
+    file_name = '%s.doentry' % (uuid_str)
+
+    text = '\n'.join('%s\n%s' % (header, section_text)
+                     for header, section_text in sections)
+
+    entry_name = output.add_entry(file_name, template, {
+        'entry_title': template.title,
+        'date': convert_to_dayone_date_string(day_str),
+        'sections': text, 'uuid_str': uuid_str})
+
+    LOG.debug('Created entry for %s: %s', day_str, file_name)
+
+    return entry_name
+
+
+def _tagged_days(rank, service, days):
+    """
+    Yield (day, rank, header, text) for the (day, text) pairs of service,
+    raise ValueError if the days go back
+    """
+
+    header = service.HEADER_FOR_DAYONE_ENTRIES
+    last_day = None
+
+    for day_str, text in days:
+        if last_day is not None and day_str < last_day:
+            raise ValueError('%s export is not ordered by date at %s' % (
+                             service.SERVICENAME, day_str))
+
+        last_day = day_str
+        yield day_str, rank, header, text
+
+
+def read_days(exports, start_date=None, timeline_file=None,
+              record_filter=None, reject_file=None):
+    """
+    Yield (YYYY-MM-DD, list of (header, text)) for every day of the given
+    exports in date order
+
+    exports maps service names to export files.  The day streams of all
+    services are k-way merged so every day is complete once the next one
+    shows up in all of them.  record_filter, a filters.Filter with --until,
+    is passed on to the readers of the services, so is reject_file, a
+    rejects.RejectFile for the bad records of all exports.
+    """
+
+    streams = []
+    for rank, service in enumerate(DIGEST_SERVICES):
+        filename = exports.get(service.SERVICENAME)
+        if not filename:
+            continue
+
+        if service is habit_list:
+            days = service.read_digest_days(filename, start_date,
+                                            timeline_file, record_filter,
+                                            reject_file)
+        else:
+            days = service.read_digest_days(filename, start_date,
+                                            record_filter, reject_file)
+
+        streams.append(_tagged_days(rank, service, days))
+
+    merged = heapq.merge(*streams)
+    for day_str, sections in itertools.groupby(merged, lambda item: item[0]):
+        yield day_str, [(header, text) for _, _, header, text in sections]
+
+
+def main():
+    args = _parse_args()
+    log.setup(args)
+
+    directory = journal_folder(args, DAYONE_ENTRIES)
+    exports = dict((service.SERVICENAME, args[service.SERVICENAME])
+                   for service in DIGEST_SERVICES
+                   if args[service.SERVICENAME])
+
+    template = templates.from_args(args, TEMPLATE)
+    source = ';'.join('%s=%s' % (name, os.path.abspath(filename))
+                      for name, filename in sorted(exports.items()))
+
+    with ImportRun(SERVICENAME, args, directory, source) as run:
+        last_day = run.position
+
+        # Only --until goes to the readers, days are sharded once the
+        # services are merged
+        for day_str, sections in read_days(exports, args['since'],
+                                           args['timeline'],
+                                           filters.Filter(args['until']),
+                                           run.reject_file):
+            run.stats.incr('records_parsed', len(sections))
+            if last_day and day_str <= last_day:
+                continue
+
+            if not shard.in_shard(args['shard'], day_str):
+                continue
+
+            _create_digest_entry(day_str, sections, run.output,
+                                 run.entry_uuid(day_str), template)
+            run.written(day_str)
+
+            if run.done():
+                break
+
+
+if __name__ == '__main__':
+    main()
@@ -10,14 +10,11 @@ list.  This can be done by the following:
     - Choose the 'Export Data' option
     - E-mail the data to yourself
     - Copy and paste the e-mail contents into a file of your choosing
-        - Remove the 'sent from iPhone' line at the end of your e-mail.  This
-          will cause the script to NOT process the JSON data.
-        - DO NOT REMOVE THE LAST TWO EMPTY LINES OF THE E-MAIL. WE CURRENTLY
-          HAVE A BUG THAT EXPECTS THESE LINES.
-        - You can choose to optionally remove the first few lines of the e-mail
-          that are not JSON data, everything up to the first '[' character.
-        - Again, this is optional because this module will attempt to ignore
-          any non-JSON data at the START of a file.
+        - You can choose to optionally remove the lines of the e-mail that are
+          not JSON data, everything before the first '[' character and after
+          the last ']' character.
+        - Again, this is optional because this module will ignore any non-JSON
+          data at the START and END of a file.
 
 At this point, you are ready to do the actual conversion from JSON to Day One
 entires.  So, you should check all the 'settings' in this module for things you
@@ -35,6 +32,9 @@ would like to change:
           one day and early in the next, etc.
         - You can find a list of available timezone strings here:
             - http://en.wikipedia.org/wiki/List_of_tz_database_time_zones
+        - If you traveled to other timezones pass a timeline file with the
+          periods spent there with --timeline, TIMEZONE is used for all other
+          times.  See dayonetools/timeline.py for the format.
 
 Next, you can run this module with your exported JSON data as an argument like
 so:
@@ -51,15 +51,41 @@ One.
 
 import argparse
 import collections
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
-import os
+import logging
 import re
 import uuid
 
 from dateutil import tz
 
+from dayonetools import cache
+from dayonetools import checkpoint
+from dayonetools import filters
+from dayonetools import inputs
+from dayonetools import journaldb
+from dayonetools import log
+from dayonetools import merge
+from dayonetools import metrics
+from dayonetools import preview
+from dayonetools import rejects
+from dayonetools import shard
+from dayonetools import spill
+from dayonetools import staging
+from dayonetools import templates
+from dayonetools import timeline
+from dayonetools import timeseries
+from dayonetools import upsert
+from dayonetools.services import ImportRun
 from dayonetools.services import convert_to_dayone_date_string
+from dayonetools.services import journal_folder
+
+LOG = logging.getLogger(__name__)
+
+SERVICENAME = 'habit_list'
+
+# Bump whenever the completions produced by _read_local_completions change
+PARSER_VERSION = 2
 
 DAYONE_ENTRIES = '/Users/durden/Dropbox/Apps/Day One/Journal.dayone/entries/'
 
@@ -95,6 +121,10 @@ ENTRY_TEMPLATE = """
 </plist>
 """
 
+# ENTRY_TEMPLATE compiled, --template and --title replace it
+TEMPLATE = templates.Template(ENTRY_TEMPLATE, ('habits', 'date', 'uuid_str'),
+                              HEADER_FOR_DAYONE_ENTRIES)
+
 TIMEZONE = 'America/Chicago'
 
 
@@ -104,9 +134,12 @@ def _parse_args():
     parser = argparse.ArgumentParser(
                                description='Export Habit List data to Day One')
 
-    parser.add_argument('-f', '--file', action='store',
-                        dest='input_file', required=True,
-                        help='JSON file to import from')
+    parser.add_argument('-f', '--file', action='store', nargs='+',
+                        dest='input_files', required=True, metavar='FILE',
+                        help=('JSON files to import from, can be compressed '
+                              '(.gz, .bz2, .xz, .zip[:member]) or - for '
+                              'stdin.  Several exports are merged without '
+                              'duplicates'))
 
     parser.add_argument('-v', '--verbose', default=False, action='store_true',
                         dest='verbose', required=False,
@@ -135,7 +168,26 @@ def _parse_args():
                         help=('Only process entries starting with YYYY-MM-DD '
                               'and newer'))
 
-    return vars(parser.parse_args())
+    cache.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    filters.add_arguments(parser)
+    journaldb.add_arguments(parser)
+    log.add_arguments(parser)
+    metrics.add_arguments(parser)
+    preview.add_arguments(parser)
+    rejects.add_arguments(parser)
+    shard.add_arguments(parser)
+    spill.add_arguments(parser)
+    staging.add_arguments(parser)
+    templates.add_arguments(parser)
+    timeline.add_arguments(parser)
+    timeseries.add_arguments(parser)
+    upsert.add_arguments(parser)
+
+    args = vars(parser.parse_args())
+    filters.check_fields(parser, args, ('name',))
+
+    return args
 
 
 def _user_time_zone():
@@ -144,34 +196,16 @@ def _user_time_zone():
     try:
         return tz.gettz(TIMEZONE)
     except Exception as err:
-        print 'Failed getting timezone, check your TIMEZONE variable'
+        LOG.error('Failed getting timezone, check your TIMEZONE variable')
         raise
 
 
-def _user_time_zone_date(dt, user_time_zone, utc_time_zone):
-    """
-    Convert given datetime string into a yyyy-mm-dd string taking into
-    account the user time zone
-
-    Keep in mind that this conversion might change the actual day if the
-    habit was entered 'early' or 'late' in the day.  This is correct because
-    the user entered the habit in their own timezone, but the app stores this
-    internally (and exports) in utc.  So, here we are effectively converting
-    the time back to when the user actually entered it, based on the timezone
-    the user claims they were in.
-    """
+def _utc_datetime(dt):
+    """Convert given datetime string from habit list to naive UTC datetime"""
 
     # We know habit list stores in UTC so don't need the timezone info
     dt = dt.split('+')[0].strip()
-    dtime_obj = datetime.strptime(dt, '%Y-%m-%d %H:%M:%S')
-
-    # Tell native datetime object we are using UTC, then we need to convert
-    # that UTC time into the user's timezone BEFORE stripping off the time
-    # to make sure the year, month, and date take into account timezone
-    # differences.
-
-    utc = dtime_obj.replace(tzinfo=utc_time_zone)
-    return utc.astimezone(user_time_zone)
+    return datetime.strptime(dt, '%Y-%m-%d %H:%M:%S')
 
 
 def _habits_to_markdown(habits):
@@ -188,97 +222,511 @@ def _habits_to_markdown(habits):
 
 
 
-def create_habitlist_entry(directory, day_str, habits, verbose):
-    """Create day one file entry for given habits, date pair"""
+def create_habitlist_entry(output, day_str, habits, uuid_str=None,
+                           template=TEMPLATE):
+    """
+    Create day one file entry for given habits, date pair rendered with the
+    templates.Template template into the staging output output and return
+    its name in the journal
+
+    An existing entry is rewritten if its uuid_str is given.
+    """
 
     # Create unique uuid without any specific machine information
     # (uuid() vs.  uuid()) and strip any '-' characters to be
     # consistent with dayone format.
-    uuid_str = re.sub('-', '', str(uuid.uuid4()))
+    if uuid_str is None:
+        uuid_str = re.sub('-', '', str(uuid.uuid4()))
 
     file_name = '%s.doentry' % (uuid_str)
-    full_file_name = os.path.join(directory, file_name)
 
     date = convert_to_dayone_date_string(day_str)
     habits = _habits_to_markdown(habits)
 
-    entry = {'entry_title': HEADER_FOR_DAYONE_ENTRIES,
+    entry = {'entry_title': template.title,
               'habits': habits,'date': date, 'uuid_str': uuid_str}
 
-    with open(full_file_name, 'w') as file_obj:
-        text = ENTRY_TEMPLATE.format(**entry)
-        file_obj.write(text)
+    entry_name = output.add_entry(file_name, template, entry)
 
-    if verbose:
-        print 'Created entry for %s: %s' % (date, file_name)
+    LOG.debug('Created entry for %s: %s', date, file_name)
 
+    return entry_name
 
-def parse_habits_file(filename, start_date=None):
+
+def _merge_habits(index, day_str, habits):
     """
-    Parse habits json file and return dict of data organized by day
+    Merge habits of day_str with the ones already written according to the
+    upsert index
+
+    Returns (uuid_str, habits, items) where uuid_str is None for a new day and
+    habits is None if there is nothing new to write.
+    """
+
+    items = sorted([name, dt_obj.strftime('%Y-%m-%d %H:%M:%S')]
+                   for name, dt_obj in habits)
+    uuid_str, items = index.merge(day_str, items)
+    if items is None:
+        return uuid_str, None, None
+
+    # Only hours and minutes of the already written habits are needed
+    habits = [(name, datetime.strptime(dt, '%Y-%m-%d %H:%M:%S'))
+              for name, dt in sorted(items, key=lambda item: item[1])]
+
+    return uuid_str, habits, items
+
+
+def _filenames(filename):
+    """Return list of the file names given as one or a list of them"""
+
+    if isinstance(filename, basestring):
+        return [filename]
+
+    return list(filename)
+
+
+def _completion_key(completion):
+    """Return key of (habit name, datetime) for merging exports"""
+
+    name, dt_obj = completion
+    return u'%s|%s' % (name, dt_obj.isoformat())
+
+
+def parse_habits_file(filename, start_date=None, use_cache=False,
+                      user_timeline=None, max_memory=None, record_filter=None,
+                      reject_file=None):
+    """
+    Parse habits json file and return spill.Partitions of (habit name,
+    datetime) organized by day
+
+    filename can also be a list of several exports, they are read by a
+    thread each and every completion is only returned once.
 
     start_date can be a datetime object used only to return habits that were
     started on or after start_date
+
+    if use_cache is True the converted completions are loaded from/stored in
+    the parsed input cache.
+
+    user_timeline is the timeline.Timeline of the timezones the user was in,
+    by default TIMEZONE is used for everything.
+
+    Days beyond max_memory bytes are spilled to a temporary file, close the
+    returned partitions when done with them.
+
+    Only habits passing record_filter, a filters.Filter, on days of its shard
+    are returned if given.  Bad habits and completions raise ValueError,
+    KeyError or TypeError or are skipped into reject_file, a
+    rejects.RejectFile, if given.
     """
 
-    with open(filename, 'r') as file_obj:
-        # FIXME: This expects 3 lines of junk at the beginning of the file, but
-        # we could just read until we find '[' and ignore up until that point.
-        junk = file_obj.readline()
-        junk = file_obj.readline()
-        junk = file_obj.readline()
+    if user_timeline is None:
+        user_timeline = timeline.Timeline(TIMEZONE)
 
-        # FIXME: For my sample this is about 27kb of memory
-        _json = file_obj.read()
+    if record_filter is None:
+        record_filter = filters.Filter()
 
-    # FIXME: Downside here is that we assume the user was in the same timezone
-    # for every habit.  However, it's possible that some of the habits were
-    # entered while the user was traveling in a different timezone, etc.
-    iphone_time_zone = _user_time_zone()
-    utc_time_zone = tz.gettz('UTC')
+    keep = record_filter.row_predicate(('name',))
 
-    # Use a set b/c we can only do each habit once a day
-    habits = collections.defaultdict(set)
+    def _completions(filename):
+        """Return iterable of (habit name, datetime) in filename"""
+
+        if use_cache:
+            # Completions skipped in tolerant mode are missing from the cache
+            settings = {'timeline': user_timeline.digest}
+            if reject_file is not None:
+                settings['tolerant'] = True
 
-    # FIXME: Maybe optimize this to not hold it all in memory
+            completions = cache.cached_records(
+                SERVICENAME, filename, PARSER_VERSION, settings,
+                lambda filename: _read_local_completions(filename,
+                                                         user_timeline,
+                                                         reject_file))
+
+            # Cache only holds naive local times, attaching the zone again is
+            # much cheaper than parsing and converting from UTC.
+            return ((name, dt_obj.replace(tzinfo=user_timeline.tz(zone)))
+                    for name, dt_obj, zone in completions
+                    if keep is None or keep((name,)))
+
+        return ((name, dt_obj) for name, dt_obj, _ in
+                _read_completions(filename, user_timeline, keep,
+                                  _utc_days(start_date, record_filter.until),
+                                  reject_file))
+
+    filenames = _filenames(filename)
+    if len(filenames) == 1:
+        completions = _completions(filenames[0])
+    else:
+        # Exports are organized by habit, not date, so there is no order to
+        # merge them in
+        completions = merge.unique(merge.merged(filenames, _completions),
+                                   _completion_key, max_memory)
+
+    # Unique b/c we can only do each habit once a day
+    habits = spill.Partitions(max_memory, unique=True)
 
     # We have to parse all json and return it b/c the data is organized by
     # habit and we need it organized by date. So, we can't use a generator or
     # anything to yield values as they come b/c we won't know if we've parsed
-    # the entire day until all JSON is parsed.
+    # the entire day until all JSON is parsed.  With a memory budget days
+    # seen so far are spilled to disk and merged back in date order.
+    for name, dt_obj in completions:
+        if start_date is not None and dt_obj < start_date:
+            continue
+
+        # Habits will be organized by day then each one will have it's own
+        # time.
+        day_str = dt_obj.strftime('%Y-%m-%d')
+        if record_filter.day_ok(day_str) and record_filter.shard_ok(day_str):
+            habits.add(day_str, (name, dt_obj))
+
+    return habits
+
+
+def parse_first_days(filename, count, start_date=None, user_timeline=None,
+                     record_filter=None, reject_file=None):
+    """
+    Parse habits json file and return dict like parse_habits_file() but with
+    only the first count days
+
+    Completions of every habit are converted in time order and only until
+    count days of that habit were seen, that is enough to know the first
+    count days overall.  The JSON itself still has to be decoded completely.
+    filename can also be a list of several exports which are merged.
+    """
+
+    if user_timeline is None:
+        user_timeline = timeline.Timeline(TIMEZONE)
+
+    if record_filter is None:
+        record_filter = filters.Filter()
+
+    habits = collections.defaultdict(set)
+
+    # The first count days of every export include the first count days of
+    # all of them, the sets drop completions seen in several exports
+    for name in _filenames(filename):
+        _add_first_days(habits, name, count, start_date, user_timeline,
+                        record_filter, reject_file)
+
+    return dict((day_str, habits[day_str])
+                for day_str in sorted(habits)[:count])
+
+
+def _add_first_days(habits, filename, count, start_date, user_timeline,
+                    record_filter, reject_file):
+    """
+    Add (habit name, datetime) of the first count days in habits json file
+    to the sets of their days in dict habits
+    """
+
+    keep = record_filter.row_predicate(('name',))
+    json_start, json_text, loaded = _load_habits(filename, reject_file)
+
+    for index, habit in enumerate(loaded, 1):
+        try:
+            name = habit['name']
+            if keep is not None and not keep((name,)):
+                continue
+
+            completed = sorted(habit['completed'])
+        except (KeyError, TypeError) as err:
+            if reject_file is None:
+                raise
+
+            reject_file.add(filename, 'habit %d' % (index), err, habit)
+            continue
+
+        days = set()
+
+        # All completions are UTC with the same format, so string order is
+        # time order.
+        for dt in completed:
+            try:
+                utc_dt = _utc_datetime(dt)
+            except (AttributeError, ValueError) as err:
+                if reject_file is None:
+                    raise
+
+                reject_file.add(filename,
+                                _locate(json_start, json_text, name, dt),
+                                err, dt)
+                continue
+
+            [(_, dt_obj)] = user_timeline.convert([utc_dt])
+            if start_date is not None and dt_obj < start_date:
+                continue
+
+            day_str = dt_obj.strftime('%Y-%m-%d')
+            if not record_filter.day_ok(day_str):
+                break
+
+            if not record_filter.shard_ok(day_str):
+                continue
+
+            if day_str not in days and len(days) == count:
+                break
+
+            days.add(day_str)
+            habits[day_str].add((name, dt_obj))
+
+
+def _load_habits(filename, reject_file=None):
+    """
+    Return (file offset of the JSON, JSON text, list of habit dicts) decoded
+    from habits json file
+
+    The text is only kept for _locate() if there is a reject_file, it's None
+    otherwise.
+    """
+
+    with inputs.open_input(filename) as mapped:
+        # Ignore everything around the JSON list like the e-mail text before
+        # it or a 'sent from iPhone' line after it.
+        start = mapped.find('[')
+        _json = mapped.read(start, mapped.rfind(']') + 1)
 
     # FIXME: Should have something to catch ValueError exceptions around this
     # so we can show the line with the error if something is wrong.
-    for habit in json.loads(_json):
-        name = habit['name']
+    habits = json.loads(_json)
 
-        for dt in habit['completed']:
-            dt_obj = _user_time_zone_date(dt, iphone_time_zone, utc_time_zone)
-            if start_date is None or dt_obj >= start_date:
-                # Habits will be organized by day then each one will have it's
-                # own time.
-                day_str = dt_obj.strftime('%Y-%m-%d')
-                habits[day_str].add((name, dt_obj))
+    if reject_file is None:
+        return start, None, habits
 
-    return habits
+    return start, _json, habits
 
 
-def main():
-    args = _parse_args()
+def _locate(json_start, json_text, name, value):
+    """
+    Return 'byte N' location of value in the habit named name, json_start
+    being the file offset of json_text
+    """
+
+    # Only done for rejected values, so searching is fine.  The value can
+    # come before the name in the habit or the name have escapes, the first
+    # one anywhere is taken then.
+    value = json.dumps(value)
+    pos = json_text.find(value, max(json_text.find(json.dumps(name)), 0))
+    if pos == -1:
+        pos = json_text.find(value)
+    if pos == -1:
+        return 'habit %s' % (json.dumps(name))
+
+    return 'byte %d' % (json_start + pos)
+
+
+def _utc_days(start_date=None, until=None):
+    """
+    Return (first, last) UTC days as 'YYYY-MM-DD' strings that completions
+    on or after start_date and up to the day until can have, None for no
+    limit
+    """
+
+    # No timezone is a whole day away from UTC, the exact check is done after
+    # the conversion.
+    first = last = None
+    if start_date is not None:
+        first = (start_date.date() - timedelta(days=1)).strftime('%Y-%m-%d')
+    if until is not None:
+        last = (datetime.strptime(until, '%Y-%m-%d') +
+                timedelta(days=1)).strftime('%Y-%m-%d')
+
+    return first, last
+
+
+def _read_completions(filename, user_timeline, keep=None, utc_days=None,
+                      reject_file=None):
+    """
+    Read habits json file and yield (habit name, datetime, zone name) for
+    every completion converted to the timezone the user was in
+
+    Habits whose (name,) doesn't pass keep are skipped without looking at
+    their completions, and completions outside the (first, last) UTC days of
+    utc_days are dropped before they are parsed.  Bad habits and completions
+    are skipped into reject_file if given.
 
-    if args['test']:
-        directory = './test'
+    Keep in mind that this conversion might change the actual day if the
+    habit was entered 'early' or 'late' in the day.  This is correct because
+    the user entered the habit in their own timezone, but the app stores this
+    internally (and exports) in utc.  So, here we are effectively converting
+    the time back to when the user actually entered it, based on the timezone
+    the user claims they were in.
+    """
+
+    first, last = utc_days or (None, None)
+    json_start, json_text, habits = _load_habits(filename, reject_file)
+
+    for index, habit in enumerate(habits, 1):
         try:
-            os.mkdir(directory)
-        except OSError as err:
-            print 'Warning: %s' % (err)
-    else:
-        directory = DAYONE_ENTRIES
+            name = habit['name']
+            if keep is not None and not keep((name,)):
+                continue
+
+            # Completions start with their UTC day, so that's compared as
+            # string
+            completed = habit['completed']
+            if first is not None:
+                completed = [dt for dt in completed if dt[:10] >= first]
+            if last is not None:
+                completed = [dt for dt in completed if dt[:10] <= last]
+        except (KeyError, TypeError) as err:
+            if reject_file is None:
+                raise
+
+            reject_file.add(filename, 'habit %d' % (index), err, habit)
+            continue
+
+        # Convert all completions of a habit in one batch so the timezone
+        # is only looked up when crossing into another timeline period.
+        if reject_file is None:
+            utc_dts = [_utc_datetime(dt) for dt in completed]
+        else:
+            utc_dts = []
+            for dt in completed:
+                try:
+                    utc_dts.append(_utc_datetime(dt))
+                except (AttributeError, ValueError) as err:
+                    reject_file.add(filename,
+                                    _locate(json_start, json_text, name, dt),
+                                    err, dt)
+
+        for zone, dt_obj in user_timeline.convert(utc_dts):
+            yield name, dt_obj, zone
+
+
+def _read_local_completions(filename, user_timeline, reject_file=None):
+    """
+    Read habits json file and yield (habit name, naive datetime, zone name) in
+    the user timezone for the parsed input cache
+    """
+
+    for name, dt_obj, zone in _read_completions(filename, user_timeline,
+                                                reject_file=reject_file):
+        yield name, dt_obj.replace(tzinfo=None), zone
 
-    habits = parse_habits_file(args['input_file'], args['since'])
 
-    for day_str, days_habits in habits.iteritems():
-        create_habitlist_entry(directory, day_str, days_habits, args['verbose'])
+def import_entries(filename, directory, start_date=None, timeline_file=None,
+                   record_filter=None, template=TEMPLATE, reject_file=None):
+    """
+    Write an entry for every day in filename into directory and yield the
+    file names, used by dayonetools.api
+
+    The whole file is parsed before the first entry is written.
+    """
+
+    output = staging.DirectOutput(directory)
+    user_timeline = timeline.Timeline.load(timeline_file, TIMEZONE)
+    with parse_habits_file(filename, start_date,
+                           user_timeline=user_timeline,
+                           record_filter=record_filter,
+                           reject_file=reject_file) as habits:
+        for day_str, days_habits in habits.items():
+            yield create_habitlist_entry(output, day_str, days_habits,
+                                         template=template)
+
+
+def read_digest_days(filename, start_date=None, timeline_file=None,
+                     record_filter=None, reject_file=None):
+    """
+    Yield (YYYY-MM-DD, digest text) for every day in filename, oldest first
+
+    start_date can be naive, it's taken to be in TIMEZONE then.
+    """
+
+    user_timeline = timeline.Timeline.load(timeline_file, TIMEZONE)
+    if start_date is not None and start_date.tzinfo is None:
+        start_date = start_date.replace(tzinfo=user_timeline.tz(TIMEZONE))
+
+    with parse_habits_file(filename, start_date,
+                           user_timeline=user_timeline,
+                           record_filter=record_filter,
+                           reject_file=reject_file) as habits:
+        for day_str, days_habits in habits.items():
+            yield day_str, _habits_to_markdown(sorted(
+                                                days_habits,
+                                                key=lambda habit: habit[1]))
+
+
+def _preview(args):
+    """Print or keep the first days of the input for inspection"""
+
+    user_timeline = timeline.Timeline.load(args['timeline'], TIMEZONE)
+    reject_file = rejects.from_args(args, SERVICENAME)
+    habits = parse_first_days(args['input_files'], args['preview'],
+                              args['since'], user_timeline,
+                              filters.Filter.from_args(args), reject_file)
+    template = templates.from_args(args, TEMPLATE)
+
+    if reject_file is not None:
+        reject_file.close()
+
+    with preview.Preview(args['preview'], args['sample']) as entries:
+        for day_str in sorted(habits):
+            create_habitlist_entry(entries, day_str, habits[day_str],
+                                   template=template)
+
+
+def main():
+    args = _parse_args()
+    log.setup(args)
+
+    if args['preview']:
+        _preview(args)
+        return
+
+    directory = journal_folder(args, DAYONE_ENTRIES)
+    template = templates.from_args(args, TEMPLATE)
+    user_timeline = timeline.Timeline.load(args['timeline'], TIMEZONE)
+
+    with ImportRun(SERVICENAME, args, directory,
+                   merge.source(args['input_files'])) as run:
+        last_day = run.position
+        reject_file = run.reject_file
+
+        with parse_habits_file(args['input_files'], args['since'],
+                               args['cache'], user_timeline,
+                               args['max_memory'],
+                               filters.Filter.from_args(args),
+                               reject_file) as habits:
+            # Everything was parsed already
+            if reject_file is not None:
+                reject_file.close()
+
+            # items() returns days in order so the last day written is a
+            # valid checkpoint
+            days = set(day_str for day_str in habits
+                       if not last_day or day_str > last_day)
+
+            run.stats.set('records_parsed', habits.count)
+            run.stats.set_total(len(days))
+
+            for day_str, all_habits in habits.items():
+                if day_str not in days:
+                    continue
+
+                uuid_str, days_habits = None, all_habits
+                if run.index is not None:
+                    uuid_str, days_habits, items = _merge_habits(
+                                            run.index, day_str, days_habits)
+                    if days_habits is None:
+                        continue
+
+                if uuid_str is None:
+                    uuid_str = run.entry_uuid(day_str)
+
+                file_name = create_habitlist_entry(run.output, day_str,
+                                                   days_habits, uuid_str,
+                                                   template)
+                if run.index is not None:
+                    run.index.put(day_str, file_name, items)
+
+                run.written(day_str)
+
+                if run.store is not None:
+                    for name, dt_obj in all_habits:
+                        run.store.add(SERVICENAME,
+                                      dt_obj.strftime('%Y-%m-%d %H:%M:%S'),
+                                      name)
 
 
 if __name__ == '__main__':
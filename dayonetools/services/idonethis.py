@@ -23,16 +23,44 @@ application on your full Day One directory.
 You can find all your imported idonethis entries after pushing the Day One by
 searching in Day One for the #idonethis tag.  All imported entries will have
 this tag.
+
+Instead of an export the dones can also be read from the iDoneThis web API
+with --api URL, see dayonetools.webapi.
 """
 
 import argparse
 import csv
 from datetime import datetime
-import os
+import itertools
+import logging
 import re
 import uuid
 
+from dayonetools import cache
+from dayonetools import checkpoint
+from dayonetools import filters
+from dayonetools import inputs
+from dayonetools import journaldb
+from dayonetools import log
+from dayonetools import merge
+from dayonetools import metrics
+from dayonetools import preview
+from dayonetools import rejects
+from dayonetools import shard
+from dayonetools import staging
+from dayonetools import templates
+from dayonetools import upsert
+from dayonetools import webapi
+from dayonetools.services import ImportRun
 from dayonetools.services import convert_to_dayone_date_string
+from dayonetools.services import journal_folder
+
+LOG = logging.getLogger(__name__)
+
+SERVICENAME = 'idonethis'
+
+# Bump whenever the days produced by _read_days change
+PARSER_VERSION = 1
 
 DAYONE_ENTRIES = '/Users/durden/Dropbox/Apps/Day One/Journal.dayone/entries/'
 
@@ -72,6 +100,11 @@ ENTRY_TEMPLATE = """
 </plist>
 """
 
+# ENTRY_TEMPLATE compiled, --template and --title replace it
+TEMPLATE = templates.Template(ENTRY_TEMPLATE,
+                              ('date', 'entry_text', 'uuid_str'),
+                              HEADER_FOR_DAYONE_ENTRIES)
+
 
 def _parse_args():
     """Parse sys.argv arguments"""
@@ -79,9 +112,13 @@ def _parse_args():
     parser = argparse.ArgumentParser(
                                 description='Export iDonethis data to Day One')
 
-    parser.add_argument('-f', '--file', action='store',
-                        dest='input_file', required=True,
-                        help='CSV file to import from')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-f', '--file', action='store', nargs='+',
+                        dest='input_files', metavar='FILE',
+                        help=('CSV files to import from, can be compressed '
+                              '(.gz, .bz2, .xz, .zip[:member]) or - for '
+                              'stdin.  Several exports are merged without '
+                              'duplicates'))
 
     parser.add_argument('-v', '--verbose', default=False, action='store_true',
                         dest='verbose', required=False,
@@ -109,31 +146,55 @@ def _parse_args():
                         help=('Test import by creating Day one files in local '
                              'directory for inspect'))
 
-    return vars(parser.parse_args())
+    cache.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    filters.add_arguments(parser, tags=True)
+    journaldb.add_arguments(parser)
+    log.add_arguments(parser)
+    metrics.add_arguments(parser)
+    preview.add_arguments(parser)
+    rejects.add_arguments(parser)
+    shard.add_arguments(parser)
+    staging.add_arguments(parser)
+    templates.add_arguments(parser)
+    upsert.add_arguments(parser)
+    webapi.add_arguments(parser, source)
+
+    args = vars(parser.parse_args())
+    filters.check_fields(parser, args, ('date', 'text'))
+
+    return args
 
 
-def _create_dayone_entry(date, entries, directory, verbose):
-    """Create single dayone journal entry for list of given entries"""
+def _create_dayone_entry(date, entries, output, uuid_str=None,
+                         template=TEMPLATE):
+    """
+    Create single dayone journal entry for list of given entries rendered with
+    the templates.Template template into the staging output output and
+    return its name in the journal
+
+    An existing entry is rewritten if its uuid_str is given.
+    """
 
     entry_text = '\n'.join(entries)
     date = convert_to_dayone_date_string(date)
 
     # Create unique uuid without any specific machine information (uuid() vs.
     # uuid()) and strip any '-' characters to be consistent with dayone format.
-    uuid_str = re.sub('-', '', str(uuid.uuid4()))
+    if uuid_str is None:
+        uuid_str = re.sub('-', '', str(uuid.uuid4()))
 
     file_name = '%s.doentry' % (uuid_str)
-    full_file_name = os.path.join(directory, file_name)
 
-    with open(full_file_name, 'w') as file_obj:
-        text = ENTRY_TEMPLATE.format(entry_title=HEADER_FOR_DAYONE_ENTRIES,
-                                     date=date,
-                                     entry_text=entry_text,
-                                     uuid_str=uuid_str)
-        file_obj.write(text)
+    entry_name = output.add_entry(file_name, template,
+                                  {'entry_title': template.title,
+                                   'date': date,
+                                   'entry_text': entry_text,
+                                   'uuid_str': uuid_str})
+
+    LOG.debug('Created entry for %s: %s', date, file_name)
 
-    if verbose:
-        print 'Created entry for %s: %s' % (date, file_name)
+    return entry_name
 
 
 def _sanitize_entry_text(entry_lines, strip_quotes):
@@ -150,7 +211,30 @@ def _sanitize_entry_text(entry_lines, strip_quotes):
     return entry_text
 
 
-def read_entries_by_day(filename, start_date=None):
+def _filter_days(days, record_filter):
+    """
+    Yield (date, list of entries for day) of days with only the entries
+    passing record_filter, days left without any or of another shard are
+    dropped
+    """
+
+    # Dones only have their day and text to filter on
+    keep = record_filter.row_predicate(('date', 'text'))
+
+    for curr_date, entries in days:
+        if not (record_filter.day_ok(curr_date) and
+                record_filter.shard_ok(curr_date)):
+            continue
+
+        if keep is not None:
+            entries = [entry for entry in entries if keep((curr_date, entry))]
+
+        if entries:
+            yield curr_date, entries
+
+
+def read_entries_by_day(filename, start_date=None, use_cache=False,
+                        record_filter=None, reject_file=None):
     """
     Parse given CSV file of idonethis entries and yield tuple containting the
     following:
@@ -160,25 +244,81 @@ def read_entries_by_day(filename, start_date=None):
 
     if start_date is provided as a datetime object then only days starting on
     or after the start_date will be returned.
+
+    if use_cache is True the parsed days are loaded from/stored in the parsed
+    input cache.
+
+    Only entries passing record_filter, a filters.Filter, are returned if
+    given.  Lines that can't be parsed raise IndexError or are skipped into
+    reject_file, a rejects.RejectFile, if given.
     """
 
-    with open(filename, 'r') as file_obj:
-        current_day_entries = []
-        curr_date = None
-        date_re = re.compile('^\d{4}-\d{2}-\d{2}$')
+    if record_filter is not None:
+        for day in _filter_days(read_entries_by_day(filename, start_date,
+                                                    use_cache,
+                                                    reject_file=reject_file),
+                                record_filter):
+            yield day
 
-        for row in csv.reader(file_obj):
-            # If line doesn't start with a date assume it's just another line
-            # in the current entry we are accumulating.
-            new_date = row[0]
-            if not date_re.match(new_date):
-                entry_text = _sanitize_entry_text(row[1:], STRIP_QUOTES)
+        return
 
-                if not current_day_entries:
-                    raise IndexError(
-                        'No current entries to add to, possibly invalid file')
+    if not use_cache:
+        for day in _read_days(filename, start_date, reject_file):
+            yield day
 
-                current_day_entries.append(entry_text)
+        return
+
+    # Lines skipped in tolerant mode are missing from the cached days
+    settings = {'strip_quotes': STRIP_QUOTES}
+    if reject_file is not None:
+        settings['tolerant'] = True
+
+    days = cache.cached_records(
+                    SERVICENAME, filename, PARSER_VERSION, settings,
+                    lambda filename: _read_days(filename,
+                                                reject_file=reject_file))
+
+    since = start_date and start_date.strftime('%Y-%m-%d')
+    for curr_date, entries in days:
+        # Days are in decreasing order, same as in the export
+        if since and curr_date < since:
+            break
+
+        yield curr_date, entries
+
+
+def _read_days(filename, start_date=None, reject_file=None):
+    """
+    Read CSV file and yield (date, list of entries for day), bad lines are
+    skipped into reject_file if given
+    """
+
+    with inputs.open_input(filename) as mapped:
+        current_day_entries = []
+        curr_date = None
+        date_re = re.compile('^\d{4}-\d{2}-\d{2}$')
+        csv_reader = csv.reader(mapped.lines())
+
+        for row in csv_reader:
+            try:
+                # If line doesn't start with a date assume it's just another
+                # line in the current entry we are accumulating.
+                new_date = row[0]
+                if not date_re.match(new_date):
+                    entry_text = _sanitize_entry_text(row[1:], STRIP_QUOTES)
+
+                    if not current_day_entries:
+                        raise IndexError('No current entries to add to, '
+                                         'possibly invalid file')
+
+                    current_day_entries.append(entry_text)
+                    continue
+            except IndexError as err:
+                if reject_file is None:
+                    raise
+
+                reject_file.add(filename, 'line %d' % (csv_reader.line_num),
+                                err, row)
                 continue
 
             entry_text = _sanitize_entry_text(row[1:], STRIP_QUOTES)
@@ -205,23 +345,232 @@ def read_entries_by_day(filename, start_date=None):
             yield (curr_date, current_day_entries)
 
 
+def read_api_days(url, token=None, start_date=None,
+                  concurrency=webapi.DEFAULT_CONCURRENCY):
+    """
+    Read dones from the iDoneThis API at url and yield tuple containing the
+    following, newest first just like read_entries_by_day:
+        (date, list of entries for day)
+
+    if start_date is provided as a datetime object then only days starting on
+    or after the start_date will be returned.
+    """
+
+    since = start_date and start_date.strftime('%Y-%m-%d')
+    pool = webapi.ConnectionPool(url, concurrency, token, auth_scheme='Token')
+
+    def _page_path(page):
+        """Path of given page counting from 0"""
+
+        path = '/dones/?page=%d&page_size=%d&order_by=-done_date' % (
+                                                    page + 1, webapi.PAGE_SIZE)
+        if since:
+            path += '&done_date_after=%s' % (since)
+
+        return path
+
+    try:
+        dones = webapi.iter_pages(pool, _page_path,
+                                  lambda body: body.get('results', []),
+                                  concurrency)
+
+        by_date = lambda done: done['done_date']
+        for curr_date, day in itertools.groupby(dones, by_date):
+            curr_date = curr_date.encode('utf-8')
+            if since and curr_date < since:
+                break
+
+            yield curr_date, [
+                    _sanitize_entry_text([done['raw_text'].encode('utf-8')],
+                                         STRIP_QUOTES)
+                    for done in day]
+    finally:
+        pool.close()
+
+
+def _merge_days(days):
+    """
+    Yield (date, list of entries for day) with the entries of all days of the
+    same date in days, every done only once
+
+    A done is the same as one of another export if it has the same text on
+    that day, a text done twice in one export is kept twice.  Days are
+    merged one at a time so only the dones of a day are remembered.
+    """
+
+    duplicates = 0
+
+    for curr_date, same_days in itertools.groupby(days, lambda day: day[0]):
+        seen = set()
+        merged = []
+
+        for _, entries in same_days:
+            occurrences = {}
+            for entry in entries:
+                occurrences[entry] = occurrences.get(entry, 0) + 1
+                key = (occurrences[entry], entry)
+                if key in seen:
+                    duplicates += 1
+                    continue
+
+                seen.add(key)
+                merged.append(entry)
+
+        yield curr_date, merged
+
+    LOG.info('Skipped %d duplicate dones', duplicates)
+
+
+def _read_files(args, record_filter, reject_file):
+    """
+    Yield (date, list of entries for day) from the files given in args,
+    several exports are merged newest day first without duplicates
+    """
+
+    filenames = args['input_files']
+
+    if len(filenames) == 1:
+        return read_entries_by_day(filenames[0], args['since'],
+                                   args['cache'], record_filter, reject_file)
+
+    return _merge_days(merge.merged(
+                    filenames,
+                    lambda filename: read_entries_by_day(filename,
+                                                         args['since'],
+                                                         args['cache'],
+                                                         record_filter,
+                                                         reject_file),
+                    lambda day: day[0], reverse=True))
+
+
+def _read_source(args, cursor=None, reject_file=None):
+    """
+    Yield (date, list of entries for day) from the files or API given in args
+
+    Days before the stored cursor are skipped if a cursor is given.  The day
+    of the cursor itself is read again, it can have dones added after the
+    last run.  Bad lines of a file are skipped into reject_file if given.
+    """
+
+    record_filter = filters.Filter.from_args(args)
+
+    if args['api_url'] is None:
+        return _read_files(args, record_filter, reject_file)
+
+    start_date = args['since']
+    last_day = cursor is not None and not args['api_full'] and cursor.load()
+    if last_day:
+        last_day = datetime.strptime(last_day, '%Y-%m-%d')
+        start_date = max(start_date, last_day) if start_date else last_day
+
+    return _filter_days(read_api_days(args['api_url'], webapi.api_token(args),
+                                      start_date, args['api_concurrency']),
+                        record_filter)
+
+
+def import_entries(filename, directory, start_date=None, record_filter=None,
+                   template=TEMPLATE, reject_file=None):
+    """
+    Write an entry for every day in filename into directory and yield the
+    file names, used by dayonetools.api
+    """
+
+    output = staging.DirectOutput(directory)
+    for curr_date, entries in read_entries_by_day(filename, start_date,
+                                                  record_filter=record_filter,
+                                                  reject_file=reject_file):
+        yield _create_dayone_entry(curr_date, reversed(entries), output,
+                                   template=template)
+
+
+def read_digest_days(filename, start_date=None, record_filter=None,
+                     reject_file=None):
+    """
+    Yield (YYYY-MM-DD, digest text) for every day in filename, oldest first
+
+    The export is newest first so all days are read before the first one is
+    returned.
+    """
+
+    days = list(read_entries_by_day(filename, start_date,
+                                    record_filter=record_filter,
+                                    reject_file=reject_file))
+
+    for curr_date, entries in reversed(days):
+        yield curr_date, ''.join('- %s\n' % (entry)
+                                 for entry in reversed(entries))
+
+
+def _preview(args):
+    """Print or keep the first days of the input for inspection"""
+
+    template = templates.from_args(args, TEMPLATE)
+    reject_file = rejects.from_args(args, SERVICENAME)
+
+    with preview.Preview(args['preview'], args['sample']) as entries:
+        for curr_date, day in _read_source(args, reject_file=reject_file):
+            _create_dayone_entry(curr_date, reversed(day), entries,
+                                 template=template)
+            if entries.done():
+                break
+
+    if reject_file is not None:
+        reject_file.close()
+
+
 def main():
     args = _parse_args()
+    log.setup(args)
 
-    if args['test']:
-        directory = './test'
-        try:
-            os.mkdir(directory)
-        except OSError as err:
-            print 'Warning: %s' % (err)
-    else:
-        directory = DAYONE_ENTRIES
+    if args['preview']:
+        _preview(args)
+        return
+
+    directory = journal_folder(args, DAYONE_ENTRIES)
+    template = templates.from_args(args, TEMPLATE)
+    source = merge.source(args['input_files'] or [args['api_url']])
+
+    with ImportRun(SERVICENAME, args, directory, source) as run:
+        last_day = run.position
+
+        cursor = None
+        if args['api_url'] is not None:
+            cursor = webapi.Cursor(run.state_name, args['api_url'])
+        newest = None
+
+        for curr_date, entries in _read_source(args, cursor, run.reject_file):
+            newest = max(newest, curr_date)
+
+            # Days come newest first so everything up to the checkpoint day
+            # was already written by the interrupted run.
+            if last_day and curr_date >= last_day:
+                continue
+
+            run.stats.incr('records_parsed', len(entries))
+            entries = list(reversed(entries))
+
+            uuid_str = None
+            if run.index is not None:
+                uuid_str, entries = run.index.merge(curr_date, entries)
+                if entries is None:
+                    continue
+
+            if uuid_str is None and cursor is not None:
+                # The day of the cursor is written again by the next run and
+                # must replace this entry
+                uuid_str = shard.entry_uuid(SERVICENAME, curr_date)
+            elif uuid_str is None:
+                uuid_str = run.entry_uuid(curr_date)
+
+            file_name = _create_dayone_entry(curr_date, entries, run.output,
+                                             uuid_str, template)
+            if run.index is not None:
+                run.index.put(curr_date, file_name, entries)
 
-    for curr_date, entries in read_entries_by_day(args['input_file'],
-                                                  args['since']):
-        entries = reversed(entries)
+            run.written(curr_date)
 
-        _create_dayone_entry(curr_date, entries, directory, args['verbose'])
+        if cursor is not None and newest is not None:
+            cursor.save(newest)
 
 
 if __name__ == '__main__':
@@ -5,16 +5,52 @@ distance,miles,steps,pace,fuel,start_time,device,calories,duration
 2.70,2.69928887137,5517,(33'46/mi),2714,2013-06-08T05:00:00Z,FUELBAND,839,9:37:00
 
 The result will be a new Day One entry for each line in the CSV file.
+
+Activities can also be read from the Nike+ web API with --api URL instead of
+an exported file, see dayonetools.webapi.
 """
 
 import argparse
 import collections
 from datetime import datetime
 import csv
-import os
+import logging
 import re
 import uuid
 
+from dayonetools import cache
+from dayonetools import checkpoint
+from dayonetools import filters
+from dayonetools import inputs
+from dayonetools import journaldb
+from dayonetools import log
+from dayonetools import merge
+from dayonetools import metrics
+from dayonetools import preview
+from dayonetools import rejects
+from dayonetools import shard
+from dayonetools import spill
+from dayonetools import staging
+from dayonetools import templates
+from dayonetools import timeseries
+from dayonetools import webapi
+from dayonetools.services import ImportRun
+from dayonetools.services import journal_folder
+
+LOG = logging.getLogger(__name__)
+
+SERVICENAME = 'nikeplus'
+
+# Bump whenever the records produced by _parse_rows change
+PARSER_VERSION = 2
+
+# Columns of the CSV export, activities read from the API get the same
+ACTIVITY_FIELDS = ('distance', 'miles', 'steps', 'pace', 'fuel', 'start_time',
+                   'device', 'calories', 'duration')
+ACTIVITY = collections.namedtuple('activity', ACTIVITY_FIELDS)
+
+MILES_PER_KM = 0.621371192237
+
 DAYONE_ENTRIES = '/Users/durden/Dropbox/Apps/Day One/Journal.dayone/entries/'
 
 # This text will be inserted into the first line of all entries created, set to
@@ -53,6 +89,18 @@ ENTRY_TEMPLATE = """
 </plist>
 """
 
+# ENTRY_TEMPLATE compiled, --template and --title replace it
+TEMPLATE = templates.Template(ENTRY_TEMPLATE, ACTIVITY_FIELDS + ('uuid_str',),
+                              HEADER_FOR_DAYONE_ENTRIES)
+
+# Section of an activity in a combined daily digest entry
+DIGEST_TEMPLATE = """- Fuel: {fuel} points
+- Steps: {steps}
+- Distance: {distance} miles
+- Calories: {calories}
+- Device: {device}
+"""
+
 
 def _parse_args():
     """Parse sys.argv arguments"""
@@ -60,9 +108,13 @@ def _parse_args():
     parser = argparse.ArgumentParser(
                                 description='Export NikeFuel data to Day One')
 
-    parser.add_argument('-f', '--file', action='store',
-                        dest='input_file', required=True,
-                        help='CSV file to import from')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-f', '--file', action='store', nargs='+',
+                        dest='input_files', metavar='FILE',
+                        help=('CSV files to import from, can be compressed '
+                              '(.gz, .bz2, .xz, .zip[:member]) or - for '
+                              'stdin.  Several exports are merged without '
+                              'duplicates'))
 
     parser.add_argument('-v', '--verbose', default=False, action='store_true',
                         dest='verbose', required=False,
@@ -91,80 +143,385 @@ def _parse_args():
                         help=('Only process entries starting with YYYY-MM-DD '
                               'and newer'))
 
-    return vars(parser.parse_args())
-
-
-def _create_nikeplus_entry(activity, directory, verbose):
+    cache.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    filters.add_arguments(parser, devices=True)
+    journaldb.add_arguments(parser)
+    log.add_arguments(parser)
+    metrics.add_arguments(parser)
+    preview.add_arguments(parser)
+    rejects.add_arguments(parser)
+    shard.add_arguments(parser)
+    spill.add_arguments(parser)
+    staging.add_arguments(parser)
+    templates.add_arguments(parser)
+    timeseries.add_arguments(parser)
+    webapi.add_arguments(parser, source)
+
+    args = vars(parser.parse_args())
+    filters.check_fields(parser, args, ACTIVITY_FIELDS)
+
+    return args
+
+
+def _create_nikeplus_entry(activity, output, uuid_str=None,
+                           template=TEMPLATE):
     """
     Create/write day one file with given nike plus activity
 
-    activity should be a named tuple
+    activity should be a named tuple, output the staging output to write
+    into.  Returns the name of the entry in the journal.
     """
 
     # Create unique uuid without any specific machine information
     # (uuid() vs.  uuid()) and strip any '-' characters to be
     # consistent with dayone format.
-    uuid_str = re.sub('-', '', str(uuid.uuid4()))
+    if uuid_str is None:
+        uuid_str = re.sub('-', '', str(uuid.uuid4()))
 
     file_name = '%s.doentry' % (uuid_str)
-    full_file_name = os.path.join(directory, file_name)
 
     activity_dict = activity._asdict()
     activity_dict['uuid_str'] = uuid_str
+    activity_dict['entry_title'] = template.title
+
+    entry_name = output.add_entry(file_name, template, activity_dict)
+
+    LOG.debug('Created entry for %s: %s', activity.start_time, file_name)
 
-    with open(full_file_name, 'w') as file_obj:
-        text = ENTRY_TEMPLATE.format(entry_title=HEADER_FOR_DAYONE_ENTRIES,
-                                     **activity_dict)
-        file_obj.write(text)
+    return entry_name
 
-    if verbose:
-        print 'Created entry for %s: %s' % (activity.start_time, file_name)
 
+def _save_to_store(store, activity):
+    """Save numbers of given nike plus activity into time-series store"""
 
-def read_entries(filename, start_date=None):
+    time = activity.start_time.replace('T', ' ').rstrip('Z')
+    store.add(SERVICENAME, time, activity.device,
+              timeseries.to_int(activity.steps),
+              timeseries.to_int(activity.fuel),
+              timeseries.to_int(activity.calories),
+              timeseries.to_float(activity.distance))
+
+
+def read_entries(filename, start_date=None, record_filter=None,
+                 reject_file=None):
     """
     Read and yield namedtuple for entries from filename
 
     if start_date is given as a datetime object only entries that happened on
-    or after that date will be returned.
+    or after that date will be returned.  record_filter is the
+    filters.Filter the entries have to pass if given.  Bad rows are skipped
+    into reject_file, a rejects.RejectFile, if given.
     """
 
-    with open(filename, 'r') as file_obj:
-        csv_reader = csv.reader(file_obj)
-        header = csv_reader.next()
+    for _, entry in read_numbered_entries(filename, start_date,
+                                          record_filter=record_filter,
+                                          reject_file=reject_file):
+        yield entry
 
-        activity = collections.namedtuple('activity', header)
 
-        for row in csv_reader:
-            # Create named tuple then use it's API to convert to a dict we can
-            # easily expand to format the entry text without hardcoding any
-            # names in the code itself.  We are heavily dependent on the names
-            # in the entry template matching the header line though.
-            entry = activity(*row)
+def read_numbered_entries(filename, start_date=None, start_row=0,
+                          use_cache=False, record_filter=None,
+                          reject_file=None):
+    """
+    Read and yield (row number, namedtuple) for entries from filename
 
-            # Date information in nikeplus is separated from time information
-            # with a 'T'
-            date = entry.start_time.split('T')[0].strip()
-            entry_date = datetime.strptime(date, '%Y-%m-%d')
+    Row numbers count data rows starting at 1 so they can be used as a
+    checkpoint position.  The first start_row rows are skipped without being
+    parsed.
 
-            if start_date is None or entry_date >= start_date:
-                yield entry
+    The file is read only once so it can be a stream like stdin.
 
+    if use_cache is True the parsed rows are loaded from/stored in the parsed
+    input cache.
 
-def main():
-    args = _parse_args()
+    Rows not passing record_filter, a filters.Filter, are dropped before
+    they are turned into entries.  Rows that can't be parsed raise ValueError
+    or are skipped into reject_file, a rejects.RejectFile, if given.
+    """
 
-    if args['test']:
-        directory = './test'
-        try:
-            os.mkdir(directory)
-        except OSError as err:
-            print 'Warning: %s' % (err)
+    if use_cache:
+        # Rows skipped in tolerant mode are missing from the cached records
+        settings = {'tolerant': True} if reject_file is not None else {}
+        rows = cache.cached_records(
+                    SERVICENAME, filename, PARSER_VERSION, settings,
+                    lambda filename: _parse_rows(filename,
+                                                 reject_file=reject_file))
     else:
-        directory = DAYONE_ENTRIES
+        rows = _parse_rows(filename, start_row, reject_file)
+
+    rows = iter(rows)
+    _, _, header = rows.next()
+
+    # Create named tuple then use it's API to convert to a dict we can easily
+    # expand to format the entry text without hardcoding any names in the code
+    # itself.  We are heavily dependent on the names in the entry template
+    # matching the header line though.
+    activity = collections.namedtuple('activity', header)
+
+    keep = record_filter and record_filter.row_predicate(header, 'start_time',
+                                                         _entry_key)
+
+    for row_num, entry_date, row in rows:
+        if row_num <= start_row:
+            continue
+
+        if start_date is not None and entry_date < start_date:
+            continue
+
+        if keep is None or keep(row):
+            yield row_num, activity(*row)
+
+
+def _parse_rows(filename, start_row=0, reject_file=None):
+    """
+    Parse CSV file and yield (0, None, header) followed by (row number, entry
+    date, row) for all data rows after start_row
+
+    Bad rows are skipped into reject_file if given, they still count as rows.
+    """
+
+    with inputs.open_input(filename) as mapped:
+        csv_reader = csv.reader(mapped.lines())
+        header = csv_reader.next()
+        start_time = header.index('start_time')
+
+        yield 0, None, header
+
+        for row_num, row in enumerate(csv_reader, 1):
+            if row_num <= start_row:
+                continue
+
+            try:
+                if len(row) != len(header):
+                    raise ValueError('%d fields instead of %d' % (len(row),
+                                                                  len(header)))
+
+                # Date information in nikeplus is separated from time
+                # information with a 'T'
+                date = row[start_time].split('T')[0].strip()
+                entry_date = datetime.strptime(date, '%Y-%m-%d')
+            except ValueError as err:
+                if reject_file is None:
+                    raise
+
+                reject_file.add(filename, 'line %d' % (csv_reader.line_num),
+                                err, row)
+                continue
+
+            yield row_num, entry_date, row
+
+
+def _api_activity(record):
+    """Convert activity record of the API into the namedtuple of the export"""
+
+    summary = record.get('metricSummary', {})
+    miles = float(summary.get('distance', 0)) * MILES_PER_KM
+
+    # API durations have milliseconds, the export doesn't
+    duration = summary.get('duration', '').split('.')[0]
+
+    return ACTIVITY(distance='%.2f' % (miles),
+                    miles=repr(miles),
+                    steps=str(summary.get('steps', '')),
+                    pace='',
+                    fuel=str(summary.get('fuel', '')),
+                    start_time=record['startTime'].encode('utf-8'),
+                    device=record.get('deviceType', '').encode('utf-8'),
+                    calories=str(summary.get('calories', '')),
+                    duration=duration.encode('utf-8'))
+
+
+def read_api_entries(url, token=None, start_date=None, after=None,
+                     concurrency=webapi.DEFAULT_CONCURRENCY):
+    """
+    Read and yield namedtuple for the activities of the Nike+ API at url
+
+    Activities come in the order of the API.  if start_date is given as a
+    datetime object only activities on or after that date are returned, if
+    after is given as a start_time string only activities starting later.
+    """
 
-    for entry in read_entries(args['input_file'], args['since']):
-        _create_nikeplus_entry(entry, directory, args['verbose'])
+    since = start_date and start_date.strftime('%Y-%m-%d')
+    pool = webapi.ConnectionPool(url, concurrency, token)
+
+    def _page_path(page):
+        """Path of given page counting from 0"""
+
+        path = '/me/sport/activities?count=%d&offset=%d' % (
+                                webapi.PAGE_SIZE, page * webapi.PAGE_SIZE + 1)
+        if since:
+            path += '&startDate=%s' % (since)
+
+        return path
+
+    try:
+        for record in webapi.iter_pages(pool, _page_path,
+                                        lambda body: body.get('data', []),
+                                        concurrency):
+            activity = _api_activity(record)
+
+            if since and activity.start_time.split('T')[0] < since:
+                continue
+
+            if after and activity.start_time <= after:
+                continue
+
+            yield activity
+    finally:
+        pool.close()
+
+
+def _entry_key(entry):
+    """Return key of entry for sharding and merging exports"""
+
+    # The whole row is the key, it's the only thing that is unique
+    return '|'.join(entry)
+
+
+def _read_files(args, start_row, record_filter, reject_file):
+    """
+    Yield (row number, namedtuple) from the files given in args, several
+    exports are merged by start time without duplicates
+    """
+
+    filenames = args['input_files']
+
+    if len(filenames) == 1:
+        return read_numbered_entries(filenames[0], args['since'], start_row,
+                                     args['cache'], record_filter,
+                                     reject_file)
+
+    def _read(filename):
+        """Yield entries of one export"""
+
+        for _, entry in read_numbered_entries(filename, args['since'], 0,
+                                              args['cache'], record_filter,
+                                              reject_file):
+            yield entry
+
+    entries = merge.unique(merge.merged(filenames, _read,
+                                        lambda entry: entry.start_time),
+                           _entry_key, args['max_memory'])
+
+    # Row numbers count the merged entries
+    return ((row_num, entry) for row_num, entry in enumerate(entries, 1)
+            if row_num > start_row)
+
+
+def _read_source(args, start_row=0, cursor=None, reject_file=None):
+    """
+    Yield (row number, namedtuple) from the files or API given in args
+
+    Activities up to the stored cursor are skipped if a cursor is given.  Bad
+    rows of a file are skipped into reject_file if given.
+    """
+
+    record_filter = filters.Filter.from_args(args)
+
+    if args['api_url'] is None:
+        return _read_files(args, start_row, record_filter, reject_file)
+
+    start_date = args['since']
+    after = cursor is not None and not args['api_full'] and cursor.load()
+    if after:
+        last_day = datetime.strptime(after.split('T')[0], '%Y-%m-%d')
+        start_date = max(start_date, last_day) if start_date else last_day
+
+    entries = read_api_entries(args['api_url'], webapi.api_token(args),
+                               start_date, after, args['api_concurrency'])
+
+    # Row numbers count every activity read so they stay valid checkpoint
+    # positions whatever the filters
+    keep = record_filter.row_predicate(ACTIVITY_FIELDS, 'start_time',
+                                       _entry_key)
+
+    return ((row_num, entry) for row_num, entry in enumerate(entries, 1)
+            if row_num > start_row and (keep is None or keep(entry)))
+
+
+def import_entries(filename, directory, start_date=None, record_filter=None,
+                   template=TEMPLATE, reject_file=None):
+    """
+    Write an entry for every record in filename into directory and yield the
+    file names, used by dayonetools.api
+    """
+
+    output = staging.DirectOutput(directory)
+    for entry in read_entries(filename, start_date, record_filter,
+                              reject_file):
+        yield _create_nikeplus_entry(entry, output, template=template)
+
+
+def read_digest_days(filename, start_date=None, record_filter=None,
+                     reject_file=None):
+    """
+    Yield (YYYY-MM-DD, digest text) for every activity in filename, in the
+    order of the file which is by date
+    """
+
+    for entry in read_entries(filename, start_date, record_filter,
+                              reject_file):
+        day_str = entry.start_time.split('T')[0].strip()
+        yield day_str, DIGEST_TEMPLATE.format(**entry._asdict())
+
+
+def _preview(args):
+    """Print or keep the first entries of the input for inspection"""
+
+    template = templates.from_args(args, TEMPLATE)
+    reject_file = rejects.from_args(args, SERVICENAME)
+
+    with preview.Preview(args['preview'], args['sample']) as entries:
+        for _, entry in _read_source(args, reject_file=reject_file):
+            _create_nikeplus_entry(entry, entries, template=template)
+            if entries.done():
+                break
+
+    if reject_file is not None:
+        reject_file.close()
+
+
+def main():
+    args = _parse_args()
+    log.setup(args)
+
+    if args['preview']:
+        _preview(args)
+        return
+
+    directory = journal_folder(args, DAYONE_ENTRIES)
+    template = templates.from_args(args, TEMPLATE)
+    source = merge.source(args['input_files'] or [args['api_url']])
+
+    with ImportRun(SERVICENAME, args, directory, source) as run:
+        cursor = None
+        if args['api_url'] is not None:
+            cursor = webapi.Cursor(run.state_name, args['api_url'])
+        newest = None
+
+        if (args['progress'] and args['input_files'] is not None and
+                len(args['input_files']) == 1 and
+                not inputs.is_stream(args['input_files'][0])):
+            with inputs.open_input(args['input_files'][0]) as mapped:
+                # Every line but the header is a row
+                run.stats.set_total(mapped.count('\n') - 1, 'records_parsed')
+
+        for row_num, entry in _read_source(args, run.position or 0, cursor,
+                                           run.reject_file):
+            newest = max(newest, entry.start_time)
+
+            key = _entry_key(entry)
+            _create_nikeplus_entry(entry, run.output, run.entry_uuid(key),
+                                   template)
+            run.stats.set('records_parsed', row_num)
+            run.written(row_num)
+
+            if run.store is not None:
+                _save_to_store(run.store, entry)
+
+        if cursor is not None and newest is not None:
+            cursor.save(newest)
 
 
 if __name__ == '__main__':
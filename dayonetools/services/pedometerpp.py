@@ -25,25 +25,115 @@ Example with a fictious device and output collected in test folder:
 
 ./dayonetools/main.py pedometerpp -d 0123456789ABCDEFEDCBBCDEFEDCBA9876543210 -o test
 
+Several devices or rotated backups can be given at once, they are read in
+parallel and days found in more than one backup are merged with the --merge
+rule:
+
+./dayonetools/main.py pedometerpp -d PHONE1 PHONE2 /Volumes/old/PHONE1 \
+    --merge max -o test
+
+Runs are incremental, only days since the last run into the same journal folder
+are read and written (plus the last day again, it may have more steps by now).
+Weekly and monthly sums still open are carried over to the next run.  Use
+--full to read everything again.
+
 """
 from __future__ import unicode_literals
 
 __author__ = 'jotefa'
 
 import argparse
+import calendar
+import heapq
+import itertools
+import logging
+from multiprocessing.pool import ThreadPool
 import shutil
+import tempfile
+import time
+from dayonetools import checkpoint
+from dayonetools import filters
+from dayonetools import journaldb
+from dayonetools import log
+from dayonetools import metrics
+from dayonetools import preview
+from dayonetools import shard
+from dayonetools import spill
+from dayonetools import staging
+from dayonetools import timeline
+from dayonetools import timeseries
+from dayonetools.services import ImportRun
 from dayonetools.services import get_outfolder_names
 import os
 import sqlite3 as sqlite
 import datetime
 import pytz
-import plistlib
 import uuid
 
 SERVICENAME = 'pedometerpp'
 SERVICEVERSION = '1.0a2'
 SERVICEID = 'de.jotefa.d1tools.pedometerpp'
 
+LOG = logging.getLogger(__name__)
+
+# Name of the pedometer++ database in an iTunes backup folder
+DATABASE = 'dda8ace3c3f41792dd620ef4269a1344031686a7'
+
+# How to combine a day found in more than one backup
+MERGE_RULES = ('max', 'latest', 'sum')
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+def _iso_week_sunday(isoYear, isoWeek):
+    """Return date of the Sunday ending the given ISO week"""
+    # January 4th is always in ISO week 1
+    jan4 = datetime.date(isoYear, 1, 4)
+    return jan4 + datetime.timedelta(
+        days=7 - jan4.isoweekday() + 7 * (isoWeek - 1))
+
+
+def _last_day_of_month(month_key):
+    """Return date of the last day of the month given as 'YYYY-MM'"""
+    year, month = [int(part) for part in month_key.split('-')]
+    return datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _first_day_of_periods(day_str):
+    """
+    Return 'YYYY-MM-DD' of the first day of the ISO week or the month of
+    day_str, whichever comes first
+    """
+    day = datetime.datetime.strptime(day_str, '%Y-%m-%d').date()
+    monday = day - datetime.timedelta(days=day.isoweekday() - 1)
+    return min(monday, day.replace(day=1)).strftime('%Y-%m-%d')
+
+
+def _last_day_of_periods(day_str):
+    """
+    Return 'YYYY-MM-DD' of the last day of the ISO week or the month of
+    day_str, whichever comes last
+    """
+    day = datetime.datetime.strptime(day_str, '%Y-%m-%d').date()
+    sunday = day + datetime.timedelta(days=7 - day.isoweekday())
+    return max(sunday, _last_day_of_month(day_str[:7])).strftime('%Y-%m-%d')
+
+
+def _local_datetime(ztimestamp):
+    """Return naive local datetime of a ZTIMESTAMP"""
+    # Pedometer++ saves a ZDATESTRING which is a mess of localized names
+    # and US sequence. We ignore it and interpret the ZTIMESTAMP, which
+    # is shifted by 31 years.
+    dt = datetime.datetime.fromtimestamp(ztimestamp)
+    return dt.replace(year=dt.year+31)
+
+
+def _ztimestamp(day_str):
+    """Return ZTIMESTAMP of the start of day 'YYYY-MM-DD'"""
+    # The reverse of _local_datetime: ZTIMESTAMP is local time 31 years early
+    year, month, day = [int(part) for part in day_str.split('-')]
+    return time.mktime((year - 31, month, day, 0, 0, 0, 0, 0, -1))
+
 
 class PedometerPP():
 
@@ -52,9 +142,23 @@ class PedometerPP():
             description='Import Pedometer++ data from your iPhone Backup into your Day One Journal'
         )
         parser.add_argument(
-            '-d', '--device', action='store',
+            '-d', '--device', action='store', nargs='+',
             dest='device', required=True,
-            help='Backup folder of the iOS device'
+            help='Backup folders of the iOS devices, names are looked up in '
+                 'the iTunes backup folder, full paths are used as is'
+        )
+        parser.add_argument(
+            '--database', default=DATABASE, action='store',
+            dest='database', required=False,
+            help="File name of the pedometer++ database in the backup folders,"
+                 " default: '{0}'".format(DATABASE)
+        )
+        parser.add_argument(
+            '--merge', default='max', choices=MERGE_RULES,
+            dest='merge', required=False,
+            help="How to combine days found in several backups: largest step "
+                 "count, the most recently modified backup or the sum, "
+                 "default: 'max'"
         )
         parser.add_argument(
             '-t', '--timezone', default='Europe/Berlin', action='store',
@@ -67,15 +171,37 @@ class PedometerPP():
             dest='outfolder', required=True,
             help="Day One Journal folder or 'auto' or 'test'"
         )
+        parser.add_argument(
+            '--full', default=False, action='store_true',
+            dest='full', required=False,
+            help='Read the whole database again instead of only the days '
+                 'since the last run'
+        )
+        parser.add_argument(
+            '-s', '--since', default=None, type=filters.day,
+            dest='since', required=False, metavar='YYYY-MM-DD',
+            help='Only process days starting with YYYY-MM-DD and newer'
+        )
         parser.add_argument(
             '-v', '--verbose', default=False, action='store_true',
             dest='verbose', required=False,
             help='Verbose debugging information'
         )
+        checkpoint.add_arguments(parser)
+        filters.add_arguments(parser)
+        journaldb.add_arguments(parser)
+        log.add_arguments(parser)
+        metrics.add_arguments(parser)
+        preview.add_arguments(parser)
+        shard.add_arguments(parser)
+        spill.add_arguments(parser)
+        staging.add_arguments(parser)
+        timeline.add_arguments(parser)
+        timeseries.add_arguments(parser)
         self.args = vars(parser.parse_args())
-
-        # FIXME: Add progress output for --verbose
-        print self.args, file
+        filters.check_fields(parser, self.args, ['steps'])
+        log.setup(self.args)
+        LOG.debug('Arguments: %s', self.args)
 
         # Prepare output folders
         self.d1folder, self.tempfolder = get_outfolder_names(
@@ -83,73 +209,277 @@ class PedometerPP():
             self.args['outfolder'],
             self.args['verbose']
         )
-        print '\nExporting to “{0}”'.format(self.d1folder)
-        print '\nTemporary files saved in “{0}”'.format(self.tempfolder)
+        LOG.info('Exporting to “%s”', self.d1folder)
+
+        self.shard = self.args['shard']
+        self.timeline = timeline.Timeline.load(self.args['timeline'],
+                                               self.args['timezone'])
+        LOG.info('Temporary files saved in “%s”', self.tempfolder)
 
         # Prepare input database
         backupfolder = '~/Library/Application Support/MobileSync/Backup'
         # TODO: Add testing for OS when Day One becomes available on Windows or other OS
 
-        dbbackup = os.path.join(
-            os.path.expanduser(backupfolder),
-            self.args['device'],
-            'dda8ace3c3f41792dd620ef4269a1344031686a7'  # Name of the pedometer++ database backup
-        )
-        print '\nCollecting data from “{0}”'.format(dbbackup)
-
-        # FIXME: Check existence
-
-        # Copy the database into tempFolder to avoid messing up the “official”
-        # backup with temp files generated during sqlite access
-        # It’s a waste, but only 30~KB per half a year
-        self.dbfile = os.path.join(self.tempfolder, 'pedometerpp.sqlite')
-        shutil.copy(dbbackup, self.dbfile)
+        dbbackups = []
+        for device in self.args['device']:
+            dbbackup = os.path.join(
+                os.path.expanduser(backupfolder),
+                device,
+                self.args['database']
+            )
+            if not os.path.exists(dbbackup):
+                parser.error('No pedometer++ database “{0}”'.format(dbbackup))
+
+            LOG.info('Collecting data from “%s”', dbbackup)
+            dbbackups.append(dbbackup)
+
+        # The most recently modified backup comes first, that's the one the
+        # 'latest' merge rule prefers.
+        dbbackups.sort(key=os.path.getmtime, reverse=True)
+        self.dbbackups = dbbackups
+
+        # The checkpoint is the watermark of incremental runs: the local day
+        # of the last day written plus the weekly and monthly sums that were
+        # still open before that day.  It belongs to the journal folder too,
+        # a test run must not make the real import skip anything.  Runs with
+        # --since, --until or filters don't read every day, they neither use
+        # nor move the watermark.
+        self.run = ImportRun(
+            SERVICENAME, self.args, self.d1folder,
+            '{0}>{1}'.format(';'.join(sorted(dbbackups)),
+                             os.path.abspath(self.d1folder)))
+        self.output = self.run.output
+        self.store = self.run.store
+        self.stats = self.run.stats
+        self.checkpoint = self.run.progress
+        self.checkpoint.keep = True
+        partial = (self.args['since'] is not None or
+                   self.args['until'] is not None or
+                   bool(self.args['match'] or self.args['min']))
+        if partial:
+            self.checkpoint.enabled = False
+
+        self.watermark = {}
+        if not (self.args['full'] or self.args['preview'] or partial):
+            self.watermark = self.checkpoint.load() or {}
+            if 'timestamp' in self.watermark:
+                # Watermark of older versions, ZTIMESTAMP of the last row
+                self.watermark['day'] = _local_datetime(
+                    self.watermark.pop('timestamp')).strftime('%Y-%m-%d')
 
         # Initialize our data collection
-        self.entries = {}
+        self.entries = spill.Partitions(self.args['max_memory'])
+        self.filter = filters.Filter.from_args(self.args)
+        self.keep = self.filter.row_predicate(['steps'])
+        self.window = self._read_window()
 
     def collect_entries(self):
         """
-        Load the database entries into a python dict
-        Key is the UTC time of an entry
+        Load the database entries of all backups into spill.Partitions
+        Key is the UTC time of an entry, every key has exactly one entry
+
+        Every backup is read by its own worker thread, the sorted streams are
+        then merged in timestamp order combining days found more than once.
         """
-        con = sqlite.connect(self.dbfile)
-        cur = con.cursor()
+        pool = ThreadPool(len(self.dbbackups))
+        try:
+            streams = pool.map(self._read_database,
+                               list(enumerate(self.dbbackups)))
+        finally:
+            pool.close()
+
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        summary = log.RateLimited(LOG, 'days read')
+
+        for dt, group in itertools.groupby(heapq.merge(*streams),
+                                           key=lambda item: item[0]):
+            records = [record for _, _, record in group]
+            entry = self._merge_records(records)
+
+            if debug:
+                LOG.debug('%s • %5s %5s %10s %10s', dt, entry['ent'],
+                          entry['opt'], entry['steps'], entry['timestamp'])
+            self.entries.add(dt, entry)
+            summary.add()
 
-        cur.execute("SELECT * FROM ZSTEPCOUNT ORDER BY ZTIMESTAMP")
-        col_names = [cn[0] for cn in cur.description]
-        print '\n', col_names
+        summary.done()
 
-        for row in cur.fetchall():
-            #print row
-            # Pedometer++ saves a ZDATESTRING which is a mess of localized names
-            # and US sequence. We ignore it and interpret the ZTIMESTAMP, which
-            # is shifted by 31 years.
-            dt = datetime.datetime.fromtimestamp(row[4])
+        self.stats.set('records_parsed', len(self.entries))
+
+    def _read_database(self, source):
+        """
+        Read one backup database and return sorted list of
+        (UTC time, rank, record) tuples, source is a (rank, path) tuple
+        """
+        rank, dbbackup = source
+
+        # Copy the database into tempFolder to avoid messing up the “official”
+        # backup with temp files generated during sqlite access
+        # It’s a waste, but only 30~KB per half a year
+        # Every read gets its own copy, shards and other runs read the same
+        # backups at the same time.  sqlite3 of Python 2 can't open a file
+        # read-only, that takes a URI.
+        fd, dbfile = tempfile.mkstemp(prefix='pedometerpp-{0}-'.format(rank),
+                                      suffix='.sqlite', dir=self.tempfolder)
+        try:
+            os.close(fd)
+            shutil.copy(dbbackup, dbfile)
+
+            con = sqlite.connect(dbfile)
+            cur = con.cursor()
+
+            where, params = self._where()
+            cur.execute(
+                "SELECT * FROM ZSTEPCOUNT WHERE {0} "
+                "ORDER BY ZTIMESTAMP".format(where),
+                params
+            )
+            rows = cur.fetchall()
+            con.close()
+        finally:
+            os.remove(dbfile)
+
+        records = []
+        for row in rows:
+            dt = _local_datetime(row[4])
+            day_str = dt.strftime('%Y-%m-%d')
+            if not self._day_ok(day_str):
+                continue
             # We set the time to 23:59 to make it the last item of a Day One day
-            dt = dt.replace(year=dt.year+31, hour=23, minute=59)
-            # Convert from the device time zone to UTC as expected by Day One
-            dt = pytz.timezone(self.args['timezone']).localize(dt)
+            dt = dt.replace(hour=23, minute=59)
+            # Convert from the device time zone to UTC as expected by Day One,
+            # a day is close enough to UTC to find its timeline period
+            zone = self.timeline.zone_name_at(dt)
+            dt = pytz.timezone(zone).localize(dt)
             dt = dt.astimezone(pytz.utc)
-            #print dt.tzinfo, dt.dst()
 
-            print '{1} • {0[0]:4} {0[1]:5} {0[2]:5} {0[3]:10} {0[4]:10} {0[5]}'.format(row, dt)
-            self.entries[dt] = {
+            records.append((dt, rank, {
                 'ent': row[1],  # FIXME: I have no idea what that is
                 'opt': row[2],  # FIXME: I have no idea what that is
                 'steps': row[3],
-            }
+                'timestamp': row[4],
+                'day': day_str,
+            }))
+
+        # Sort in python as well, the order of the converted times is what
+        # the merge relies on.
+        records.sort(key=lambda item: item[:2])
+        return records
+
+    def _read_window(self):
+        """
+        Return first and last local day 'YYYY-MM-DD' to read, None if open
+
+        --since and --until are widened to whole weeks and months, every row
+        counts for the sums even if its day isn't written.
+        """
+        first_day = last_day = None
+        if self.args['since'] is not None:
+            first_day = _first_day_of_periods(self.args['since'])
+        if self.watermark.get('day') is not None:
+            first_day = max(first_day or '', self.watermark['day'])
+        if self.filter.until is not None:
+            last_day = _last_day_of_periods(self.filter.until)
+        return first_day, last_day
+
+    def _where(self):
+        """
+        Return WHERE clause and its parameters selecting the rows to read
+
+        The dates get a day of margin, _day_ok() checks them exactly once the
+        timestamps are converted.  The filters on the steps aren't pushed
+        down, the sums need all rows.
+        """
+        # The last day written is read again from every backup, it may have
+        # more steps by now
+        first_day, last_day = self.window
+
+        clauses = ['ZTIMESTAMP >= ?']
+        params = [float('-inf')]
+        if first_day is not None:
+            params[0] = _ztimestamp(first_day) - DAY_SECONDS
+        if last_day is not None:
+            clauses.append('ZTIMESTAMP < ?')
+            params.append(_ztimestamp(last_day) + 2 * DAY_SECONDS)
+
+        return ' AND '.join(clauses), params
+
+    def _day_ok(self, day_str):
+        """True if the local day 'YYYY-MM-DD' is within the days to read"""
+        first_day, last_day = self.window
+        return ((first_day is None or day_str >= first_day) and
+                (last_day is None or day_str <= last_day))
+
+    def _write_ok(self, day_str, steps):
+        """
+        True if the entry of local day 'YYYY-MM-DD' with steps is written,
+        the day has to be within --since and --until and pass the filters
+        """
+        if self.args['since'] is not None and day_str < self.args['since']:
+            return False
+        if not self.filter.day_ok(day_str):
+            return False
+        return self.keep is None or self.keep([str(steps)])
+
+    def _period_ok(self, first_day, last_day):
+        """
+        True if the summary of the week or month from first_day to last_day,
+        dates, is written, it has to overlap --since and --until
+        """
+        since, until = self.args['since'], self.filter.until
+        return ((since is None or last_day.strftime('%Y-%m-%d') >= since) and
+                (until is None or first_day.strftime('%Y-%m-%d') <= until))
 
-    def export_d1(self):
+    def _merge_records(self, records):
+        """
+        Combine records of the same day from several backups according to the
+        merge rule, records are ordered by backup rank (most recent first)
+        """
+        if len(records) == 1:
+            return records[0]
+
+        rule = self.args['merge']
+        if rule == 'latest':
+            entry = dict(records[0])
+        elif rule == 'max':
+            entry = dict(max(records, key=lambda record: record['steps']))
+        else:
+            entry = dict(records[0])
+            entry['steps'] = sum(record['steps'] for record in records)
+
+        return entry
+
+    def _utc_end_of_day(self, day, second):
+        """Return UTC time of 23:59:second local time on date day"""
+        local = datetime.datetime(day.year, day.month, day.day, 23, 59, second)
+        zone = pytz.timezone(self.timeline.zone_name_at(local))
+        return zone.localize(local).astimezone(pytz.utc)
+
+    def export_d1(self, limit=None):
         """
         Loop through entries by date and count weekly and monthly sums
         Write a plist for every entry into the output folder
+
+        A week or month summary is written once its last day was seen, or
+        when a later day shows up if that day is missing.  The sums still open
+        are part of the watermark so the next run continues them.
+
+        Stop after limit days if given
+
+        With --shard all sums are still counted but only the days, weeks and
+        months of the shard are written.  The same goes for the filters, days
+        that don't pass still count for the sums.
         """
-        sumweek = 0
-        summonth = 0
+        # [ISO year, ISO week, steps] and ['YYYY-MM', steps] of open periods
+        week = self.watermark.get('week')
+        month = self.watermark.get('month')
 
         # FIXME: Make text localizable
 
+        # Only spend time on formatting debug output if it's shown
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        summary = log.RateLimited(LOG, 'days written')
+
         def created1entry(edate, ekind, esteps, etext):
             entry = {
                 'Creator': {
@@ -158,7 +488,8 @@ class PedometerPP():
                 },
                 'UUID': str.upper(uuid.uuid4().hex),
                 'Creation Date': edate,
-                'Time Zone': self.args['timezone'],
+                'Time Zone': self.timeline.zone_name_at(
+                    edate.replace(tzinfo=None)),
                 'Tags': [SERVICENAME, 'M7Steps', '⚗Auto', ekind],
                 'Starred': False,
                 'Step Count': esteps,
@@ -169,58 +500,114 @@ class PedometerPP():
             # Day One names files with the uuid used in the file but other names seem to work as well
             # So we use the date and the service name to create a name
             # FIXME: Test for existing entry file
-            plistlib.writePlist(
-                entry,
-                os.path.join(self.d1folder, '{0}_{1}.doentry'.format(
-                    edate.strftime('%Y-%m-%dT%H-%M-%SZ'),
-                    SERVICENAME
-                ))
-            )
+            file_name = self.output.add_plist('{0}_{1}.doentry'.format(
+                edate.strftime('%Y-%m-%dT%H-%M-%SZ'),
+                SERVICENAME
+            ), entry)
+            self.run.summary.add()
+            return file_name
+
+        def created_week(week):
+            isoYear, isoWeek, sumweek = week
+            ii = self._utc_end_of_day(_iso_week_sunday(isoYear, isoWeek), 20)
+            if debug:
+                LOG.debug('%s %10s %10s ∑ KW %s %s', ii, 0, sumweek, isoWeek,
+                          isoYear)
+            sunday = _iso_week_sunday(isoYear, isoWeek)
+            week_key = '{0}-W{1:02}'.format(isoYear, isoWeek)
+            if (shard.in_shard(self.shard, week_key) and
+                    self._period_ok(sunday - datetime.timedelta(days=6),
+                                    sunday)):
+                created1entry(
+                    ii, '∑ Week', sumweek,
+                    'Schritte in Woche {1:02}-{2}: {0}'.format(sumweek, isoWeek, isoYear)
+                )
 
-        for i in sorted(self.entries):
-            # Create entry for the last month on the first of the current month
-            if i.day == 1:
-                ii = i.replace(second=40) - datetime.timedelta(days=1)
-                print('{0} {1:10} {2:4} {3:10} ∑ {4}'.format(
-                    ii, 0,
-                    self.entries[i]['opt'],
-                    summonth,
-                    ii.strftime('%B %Y')
-                ))
+        def created_month(month):
+            month_key, summonth = month
+            last_day = _last_day_of_month(month_key)
+            ii = self._utc_end_of_day(last_day, 40)
+            if debug:
+                LOG.debug('%s %10s %10s ∑ %s', ii, 0, summonth,
+                          last_day.strftime('%B %Y'))
+            if (shard.in_shard(self.shard, month_key) and
+                    self._period_ok(last_day.replace(day=1), last_day)):
                 created1entry(
                     ii, '∑ Month', summonth,
-                    'Schritte im Monat {1}: {0}'.format(summonth, ii.strftime('%Y-%b'))
+                    'Schritte im Monat {1}: {0}'.format(
+                        summonth, last_day.strftime('%Y-%b'))
                 )
-                summonth = 0
-            summonth += self.entries[i]['steps']
 
-            # Create entry for this Day
-            print('{0} {1:10} {2:4}'.format(i, self.entries[i]['steps'], self.entries[i]['opt']))
-            created1entry(
-                i, '∑ Day', self.entries[i]['steps'],
-                'Schritte heute: {0}'.format(self.entries[i]['steps'])
-            )
+        self.stats.set_total(len(self.entries), 'days')
 
-            # We use ISO weeks, so we create a summary on Sunday
-            sumweek += self.entries[i]['steps']
-            (isoYear, isoWeek, isoWeekday) = i.isocalendar()
-            if isoWeekday == 7:  # sunday
-                ii = i.replace(second=20)
-                print('{0} {1:10} {2:4} {3:10} ∑ KW {4} {5}'.format(
-                    ii, 0,
-                    self.entries[i]['opt'],
-                    sumweek, isoWeek, isoYear))
+        for num, (i, [day_entry]) in enumerate(self.entries.items()):
+            if limit is not None and num >= limit:
+                break
+
+            # The watermark is the state right before this day, so the next
+            # run can read this day again in case it got more steps since.
+            position = {
+                'day': day_entry['day'],
+                'week': week,
+                'month': month,
+            }
+
+            steps = day_entry['steps']
+            zone = self.timeline.zone_name_at(i.replace(tzinfo=None))
+            local = i.astimezone(pytz.timezone(zone))
+            day = local.date()
+            week_key = list(day.isocalendar()[:2])
+            month_key = day.strftime('%Y-%m')
+
+            # Close periods whose last day is missing in the database
+            if week is not None and week[:2] != week_key:
+                created_week(week)
+                week = None
+            if month is not None and month[0] != month_key:
+                created_month(month)
+                month = None
+
+            week = week_key + [(week[2] if week else 0) + steps]
+            month = [month_key, (month[1] if month else 0) + steps]
+
+            # Create entry for this Day
+            if debug:
+                LOG.debug('%s %10s %4s', i, steps, day_entry['opt'])
+            day_str = day.strftime('%Y-%m-%d')
+            if (shard.in_shard(self.shard, day_str) and
+                    self._write_ok(day_str, steps)):
                 created1entry(
-                    ii, '∑ Week', sumweek,
-                    'Schritte in Woche {1:02}-{2}: {0}'.format(sumweek, isoWeek, isoYear)
+                    i, '∑ Day', steps,
+                    'Schritte heute: {0}'.format(steps)
                 )
-                sumweek = 0
+                if self.store is not None:
+                    self.store.add(SERVICENAME,
+                                   local.strftime('%Y-%m-%d %H:%M:%S'),
+                                   steps)
+
+            # We use ISO weeks, so we create a summary on Sunday
+            if day.isoweekday() == 7:
+                created_week(week)
+                week = None
+            if (day + datetime.timedelta(days=1)).month != day.month:
+                created_month(month)
+                month = None
+
+            self.stats.incr('days')
+            summary.add()
+            self.checkpoint.commit(position)
+
+        summary.done()
 
 
 def main():
     ppp = PedometerPP()
-    ppp.collect_entries()
-    ppp.export_d1()
+    with ppp.run:
+        try:
+            ppp.collect_entries()
+            ppp.export_d1(ppp.args['preview'])
+        finally:
+            ppp.entries.close()
 
 if __name__ == '__main__':
     main()
@@ -11,11 +11,48 @@ import argparse
 import collections
 from datetime import datetime
 import csv
-import os
+import itertools
+import logging
+import multiprocessing
 import re
 import uuid
 
+from dayonetools import cache
+from dayonetools import checkpoint
+from dayonetools import filters
+from dayonetools import inputs
+from dayonetools import journaldb
+from dayonetools import log
+from dayonetools import merge
+from dayonetools import metrics
+from dayonetools import preview
+from dayonetools import rejects
+from dayonetools import shard
+from dayonetools import spill
+from dayonetools import staging
+from dayonetools import templates
+from dayonetools import timeseries
+from dayonetools.mmapfile import MappedFile
+from dayonetools.services import ImportRun
 from dayonetools.services import convert_to_dayone_date_string
+from dayonetools.services import journal_folder
+
+LOG = logging.getLogger(__name__)
+
+SERVICENAME = 'sleep_cycle'
+
+# Bump whenever the records produced by _parse_rows change
+PARSER_VERSION = 2
+
+# Plain exports at least this big are parsed in chunks by a process per CPU
+PARALLEL_SIZE = 4 * 1024 * 1024
+
+# Chunks per process, so a slow chunk doesn't hold up the others
+CHUNKS_PER_JOB = 4
+
+# Columns of the CSV export as namedtuple fields, see _sanitize_fields()
+SLEEP_FIELDS = ('Start', 'End', 'Sleep_quality', 'Time_in_bed', 'Wake_up',
+                'Sleep_Notes', 'Heart_rate', 'Activity_steps')
 
 DAYONE_ENTRIES = '/Users/durden/Dropbox/Apps/Day One/Journal.dayone/entries/'
 
@@ -55,6 +92,20 @@ ENTRY_TEMPLATE = """
 </plist>
 """
 
+# ENTRY_TEMPLATE compiled, --template and --title replace it
+TEMPLATE = templates.Template(ENTRY_TEMPLATE,
+                              SLEEP_FIELDS + ('uuid_str', 'sleep_start'),
+                              HEADER_FOR_DAYONE_ENTRIES)
+
+# Section of a night in a combined daily digest entry
+DIGEST_TEMPLATE = """- Bedtime: {Start}
+- Wake time: {End}
+- Quality: {Sleep_quality}
+- Total sleep time: {Time_in_bed}
+- Notes: {Sleep_Notes}
+- Steps: {Activity_steps}
+"""
+
 
 def _parse_args():
     """Parse sys.argv arguments"""
@@ -62,9 +113,12 @@ def _parse_args():
     parser = argparse.ArgumentParser(
                                 description='Export Sleep Cycle data to Day One')
 
-    parser.add_argument('-f', '--file', action='store',
-                        dest='input_file', required=True,
-                        help='CSV file to import from')
+    parser.add_argument('-f', '--file', action='store', nargs='+',
+                        dest='input_files', required=True, metavar='FILE',
+                        help=('CSV files to import from, can be compressed '
+                              '(.gz, .bz2, .xz, .zip[:member]) or - for '
+                              'stdin.  Several exports are merged without '
+                              'duplicates'))
 
     parser.add_argument('-v', '--verbose', default=False, action='store_true',
                         dest='verbose', required=False,
@@ -93,23 +147,42 @@ def _parse_args():
                         help=('Only process entries starting with YYYY-MM-DD '
                               'and newer'))
 
-    return vars(parser.parse_args())
+    cache.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    filters.add_arguments(parser)
+    journaldb.add_arguments(parser)
+    log.add_arguments(parser)
+    metrics.add_arguments(parser)
+    preview.add_arguments(parser)
+    rejects.add_arguments(parser)
+    shard.add_arguments(parser)
+    spill.add_arguments(parser)
+    staging.add_arguments(parser)
+    templates.add_arguments(parser)
+    timeseries.add_arguments(parser)
 
+    args = vars(parser.parse_args())
+    filters.check_fields(parser, args, SLEEP_FIELDS)
 
-def _create_entry(entry, directory, verbose):
+    return args
+
+
+def _create_entry(entry, output, uuid_str=None, template=TEMPLATE):
     """
     Create/write day one file with given sleep cycle entry
 
-    entry should be a named tuple
+    entry should be a named tuple, template the templates.Template to render
+    it with and output the staging output to write into.  Returns the name
+    of the entry in the journal.
     """
 
     # Create unique uuid without any specific machine information
     # (uuid() vs. uuid()) and strip any '-' characters to be
     # consistent with dayone format.
-    uuid_str = re.sub('-', '', str(uuid.uuid4()))
+    if uuid_str is None:
+        uuid_str = re.sub('-', '', str(uuid.uuid4()))
 
     file_name = '%s.doentry' % (uuid_str)
-    full_file_name = os.path.join(directory, file_name)
 
     entry_dict = entry._asdict()
     entry_dict['uuid_str'] = uuid_str
@@ -121,21 +194,59 @@ def _create_entry(entry, directory, verbose):
                                                               minute,
                                                               second)
 
-    with open(full_file_name, 'w') as file_obj:
-        text = ENTRY_TEMPLATE.format(entry_title=HEADER_FOR_DAYONE_ENTRIES,
-                                     **entry_dict)
-        file_obj.write(text)
+    entry_dict['entry_title'] = template.title
+    entry_name = output.add_entry(file_name, template, entry_dict)
+
+    LOG.debug('Created entry for %s: %s', entry.Start, file_name)
+
+    return entry_name
 
-    if verbose:
-        print 'Created entry for %s: %s' % (entry.Start, file_name)
 
+def _save_to_store(store, entry):
+    """Save numbers of given sleep cycle entry into time-series store"""
 
-def read_entries(filename, start_date=None):
+    # Older exports don't have all the columns
+    store.add(SERVICENAME, entry.Start, entry.End,
+              timeseries.to_int(getattr(entry, 'Sleep_quality', None)),
+              timeseries.to_minutes(getattr(entry, 'Time_in_bed', None)),
+              timeseries.to_int(getattr(entry, 'Activity_steps', None)))
+
+
+def read_entries(filename, start_date=None, record_filter=None,
+                 reject_file=None):
     """
     Read and yield namedtuple for entries from filename
 
     if start_date is given as a datetime object only entries that happened on
-    or after that date will be returned.
+    or after that date will be returned.  record_filter is the
+    filters.Filter the entries have to pass if given.  Bad rows are skipped
+    into reject_file, a rejects.RejectFile, if given.
+    """
+
+    for _, entry in read_numbered_entries(filename, start_date,
+                                          record_filter=record_filter,
+                                          reject_file=reject_file):
+        yield entry
+
+
+def read_numbered_entries(filename, start_date=None, start_row=0,
+                          use_cache=False, record_filter=None,
+                          reject_file=None):
+    """
+    Read and yield (row number, namedtuple) for entries from filename
+
+    Row numbers count data rows starting at 1 so they can be used as a
+    checkpoint position.  The first start_row rows are skipped without being
+    parsed.
+
+    The file is read only once so it can be a stream like stdin.
+
+    if use_cache is True the parsed rows are loaded from/stored in the parsed
+    input cache.
+
+    Rows not passing record_filter, a filters.Filter, are dropped before
+    they are turned into entries.  Rows that can't be parsed raise ValueError
+    or are skipped into reject_file, a rejects.RejectFile, if given.
     """
 
     def _sanitize_fields(fields):
@@ -152,39 +263,273 @@ def read_entries(filename, start_date=None):
         return [paren.sub('', field).replace(' ', '_') for field in fields]
 
 
-    with open(filename, 'r') as file_obj:
-        csv_reader = csv.reader(file_obj, delimiter=';')
+    if use_cache:
+        # Rows skipped in tolerant mode are missing from the cached records
+        settings = {'tolerant': True} if reject_file is not None else {}
+        rows = cache.cached_records(
+                    SERVICENAME, filename, PARSER_VERSION, settings,
+                    lambda filename: _parse_rows(filename,
+                                                 reject_file=reject_file))
+    else:
+        rows = _parse_rows(filename, start_row, reject_file)
+
+    rows = iter(rows)
+    _, _, header = rows.next()
+
+    # Create named tuple then use it's API to convert to a dict we can easily
+    # expand to format the entry text without hardcoding any names in the code
+    # itself.  We are heavily dependent on the names in the entry template
+    # matching the header line though.
+    sleep = collections.namedtuple('sleep', _sanitize_fields(header))
+
+    keep = record_filter and record_filter.row_predicate(header, 'Start',
+                                                         _entry_key)
+
+    for row_num, start_sleep, row in rows:
+        if row_num <= start_row:
+            continue
+
+        if start_date is not None and start_sleep < start_date:
+            continue
+
+        if keep is None or keep(row):
+            yield row_num, sleep(*row)
+
+
+def _parse_row(row, fields, start):
+    """
+    Return sleep start datetime of row with fields columns, start being the
+    index of the Start column, raise ValueError for bad rows
+    """
+
+    if len(row) != fields:
+        raise ValueError('%d fields instead of %d' % (len(row), fields))
+
+    return datetime.strptime(row[start], '%Y-%m-%d %H:%M:%S')
+
+
+def _parse_chunk(task):
+    """
+    Return list of (sleep start, row, ValueError or None) for the rows in
+    byte range [begin, end) of filename
+    """
+
+    filename, begin, end, fields, start = task
+    parsed = []
+
+    with MappedFile(filename) as mapped:
+        for row in csv.reader(mapped.lines(begin, end), delimiter=';'):
+            try:
+                parsed.append((_parse_row(row, fields, start), row, None))
+            except ValueError as err:
+                parsed.append((None, row, err))
+
+    return parsed
+
+
+def _parse_in_parallel(filename, mapped):
+    """
+    True if the rest of mapped after its offset should be parsed in chunks
+    by several processes
+
+    Only exports without quotes are split, so every line is a row and chunks
+    can be parsed on their own.
+    """
+
+    return (multiprocessing.cpu_count() > 1 and
+            not inputs.is_stream(filename) and
+            mapped.size - mapped.offset >= PARALLEL_SIZE and
+            mapped.find('"', mapped.offset) == -1)
+
+
+def _parse_chunks(filename, mapped, fields, start):
+    """
+    Yield (sleep start, row, ValueError or None) for the rows of mapped after
+    its offset, parsed by a process per CPU
+    """
+
+    jobs = multiprocessing.cpu_count()
+    tasks = [(filename, begin, end, fields, start)
+             for begin, end in mapped.split(jobs * CHUNKS_PER_JOB,
+                                            mapped.offset)]
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for parsed in pool.imap(_parse_chunk, tasks):
+            for result in parsed:
+                yield result
+    finally:
+        pool.terminate()
+
+
+def _parse_rows(filename, start_row=0, reject_file=None):
+    """
+    Parse CSV file and yield (0, None, header) followed by (row number, sleep
+    start, row) for all data rows after start_row
+
+    Bad rows are skipped into reject_file if given, they still count as rows.
+    Big exports are parsed by several processes, see PARALLEL_SIZE.
+    """
+
+    with inputs.open_input(filename) as mapped:
+        lines = mapped.lines()
+        csv_reader = csv.reader(lines, delimiter=';')
         header = csv_reader.next()
+        start = header.index('Start')
 
-        sleep = collections.namedtuple('sleep', _sanitize_fields(header))
+        yield 0, None, header
 
-        for row in csv_reader:
-            # Create named tuple then use it's API to convert to a dict we can
-            # easily expand to format the entry text without hardcoding any
-            # names in the code itself.  We are heavily dependent on the names
-            # in the entry template matching the header line though.
-            entry = sleep(*row)
+        if _parse_in_parallel(filename, mapped):
+            # Every line is a row, the skipped ones aren't split at all
+            for _ in itertools.islice(lines, start_row):
+                pass
 
-            start_sleep = datetime.strptime(entry.Start, '%Y-%m-%d %H:%M:%S')
+            chunks = _parse_chunks(filename, mapped, len(header), start)
+            rows = (((row_num, row_num + 1) + result) for row_num, result
+                    in enumerate(chunks, start_row + 1))
+        else:
+            rows = _read_rows(csv_reader, len(header), start, start_row)
 
-            if start_date is None or start_sleep >= start_date:
-                yield entry
+        for row_num, line_num, start_sleep, row, err in rows:
+            if err is not None:
+                if reject_file is None:
+                    raise err
 
+                reject_file.add(filename, 'line %d' % (line_num), err, row)
+                continue
+
+            yield row_num, start_sleep, row
 
-def main():
-    args = _parse_args()
 
-    if args['test']:
-        directory = './test'
+def _read_rows(csv_reader, fields, start, start_row=0):
+    """
+    Yield (row number, line number, sleep start, row, ValueError or None)
+    for the rows of csv_reader after start_row
+    """
+
+    for row_num, row in enumerate(csv_reader, 1):
+        if row_num <= start_row:
+            continue
+
         try:
-            os.mkdir(directory)
-        except OSError as err:
-            print 'Warning: %s' % (err)
-    else:
-        directory = DAYONE_ENTRIES
+            start_sleep = _parse_row(row, fields, start)
+        except ValueError as err:
+            yield row_num, csv_reader.line_num, None, row, err
+            continue
+
+        yield row_num, csv_reader.line_num, start_sleep, row, None
+
+
+def _entry_key(entry):
+    """Return key of entry for sharding and merging exports"""
+
+    # The whole row is the key, it's the only thing that is unique
+    return '|'.join(entry)
+
+
+def _read_source(args, start_row=0, reject_file=None):
+    """
+    Yield (row number, namedtuple) from the exports given in args
+
+    Several exports are merged by start time without duplicates, row numbers
+    count the merged entries then.  Bad rows are skipped into reject_file if
+    given.
+    """
+
+    record_filter = filters.Filter.from_args(args)
+    filenames = args['input_files']
+
+    if len(filenames) == 1:
+        return read_numbered_entries(filenames[0], args['since'], start_row,
+                                     args['cache'], record_filter,
+                                     reject_file)
+
+    def _read(filename):
+        """Yield entries of one export"""
+
+        for _, entry in read_numbered_entries(filename, args['since'], 0,
+                                              args['cache'], record_filter,
+                                              reject_file):
+            yield entry
+
+    entries = merge.unique(merge.merged(filenames, _read,
+                                        lambda entry: entry.Start),
+                           _entry_key, args['max_memory'])
+
+    return ((row_num, entry) for row_num, entry in enumerate(entries, 1)
+            if row_num > start_row)
+
+
+def import_entries(filename, directory, start_date=None, record_filter=None,
+                   template=TEMPLATE, reject_file=None):
+    """
+    Write an entry for every record in filename into directory and yield the
+    file names, used by dayonetools.api
+    """
+
+    output = staging.DirectOutput(directory)
+    for entry in read_entries(filename, start_date, record_filter,
+                              reject_file):
+        yield _create_entry(entry, output, template=template)
 
-    for entry in read_entries(args['input_file'], args['since']):
-        _create_entry(entry, directory, args['verbose'])
+
+def read_digest_days(filename, start_date=None, record_filter=None,
+                     reject_file=None):
+    """
+    Yield (YYYY-MM-DD, digest text) for every night in filename, in the order
+    of the file which is by date
+    """
+
+    for entry in read_entries(filename, start_date, record_filter,
+                              reject_file):
+        day_str = entry.Start.split(' ')[0]
+        yield day_str, DIGEST_TEMPLATE.format(**entry._asdict())
+
+
+def _preview(args):
+    """Print or keep the first entries of the input for inspection"""
+
+    template = templates.from_args(args, TEMPLATE)
+    reject_file = rejects.from_args(args, SERVICENAME)
+
+    with preview.Preview(args['preview'], args['sample']) as entries:
+        for _, entry in _read_source(args, reject_file=reject_file):
+            _create_entry(entry, entries, template=template)
+            if entries.done():
+                break
+
+    if reject_file is not None:
+        reject_file.close()
+
+
+def main():
+    args = _parse_args()
+    log.setup(args)
+
+    if args['preview']:
+        _preview(args)
+        return
+
+    directory = journal_folder(args, DAYONE_ENTRIES)
+    template = templates.from_args(args, TEMPLATE)
+
+    with ImportRun(SERVICENAME, args, directory,
+                   merge.source(args['input_files'])) as run:
+        if (args['progress'] and len(args['input_files']) == 1 and
+                not inputs.is_stream(args['input_files'][0])):
+            with inputs.open_input(args['input_files'][0]) as mapped:
+                # Every line but the header is a row
+                run.stats.set_total(mapped.count('\n') - 1, 'records_parsed')
+
+        for row_num, entry in _read_source(args, run.position or 0,
+                                           run.reject_file):
+            key = _entry_key(entry)
+            _create_entry(entry, run.output, run.entry_uuid(key), template)
+            run.stats.set('records_parsed', row_num)
+            run.written(row_num)
+
+            if run.store is not None:
+                _save_to_store(run.store, entry)
 
 
 if __name__ == '__main__':
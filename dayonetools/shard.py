@@ -0,0 +1,74 @@
+"""
+Deterministic sharding of imports across processes and hosts
+
+--shard i/N keeps only the records whose stable key hashes to shard i, with
+0 <= i < N.  Services writing one entry per day use the day as key so days
+stay whole, pedometerpp also keeps every weekly and monthly summary in one
+shard.  Running all N shards, in parallel on any number of machines, writes
+every entry exactly once.
+
+Sharded runs name entries after a UUID derived from the key instead of a
+random one, so the shards write disjoint files and a rerun of a shard
+overwrites what it wrote before.  Checkpoints, staging folders and upsert
+indexes are kept per shard so parallel shards don't share any state.
+"""
+
+import argparse
+import hashlib
+import uuid
+
+# Namespace for the UUIDs of sharded entries
+NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL,
+                       'https://github.com/durden/dayonetools')
+
+
+def _shard_spec(str_):
+    """Convert 'i/N' string to (i, N) tuple"""
+
+    try:
+        index, count = [int(part) for part in str_.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid shard, should be i/N')
+
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError('Shard i/N needs 0 <= i < N')
+
+    return index, count
+
+
+def add_arguments(parser):
+    """Add sharding related arguments to given argparse parser"""
+
+    parser.add_argument('--shard', default=None, type=_shard_spec,
+                        dest='shard', required=False, metavar='I/N',
+                        help=('Only import shard I of N (counting from 0) of '
+                              'the records, to split an import across '
+                              'processes'))
+
+
+def shard_of(key, count):
+    """Return shard number of key for count shards, same on every host"""
+
+    # hash() differs between builds and platforms, a digest doesn't
+    return int(hashlib.sha1(key).hexdigest()[:15], 16) % count
+
+
+def in_shard(spec, key):
+    """True if key belongs to shard spec, always True if spec is None"""
+
+    return spec is None or shard_of(key, spec[1]) == spec[0]
+
+
+def qualify(service, spec):
+    """Return service name to use for state kept per shard"""
+
+    if spec is None:
+        return service
+
+    return '%s-shard%dof%d' % (service, spec[0], spec[1])
+
+
+def entry_uuid(service, key):
+    """Return deterministic uuid string for the entry of key"""
+
+    return uuid.uuid5(NAMESPACE, '%s:%s' % (service, key)).hex
@@ -0,0 +1,343 @@
+"""
+Grouping records by key within a memory budget
+
+Services that have to see the whole input before writing the first entry,
+like habit_list grouping completions by day, collect the records in a
+Partitions object.  Without --max-memory that's just a dict of lists.  With a
+budget the records held in memory are estimated and once they grow past the
+budget they are written as one sorted run to a temporary SQLite file and
+dropped from memory.  items() merges the runs and what is still in memory
+back together in key order, so callers get every partition complete and
+sorted no matter how often it was spilled.
+
+Only the keys themselves always stay in memory, they are few compared to the
+records, e.g. one per day.  Timezones and other tzinfo objects referenced by
+the records are not written to the file either, they are shared with the
+records kept in memory.
+
+A KeySet remembers which records were seen already, e.g. when merging
+several exports.  It only keeps a short digest of every key and moves them
+into an indexed temporary SQLite file beyond the budget, too.
+"""
+
+import argparse
+import cPickle
+import cStringIO
+import datetime
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+
+LOG = logging.getLogger(__name__)
+
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+# Bytes of the MD5 of a key kept by KeySet, collisions are unlikely below
+# hundreds of millions of keys
+DIGEST_SIZE = 8
+
+# Memory used by a digest in a KeySet including its share of the hash table
+_DIGEST_MEMORY = sys.getsizeof('\0' * DIGEST_SIZE) + 32
+
+
+def _memory_size(str_):
+    """Convert size string like 512M or 2G to number of bytes"""
+
+    str_ = str_.strip().upper().rstrip('B')
+    unit = str_[-1:] if str_[-1:] in _UNITS else ''
+
+    try:
+        size = int(float(str_[:len(str_) - len(unit)]) * _UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'Invalid size, should be bytes or a number with K, M or G')
+
+    if size <= 0:
+        raise argparse.ArgumentTypeError('Size must be positive')
+
+    return size
+
+
+def add_arguments(parser):
+    """Add memory budget related arguments to given argparse parser"""
+
+    parser.add_argument('--max-memory', default=None, type=_memory_size,
+                        dest='max_memory', required=False, metavar='SIZE',
+                        help=('Spill grouped records and the keys of merged '
+                              'exports to a temporary file beyond about SIZE '
+                              'bytes, e.g. 256M'))
+
+
+def estimate_size(obj):
+    """Estimate memory used by obj and the objects it directly contains"""
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        return size + sum(sys.getsizeof(key) + sys.getsizeof(value)
+                          for key, value in obj.iteritems())
+
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        return size + sum(sys.getsizeof(item) for item in obj)
+
+    return size
+
+
+def _temp_database(schema):
+    """Return (connection, file name) of a new temporary SQLite file"""
+
+    handle, file_name = tempfile.mkstemp(prefix='dayonetools-',
+                                         suffix='.spill')
+    os.close(handle)
+
+    database = sqlite3.connect(file_name)
+    database.execute('PRAGMA journal_mode = OFF')
+    database.execute('PRAGMA synchronous = OFF')
+    database.execute(schema)
+
+    return database, file_name
+
+
+class Partitions(object):
+    """
+    Values grouped by sortable key, spilled to disk beyond max_memory bytes
+
+    With unique=True every value is only kept once per key like in a set.
+    """
+
+    def __init__(self, max_memory=None, unique=False):
+        self.max_memory = max_memory
+        self.unique = unique
+        self.count = 0
+        self.runs = 0
+
+        self._keys = set()
+        self._memory = {}
+        self._size = 0
+        self._db = None
+        self._file_name = None
+
+        # Objects referenced instead of pickled, by their id()
+        self._shared = {}
+        self._buffer = cStringIO.StringIO()
+        self._pickler = cPickle.Pickler(self._buffer, 2)
+        self._pickler.persistent_id = self._persistent_id
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(sorted(self._keys))
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, key, value):
+        """Add value to the partition of key"""
+
+        partition = self._memory.get(key)
+        if partition is None:
+            partition = self._memory[key] = set() if self.unique else []
+            self._keys.add(key)
+
+        if self.unique:
+            partition.add(value)
+        else:
+            partition.append(value)
+
+        self.count += 1
+
+        if self.max_memory is not None:
+            self._size += estimate_size(value)
+            if self._size > self.max_memory:
+                self.spill()
+
+    def spill(self):
+        """Write everything held in memory as a sorted run to the file"""
+
+        if not self._memory:
+            return
+
+        if self._db is None:
+            self._db, self._file_name = _temp_database(
+                            'CREATE TABLE spill (run INTEGER, seq INTEGER, '
+                            'record BLOB, PRIMARY KEY (run, seq))')
+
+        rows = ((self.runs, seq, sqlite3.Binary(self._dumps((key, values))))
+                for seq, (key, values) in enumerate(
+                                            sorted(self._memory.iteritems())))
+
+        with self._db:
+            self._db.executemany('INSERT INTO spill VALUES (?, ?, ?)', rows)
+
+        LOG.debug('Spilled run %d of %d partitions, about %d bytes',
+                  self.runs, len(self._memory), self._size)
+
+        self.runs += 1
+        self._memory = {}
+        self._size = 0
+
+    def items(self):
+        """
+        Yield (key, values) for all partitions in key order
+
+        values is a set with unique=True and a list otherwise.
+        """
+
+        # Parts of the same key come in run order, the order they were added
+        sources = [self._read_run(run) for run in xrange(self.runs)]
+        sources.append((key, self.runs, values) for key, values
+                       in sorted(self._memory.iteritems()))
+
+        for key, parts in itertools.groupby(heapq.merge(*sources),
+                                            key=lambda part: part[0]):
+            parts = [part for _, _, part in parts]
+            if len(parts) == 1:
+                yield key, parts[0]
+            elif self.unique:
+                yield key, set().union(*parts)
+            else:
+                yield key, [value for part in parts for value in part]
+
+    def _read_run(self, run):
+        """Yield (key, run, values) of a spilled run in key order"""
+
+        cursor = self._db.execute(
+                    'SELECT record FROM spill WHERE run = ? ORDER BY seq',
+                    (run,))
+        for (record,) in cursor:
+            key, values = self._loads(record)
+            yield key, run, values
+
+    def close(self):
+        """Drop everything and remove the temporary file"""
+
+        self._memory = {}
+        self._keys = set()
+        self._shared = {}
+
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.remove(self._file_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _persistent_id(self, obj):
+        """Reference tzinfo objects instead of pickling them over and over"""
+
+        if isinstance(obj, datetime.tzinfo):
+            self._shared[id(obj)] = obj
+            return str(id(obj))
+
+        return None
+
+    def _dumps(self, obj):
+        """Pickle obj with the shared objects replaced by references"""
+
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._pickler.clear_memo()
+        self._pickler.dump(obj)
+
+        return self._buffer.getvalue()
+
+    def _loads(self, str_):
+        """Unpickle str_ pickled by _dumps()"""
+
+        unpickler = cPickle.Unpickler(cStringIO.StringIO(str_))
+        unpickler.persistent_load = lambda pid: self._shared[int(pid)]
+
+        return unpickler.load()
+
+
+class KeySet(object):
+    """
+    Set of string keys, spilled to disk beyond max_memory bytes
+
+    Only the first DIGEST_SIZE bytes of the MD5 of every key are kept.  Once
+    they grow past the budget they are moved into a temporary SQLite file
+    where add() looks up keys not found in memory.
+    """
+
+    def __init__(self, max_memory=None):
+        self.max_memory = max_memory
+        self.count = 0
+        self.runs = 0
+
+        self._memory = set()
+        self._db = None
+        self._file_name = None
+
+    def __len__(self):
+        return self.count
+
+    def add(self, key):
+        """Add key, return False if it was added before"""
+
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+
+        digest = hashlib.md5(key).digest()[:DIGEST_SIZE]
+        if digest in self._memory:
+            return False
+
+        if self._db is not None and self._db.execute(
+                    'SELECT 1 FROM keys WHERE digest = ?',
+                    (sqlite3.Binary(digest),)).fetchone() is not None:
+            return False
+
+        self._memory.add(digest)
+        self.count += 1
+
+        if (self.max_memory is not None and
+                len(self._memory) * _DIGEST_MEMORY > self.max_memory):
+            self.spill()
+
+        return True
+
+    def spill(self):
+        """Move the digests held in memory into the file"""
+
+        if not self._memory:
+            return
+
+        if self._db is None:
+            self._db, self._file_name = _temp_database(
+                        'CREATE TABLE keys (digest BLOB PRIMARY KEY) '
+                        'WITHOUT ROWID')
+
+        with self._db:
+            self._db.executemany('INSERT INTO keys VALUES (?)',
+                                 ((sqlite3.Binary(digest),)
+                                  for digest in sorted(self._memory)))
+
+        LOG.debug('Spilled run %d of %d keys', self.runs, len(self._memory))
+
+        self.runs += 1
+        self._memory = set()
+
+    def close(self):
+        """Drop everything and remove the temporary file"""
+
+        self._memory = set()
+
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.remove(self._file_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,328 @@
+"""
+Staged output to keep Dropbox/iCloud sync clients calm during big imports
+
+Writing entries straight into a synced journal folder wakes the sync daemon
+for every single file.  In staging mode entries are written at full speed into
+a local staging folder and a background thread moves them into the journal in
+bursts of atomic renames with a pause between bursts.
+
+The staging folder must be on the same filesystem as the journal for the moves
+to be atomic renames, otherwise we fall back to copying with a warning.
+
+Without staging entries are written into an incoming folder and renamed into
+the journal right away.  Services hand every entry to add_entry() or
+add_plist() of the output, which writes it into the folder of the output.
+Either way every entry goes through the manifest of the run, which keeps the
+prior version of entries that are replaced so the run can be rolled back, see
+dayonetools.manifest.
+"""
+
+import logging
+import os
+import Queue
+import shutil
+import tempfile
+import threading
+import time
+
+from dayonetools import journaldb
+from dayonetools import manifest
+from dayonetools.services import get_state_folder
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_BURST_SIZE = 500
+DEFAULT_BURST_PAUSE = 2.0
+
+# Sentinel telling the mover thread no more files will arrive
+_DONE = None
+
+
+def add_arguments(parser):
+    """Add staging related arguments to given argparse parser"""
+
+    parser.add_argument('--stage', default=False, action='store_true',
+                        dest='stage', required=False,
+                        help=('Write entries into a local staging folder and '
+                              'move them into the journal in bursts'))
+
+    parser.add_argument('--stage-dir', default=None, action='store',
+                        dest='stage_dir', required=False,
+                        help=('Staging folder, must be on the same filesystem '
+                              'as the journal, default: state folder'))
+
+    parser.add_argument('--burst-size', default=DEFAULT_BURST_SIZE, type=int,
+                        dest='burst_size', required=False,
+                        help=('Number of entries moved per burst, default: '
+                              '%d' % (DEFAULT_BURST_SIZE)))
+
+    parser.add_argument('--burst-pause', default=DEFAULT_BURST_PAUSE,
+                        type=float, dest='burst_pause', required=False,
+                        help=('Seconds to wait between bursts, default: '
+                              '%.1f' % (DEFAULT_BURST_PAUSE)))
+
+
+def get_output(service, directory, args):
+    """
+    Return output object for given journal directory according to the staging
+    arguments in args, entries are recorded in a new run manifest
+
+    With --journal-db entries go into that database instead, such runs have
+    no manifest.
+    """
+
+    if args.get('journal_db'):
+        return journaldb.JournalDBOutput(
+                    args['journal_db'],
+                    args.get('journal_db_batch', journaldb.DEFAULT_BATCH_SIZE))
+
+    run = manifest.Manifest(service, directory)
+
+    if not args.get('stage'):
+        return DirectOutput(directory, run, service)
+
+    stager = Stager(service, directory, args.get('stage_dir'),
+                    args.get('burst_size', DEFAULT_BURST_SIZE),
+                    args.get('burst_pause', DEFAULT_BURST_PAUSE), run)
+    stager.recover()
+    return stager
+
+
+def _close_manifest(run):
+    """Close manifest of a run if there is one and log its id"""
+
+    if run is not None:
+        run.close()
+        LOG.info('Run %s wrote %d entries', run.run_id, run.count)
+
+
+def _same_filesystem(folder, destination):
+    """True if files can be renamed from folder into destination"""
+
+    return os.stat(folder).st_dev == os.stat(destination).st_dev
+
+
+class FolderOutput(object):
+    """
+    Base of the outputs writing entry files into their folder
+
+    Subclasses set folder and implement add() taking every file written into
+    it.  on_written is called with the path of every file written if set.
+    """
+
+    folder = None
+    on_written = None
+
+    def add_entry(self, file_name, template, values):
+        """
+        Write entry of templates.Template template with values as file_name
+        and return the name it has in the journal
+        """
+
+        return self._written(journaldb.write_entry(self.folder, file_name,
+                                                   template.render(values)))
+
+    def add_plist(self, file_name, entry):
+        """Write entry given as plist dict, see add_entry()"""
+
+        return self._written(journaldb.write_plist(self.folder, file_name,
+                                                   entry))
+
+    def _written(self, full_file_name):
+        """Hand file written into folder on to add()"""
+
+        if self.on_written is not None:
+            self.on_written(full_file_name)
+
+        return self.add(full_file_name)
+
+    def add(self, file_name):
+        """Return final name for file written into our folder"""
+
+        raise NotImplementedError
+
+
+class DirectOutput(FolderOutput):
+    """
+    Output writing entries straight into the journal
+
+    With the manifest run of the import entries are written into an incoming
+    folder of their own and add() moves each one into the journal through the
+    manifest.  Entries an interrupted run never added are written again from
+    its checkpoint.
+    """
+
+    def __init__(self, directory, run=None, service=None):
+        self.destination = directory
+        self.run = run
+        self.folder = directory
+
+        if run is not None:
+            # One folder per run so runs of the same service can overlap
+            self.folder = tempfile.mkdtemp(
+                            prefix='run-', dir=get_state_folder('incoming',
+                                                                service))
+            self._move = os.rename
+            if not _same_filesystem(self.folder, directory):
+                LOG.info('Incoming folder %s is not on the same filesystem '
+                         'as %s, entries will be copied', self.folder,
+                         directory)
+                self._move = shutil.move
+
+    def add(self, file_name):
+        """Return final name for file written into our folder"""
+
+        if self.run is None:
+            return file_name
+
+        dst = os.path.join(self.destination, os.path.basename(file_name))
+        self.run.place(file_name, dst, self._move)
+
+        return dst
+
+    def pending(self):
+        """Number of entries waiting to be moved, always 0"""
+
+        return 0
+
+    def flush(self):
+        """Nothing buffered to write"""
+
+    def close(self):
+        """Close the manifest and remove the incoming folder of the run"""
+
+        try:
+            _close_manifest(self.run)
+        finally:
+            if self.run is not None:
+                shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class Stager(FolderOutput):
+    """
+    Output writing entries into a staging folder and moving them into the
+    journal in bursts from a background thread
+
+    close() must be called at the end to move the remaining entries.
+    """
+
+    def __init__(self, service, destination, folder=None,
+                 burst_size=DEFAULT_BURST_SIZE, pause=DEFAULT_BURST_PAUSE,
+                 run=None):
+        if folder is None:
+            folder = get_state_folder('staging', service)
+        elif not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.folder = folder
+        self.destination = destination
+        self.run = run
+        self.burst_size = max(1, burst_size)
+        self.pause = pause
+        self.same_filesystem = _same_filesystem(folder, destination)
+
+        if not self.same_filesystem:
+            LOG.warning('Staging folder %s is not on the same filesystem as '
+                        '%s, entries will be copied instead of renamed',
+                        folder, destination)
+
+        self.moved = 0
+        self.bursts = 0
+        self._started = time.time()
+        self._error = None
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._mover)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def recover(self):
+        """Queue entries left behind in staging by an interrupted run"""
+
+        for name in sorted(os.listdir(self.folder)):
+            if name.endswith('.doentry'):
+                self._queue.put(name)
+
+    def add(self, file_name):
+        """
+        Schedule staged file_name to be moved into the journal and return the
+        name it will have there
+        """
+
+        if self._error is not None:
+            raise self._error
+
+        name = os.path.basename(file_name)
+        self._queue.put(name)
+
+        return os.path.join(self.destination, name)
+
+    def pending(self):
+        """Number of entries waiting to be moved into the journal"""
+
+        return self._queue.qsize()
+
+    def flush(self):
+        """
+        Nothing buffered to write, entries already in staging are recovered
+        by the next run
+        """
+
+    def close(self):
+        """Move all remaining entries, wait for it and report throughput"""
+
+        self._queue.put(_DONE)
+        self._thread.join()
+        _close_manifest(self.run)
+
+        if self._error is not None:
+            raise self._error
+
+        elapsed = max(time.time() - self._started, 1e-6)
+        LOG.info('Moved %d entries into %s in %d bursts, %.1f entries/sec',
+                 self.moved, self.destination, self.bursts,
+                 self.moved / elapsed)
+
+    def _mover(self):
+        """Collect staged names and move them in bursts until done"""
+
+        burst = []
+        done = False
+
+        while not done:
+            name = self._queue.get()
+            if name is _DONE:
+                done = True
+            else:
+                burst.append(name)
+
+            if burst and (done or len(burst) >= self.burst_size):
+                try:
+                    self._move(burst)
+                except (IOError, OSError) as err:
+                    self._error = err
+                    return
+
+                burst = []
+                if not done:
+                    time.sleep(self.pause)
+
+    def _move(self, names):
+        """Move given staged file names into the journal folder"""
+
+        for name in names:
+            src = os.path.join(self.folder, name)
+            dst = os.path.join(self.destination, name)
+
+            # Names can be queued twice when a recovered entry was written
+            # again under the same name, the first move took care of it.
+            if not os.path.exists(src):
+                continue
+
+            move = os.rename if self.same_filesystem else shutil.move
+            if self.run is not None:
+                self.run.place(src, dst, move)
+            else:
+                move(src, dst)
+
+        self.moved += len(names)
+        self.bursts += 1
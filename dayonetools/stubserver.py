@@ -0,0 +1,128 @@
+"""
+Local HTTP server replaying recorded web API pages
+
+Used to try, test and benchmark the --api sources of the services without
+network access or an account:
+
+    python -m dayonetools.stubserver recorded/ --port 8000
+    python -m dayonetools.main nikeplus --api http://127.0.0.1:8000 -t
+
+Every file in the folder is the body of one recorded response, named after the
+quoted request path and query it answers plus '.json', e.g. for
+'/me/sport/activities?count=100&offset=1':
+
+    %2Fme%2Fsport%2Factivities%3Fcount%3D100%26offset%3D1.json
+
+Requests without a recording get a 404.  Connections are kept alive like with
+the real APIs and --delay adds latency to every response to see the effect of
+--api-concurrency.
+"""
+
+import argparse
+import BaseHTTPServer
+import os
+import SocketServer
+import threading
+import time
+import urllib
+
+
+def recording_name(path):
+    """Return file name of the recorded response for request path"""
+
+    return urllib.quote(path, safe='') + '.json'
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer GET requests with the recorded responses of the server"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        file_name = os.path.join(self.server.folder, recording_name(self.path))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        if not os.path.exists(file_name):
+            self.send_error(404, 'No recording for %s' % (self.path))
+            return
+
+        with open(file_name, 'rb') as file_obj:
+            body = file_obj.read()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format,
+                                                              *args)
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded HTTP server replaying the recordings in folder"""
+
+    daemon_threads = True
+
+    def __init__(self, folder, port=0, delay=0.0, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port),
+                                           _Handler)
+        self.folder = folder
+        self.delay = delay
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        """Base URL to pass to --api"""
+
+        return 'http://%s:%d' % self.server_address
+
+    def start(self):
+        """Serve from a background thread, used when embedding the server"""
+
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    def stop(self):
+        """Stop serving started with start()"""
+
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                        description='Replay recorded web API pages locally')
+
+    parser.add_argument('folder', help='Folder with the recorded responses')
+
+    parser.add_argument('-p', '--port', default=8000, type=int,
+                        help='Port to listen on, default: 8000')
+
+    parser.add_argument('--delay', default=0.0, type=float,
+                        help='Seconds to wait before every response')
+
+    parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                        help='Log every request')
+
+    args = parser.parse_args()
+
+    server = StubServer(args.folder, args.port, args.delay, args.verbose)
+    print 'Replaying %s at %s' % (args.folder, server.url)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Entry templates compiled into render functions
+
+Every service renders its entries from ENTRY_TEMPLATE with the fields of a
+record, using str.format() syntax.  --template FILE replaces it with a template
+of your own and --title TEXT the HEADER_FOR_DAYONE_ENTRIES it gets as
+{entry_title}, so the service files don't have to be edited anymore.  Using
+a field the service doesn't have is an error listing the fields it has.
+
+A template is checked against the fields of the service once and compiled into
+a function that joins the literal text between the fields and their values,
+instead of parsing the format string again for every entry.  Compiled
+templates from files are kept in the templates state folder under the hash of
+the template, so later runs with the same template skip the compiling too.
+"""
+
+import hashlib
+import imp
+import marshal
+import os
+import string
+
+from dayonetools.services import get_state_folder
+
+# Part of the cache key, change when the generated code changes
+COMPILER_VERSION = 1
+
+
+def add_arguments(parser):
+    """Add template related arguments to given argparse parser"""
+
+    parser.add_argument('--template', default=None, action='store',
+                        dest='template', required=False, metavar='FILE',
+                        help=('Render entries with the str.format() template '
+                              'in FILE instead of the built-in one'))
+
+    parser.add_argument('--title', default=None, action='store',
+                        dest='title', required=False,
+                        help=('Title of the entries, {entry_title} in '
+                              'templates'))
+
+
+def _source(text, fields, name):
+    """
+    Return Python source of the render function for template text, raises
+    ValueError if the template isn't valid or uses fields not in fields
+    """
+
+    try:
+        parsed = list(string.Formatter().parse(text))
+    except ValueError as err:
+        raise ValueError('%s: %s' % (name, err))
+
+    pieces = []
+    literals = []
+    accessors = []
+
+    for literal, field, spec, conversion in parsed:
+        if literal:
+            pieces.append(repr(literal))
+        literals.append(literal.replace('%', '%%'))
+        if field is None:
+            continue
+
+        if field not in fields:
+            raise ValueError('%s: unknown field {%s}, fields are: %s' % (
+                             name, field, ', '.join(sorted(fields))))
+
+        if '{' in spec:
+            raise ValueError('%s: nested field in format spec of {%s}' % (
+                             name, field))
+
+        accessor = 'values[%r]' % (field)
+        if conversion == 'r':
+            accessor = 'repr(%s)' % (accessor)
+        elif conversion == 's':
+            accessor = 'str(%s)' % (accessor)
+        elif conversion is not None:
+            raise ValueError('%s: unknown conversion !%s of {%s}' % (
+                             name, conversion, field))
+
+        if spec:
+            accessor = 'format(%s, %r)' % (accessor, spec)
+
+        pieces.append(accessor)
+        literals.append('%s')
+        accessors.append(accessor)
+
+    if not accessors:
+        text = ''.join(literal for literal, _, _, _ in parsed)
+        return 'def render(values):\n    return %r\n' % (text,)
+
+    # Joining the pieces copies every one once, the % of fields which aren't
+    # strings is still way faster than str.format()
+    return ('def render(values):\n'
+            '    try:\n'
+            '        return \'\'.join((%s,))\n'
+            '    except TypeError:\n'
+            '        return %r %% (%s,)\n' % (', '.join(pieces),
+                                              ''.join(literals),
+                                              ', '.join(accessors)))
+
+
+def _cache_path(text, fields):
+    """Return file name of the compiled template text for fields"""
+
+    key = hashlib.sha1('\0'.join([imp.get_magic(), str(COMPILER_VERSION),
+                                  text] + sorted(fields))).hexdigest()
+
+    return os.path.join(get_state_folder('templates'), key + '.code')
+
+
+def _compiled(text, fields, name, use_cache):
+    """Return code object of the render function of template text"""
+
+    path = use_cache and _cache_path(text, fields)
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'rb') as file_obj:
+                return marshal.load(file_obj)
+        except (EOFError, ValueError, TypeError):
+            # Truncated or from another Python, compiled again below
+            pass
+
+    code = compile(_source(text, fields, name), name, 'exec')
+
+    if path:
+        temp_name = path + '.tmp'
+        with open(temp_name, 'wb') as file_obj:
+            marshal.dump(code, file_obj)
+        os.rename(temp_name, path)
+
+    return code
+
+
+class Template(object):
+    """
+    Entry template compiled for the given fields
+
+    render(values) returns the text of an entry, values is a dict with every
+    field the template uses.  title is the {entry_title} for values.
+    """
+
+    def __init__(self, text, fields, title, name='<template>',
+                 use_cache=False):
+        self.text = text
+        self.fields = frozenset(fields) | frozenset(['entry_title'])
+        self.title = title
+
+        namespace = {}
+        exec _compiled(text, self.fields, name, use_cache) in namespace
+        self.render = namespace['render']
+
+
+def from_args(args, default):
+    """
+    Return Template of the --template and --title arguments in args, default
+    is the built-in Template of the service
+    """
+
+    if not args.get('template') and not args.get('title'):
+        return default
+
+    title = args.get('title') or default.title
+    if not args.get('template'):
+        return Template(default.text, default.fields, title)
+
+    with open(args['template'], 'r') as file_obj:
+        text = file_obj.read()
+
+    return Template(text, default.fields, title, args['template'],
+                    use_cache=True)
@@ -0,0 +1,171 @@
+"""
+Timezone timeline for travel-aware conversion of UTC timestamps
+
+Services that convert UTC timestamps into the user's local day assume one
+timezone for the whole history.  A timeline file lists the periods spent in
+other timezones, one per line:
+
+    # START       [END]        ZONE
+    2014-03-01    2014-03-15   America/New_York
+    2014-06-01                 Asia/Tokyo
+
+Dates are local to the zone of their line, END is inclusive and a period
+without END lasts until the start of the next one.  Any time not covered by a
+period uses the default timezone.
+
+The periods are compiled into a sorted list of UTC boundaries so each lookup
+is a binary search, and conversions of many timestamps are batched per period.
+"""
+
+import bisect
+from datetime import datetime, timedelta
+import hashlib
+
+from dateutil import tz
+
+
+def add_arguments(parser):
+    """Add timeline related arguments to given argparse parser"""
+
+    parser.add_argument('--timeline', default=None, action='store',
+                        dest='timeline', required=False,
+                        help=("Timezone timeline file with lines of "
+                              "'START [END] ZONE' for periods spent in "
+                              "other timezones"))
+
+
+def _utc_midnight(day_str, zone):
+    """Return naive UTC datetime of midnight starting day_str in zone"""
+
+    local = datetime.strptime(day_str, '%Y-%m-%d').replace(tzinfo=zone)
+    return local.astimezone(tz.tzutc()).replace(tzinfo=None)
+
+
+class Timeline(object):
+    """
+    Sorted interval index mapping naive UTC datetimes to timezone names
+
+    periods is a list of (start, end, zone name) with start and end as
+    'YYYY-MM-DD' strings local to the zone, end can be None.
+    """
+
+    def __init__(self, default, periods=()):
+        self.default = default
+        self._zones = {}
+        self.digest = hashlib.sha1(
+                            repr((default, sorted(periods)))).hexdigest()
+
+        # Resolve every period into UTC start and end, open periods end with
+        # the start of the next one.
+        resolved = []
+        periods = sorted(periods)
+        for num, (start, end, zone) in enumerate(periods):
+            start_utc = _utc_midnight(start, self.tz(zone))
+
+            if end is not None:
+                end = (datetime.strptime(end, '%Y-%m-%d') +
+                       timedelta(days=1)).strftime('%Y-%m-%d')
+                end_utc = _utc_midnight(end, self.tz(zone))
+            elif num + 1 < len(periods):
+                next_start, _, next_zone = periods[num + 1]
+                end_utc = _utc_midnight(next_start, self.tz(next_zone))
+            else:
+                end_utc = datetime.max
+
+            resolved.append((start_utc, end_utc, zone))
+
+        # Flatten into boundaries where boundary i starts zone i.  Gaps go
+        # back to the default and overlapping periods are cut off by the
+        # later one.
+        self._starts = []
+        self._names = []
+        for num, (start_utc, end_utc, zone) in enumerate(resolved):
+            if num + 1 < len(resolved):
+                end_utc = min(end_utc, resolved[num + 1][0])
+
+            if start_utc >= end_utc:
+                continue
+
+            self._starts.append(start_utc)
+            self._names.append(zone)
+
+            if end_utc != datetime.max:
+                self._starts.append(end_utc)
+                self._names.append(default)
+
+    @classmethod
+    def load(cls, filename, default):
+        """Create timeline from given file, no periods if filename is None"""
+
+        if filename is None:
+            return cls(default)
+
+        periods = []
+        with open(filename, 'r') as file_obj:
+            for line_num, line in enumerate(file_obj, 1):
+                fields = line.split('#')[0].split()
+                if not fields:
+                    continue
+
+                if len(fields) == 2:
+                    fields.insert(1, None)
+                elif len(fields) != 3:
+                    raise ValueError('%s:%d: expected START [END] ZONE' % (
+                        filename, line_num))
+
+                start, end, zone = fields
+                if tz.gettz(zone) is None:
+                    raise ValueError('%s:%d: unknown timezone %s' % (
+                        filename, line_num, zone))
+
+                periods.append((start, end, zone))
+
+        return cls(default, periods)
+
+    def tz(self, name):
+        """Return tzinfo object for given zone name"""
+
+        try:
+            return self._zones[name]
+        except KeyError:
+            zone = self._zones[name] = tz.gettz(name)
+            return zone
+
+    def zone_name_at(self, utc_dt):
+        """Return name of timezone for naive UTC datetime"""
+
+        num = bisect.bisect_right(self._starts, utc_dt) - 1
+        return self.default if num < 0 else self._names[num]
+
+    def convert(self, utc_dts):
+        """
+        Convert list of naive UTC datetimes into list of (zone name, aware
+        local datetime) in the same order
+
+        The datetimes are walked in sorted order so the period only changes at
+        its boundaries instead of being looked up for every datetime.
+        """
+
+        utc = tz.tzutc()
+        result = [None] * len(utc_dts)
+        order = sorted(xrange(len(utc_dts)), key=utc_dts.__getitem__)
+
+        num = -1
+        name = self.default
+        zone = self.tz(name)
+        next_start = self._starts[0] if self._starts else datetime.max
+
+        for index in order:
+            utc_dt = utc_dts[index]
+
+            if utc_dt >= next_start:
+                num = bisect.bisect_right(self._starts, utc_dt) - 1
+                name = self._names[num]
+                zone = self.tz(name)
+                next_start = (self._starts[num + 1]
+                              if num + 1 < len(self._starts) else datetime.max)
+
+            result[index] = (name,
+                             utc_dt.replace(tzinfo=utc).astimezone(zone))
+
+        return result
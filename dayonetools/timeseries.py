@@ -0,0 +1,161 @@
+"""
+Local SQLite store of the numeric data seen by the services
+
+Besides rendering Day One entries, services can write their normalized records
+into one SQLite database with --store.  Every service has its own table
+indexed by time and day so cross-service questions are plain indexed queries
+instead of parsing all the raw exports again, e.g.:
+
+    SELECT * FROM weekly_summary WHERE week >= '2014-01';
+
+Records are inserted in batches inside a transaction.  Re-importing the same
+data replaces the existing rows instead of duplicating them.
+"""
+
+import sqlite3
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Columns for every service table, 'time' and 'day' are always first.  Times
+# are 'YYYY-MM-DD HH:MM:SS' strings as recorded by the service and day is the
+# 'YYYY-MM-DD' part of it.
+TABLES = {
+    'habit_list': ('habit TEXT', ),
+    'nikeplus': ('device TEXT', 'steps INTEGER', 'fuel INTEGER',
+                 'calories INTEGER', 'distance REAL'),
+    'pedometerpp': ('steps INTEGER', ),
+    'sleep_cycle': ('wake TEXT', 'quality INTEGER', 'time_in_bed INTEGER',
+                    'steps INTEGER'),
+}
+
+# Natural key of each table so re-imports replace rows
+KEYS = {
+    'habit_list': ('time', 'habit'),
+    'nikeplus': ('time', 'device'),
+    'pedometerpp': ('time', ),
+    'sleep_cycle': ('time', ),
+}
+
+WEEKLY_SUMMARY = """
+CREATE VIEW IF NOT EXISTS weekly_summary AS
+SELECT week,
+       SUM(steps) AS steps,
+       AVG(sleep_quality) AS sleep_quality,
+       AVG(time_in_bed) AS time_in_bed,
+       SUM(habits) AS habits
+FROM (
+    SELECT strftime('%Y-%W', day) AS week, steps, NULL AS sleep_quality,
+           NULL AS time_in_bed, 0 AS habits FROM pedometerpp
+    UNION ALL
+    SELECT strftime('%Y-%W', day), steps, NULL, NULL, 0 FROM nikeplus
+    UNION ALL
+    SELECT strftime('%Y-%W', day), NULL, quality, time_in_bed, 0
+    FROM sleep_cycle
+    UNION ALL
+    SELECT strftime('%Y-%W', day), NULL, NULL, NULL, 1 FROM habit_list
+)
+GROUP BY week
+"""
+
+
+def add_arguments(parser):
+    """Add time-series store related arguments to given argparse parser"""
+
+    parser.add_argument('--store', default=None, action='store',
+                        dest='store', required=False,
+                        help=('Also save the imported data into the given '
+                              'SQLite time-series database'))
+
+
+def open_store(args):
+    """Return TimeSeriesStore for --store in args or None if not given"""
+
+    if not args.get('store'):
+        return None
+
+    return TimeSeriesStore(args['store'])
+
+
+def to_float(value):
+    """Convert value like '2.7' or '85%' to float, None if not a number"""
+
+    try:
+        return float(str(value).strip().rstrip('%'))
+    except ValueError:
+        return None
+
+
+def to_int(value):
+    """Convert value like '5517' or '85%' to int, None if not a number"""
+
+    value = to_float(value)
+    return None if value is None else int(value)
+
+
+def to_minutes(value):
+    """Convert 'H:MM' duration to number of minutes, None if not valid"""
+
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except ValueError:
+        return None
+
+
+class TimeSeriesStore(object):
+    """SQLite database with one time indexed table per service"""
+
+    def __init__(self, filename, batch_size=DEFAULT_BATCH_SIZE):
+        self.filename = filename
+        self.batch_size = max(1, batch_size)
+        self._pending = dict((service, []) for service in TABLES)
+        self._count = 0
+
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+
+        with self.connection:
+            for service, columns in TABLES.iteritems():
+                self.connection.execute(
+                    'CREATE TABLE IF NOT EXISTS %s (time TEXT, day TEXT, %s, '
+                    'PRIMARY KEY (%s))' % (service, ', '.join(columns),
+                                           ', '.join(KEYS[service])))
+                self.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS %s_day ON %s (day)' % (
+                        service, service))
+
+            self.connection.execute(WEEKLY_SUMMARY)
+
+    def add(self, service, time, *values):
+        """
+        Queue a record for service at given time, values are the remaining
+        columns of the service table in order
+        """
+
+        self._pending[service].append((time, time[:10]) + values)
+        self._count += 1
+
+        if self._count >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert all queued records in one transaction"""
+
+        with self.connection:
+            for service, rows in self._pending.iteritems():
+                if not rows:
+                    continue
+
+                placeholders = ', '.join('?' * (len(TABLES[service]) + 2))
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO %s VALUES (%s)' % (
+                        service, placeholders), rows)
+                del rows[:]
+
+        self._count = 0
+
+    def close(self):
+        """Insert remaining records and close the database"""
+
+        self.flush()
+        self.connection.close()
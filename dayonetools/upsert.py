@@ -0,0 +1,133 @@
+"""
+Day level upserts for services writing one entry per day
+
+Without upserts every run creates a new entry for each day, so importing
+today's export after yesterday's duplicates all days that were imported
+before.  In upsert mode a SQLite index in the state folder maps every day
+already written to a journal folder to its entry UUID and the items (habits,
+lines) in it.  A day seen before is looked up in the index, only new items are
+merged in and that single entry is rewritten under its UUID.  No directory
+scanning or parsing of existing entries is needed.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from dayonetools.services import get_state_folder
+
+
+def add_arguments(parser):
+    """Add upsert related arguments to given argparse parser"""
+
+    parser.add_argument('--upsert', default=False, action='store_true',
+                        dest='upsert', required=False,
+                        help=('Merge new items into entries of days that were '
+                              'imported before instead of adding entries'))
+
+
+class DayIndex(object):
+    """
+    Index of the days a service wrote into a journal folder
+
+    Days are rows of a SQLite table keyed by day, so a put() only writes that
+    day.  Items are stored as JSON and kept as lists so they compare equal
+    after the round trip.
+    """
+
+    def __init__(self, service, directory, interval=100):
+        key = hashlib.sha1(os.path.abspath(directory)).hexdigest()[:16]
+        file_name = '%s-%s' % (service, key)
+
+        self.path = os.path.join(get_state_folder('index'), file_name + '.db')
+        self.interval = max(1, interval)
+        self._unsaved = 0
+
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS days (day TEXT PRIMARY KEY, '
+                'uuid TEXT, items TEXT)')
+
+        self._import_json(self.path[:-len('.db')] + '.json')
+
+    def _import_json(self, json_path):
+        """Move days of an index file written by older versions into table"""
+
+        if not os.path.exists(json_path):
+            return
+
+        with open(json_path, 'r') as file_obj:
+            days = json.load(file_obj)
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO days VALUES (?, ?, ?)',
+                ((day, record['uuid'], json.dumps(record['items']))
+                 for day, record in days.iteritems()))
+
+        os.remove(json_path)
+
+    def get(self, day):
+        """Return (uuid, items) recorded for day or None"""
+
+        row = self.connection.execute(
+                'SELECT uuid, items FROM days WHERE day = ?',
+                (day,)).fetchone()
+        if row is None:
+            return None
+
+        return row[0], json.loads(row[1])
+
+    def merge(self, day, items):
+        """
+        Return (uuid, items) to write for day
+
+        uuid is None for a day not in the index.  items is None if the day is
+        known and nothing new would be added, otherwise the existing items
+        followed by the new ones.
+        """
+
+        items = [list(item) if isinstance(item, tuple) else item
+                 for item in items]
+
+        record = self.get(day)
+        if record is None:
+            return None, items
+
+        uuid_str, existing = record
+        seen = set(tuple(item) if isinstance(item, list) else item
+                   for item in existing)
+        new_items = [item for item in items
+                     if (tuple(item) if isinstance(item, list) else item)
+                     not in seen]
+        if not new_items:
+            return uuid_str, None
+
+        return uuid_str, existing + new_items
+
+    def put(self, day, file_name, items):
+        """Record items written to entry file_name for day"""
+
+        uuid_str = os.path.splitext(os.path.basename(file_name))[0]
+        self.connection.execute(
+            'INSERT OR REPLACE INTO days VALUES (?, ?, ?)',
+            (day, uuid_str, json.dumps(items)))
+
+        self._unsaved += 1
+        if self._unsaved >= self.interval:
+            self.save()
+
+    def save(self):
+        """Commit days recorded since the last save"""
+
+        self.connection.commit()
+        self._unsaved = 0
+
+    def close(self):
+        """Commit pending days and close the database"""
+
+        self.save()
+        self.connection.close()
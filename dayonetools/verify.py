@@ -0,0 +1,251 @@
+"""
+Verify the entries written by import runs
+
+    dayonetools verify                  entries of the last run
+    dayonetools verify --run RUN_ID     entries of the given run
+    dayonetools verify FOLDER           every entry in a journal folder
+
+Every entry must be a well-formed plist with a UUID matching its file name,
+a creation date and at least one tag.  Entries listed in a run manifest must
+still exist with the checksum they were written with, for a folder the
+manifests of all runs that wrote into it are used.
+
+Files are checked by a pool of processes, one per core by default.  They are
+read in one go and run through an expat parser that only looks at the few
+keys checked instead of building the whole plist.
+"""
+
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import sys
+from xml.parsers import expat
+
+from dayonetools import log
+from dayonetools import manifest
+
+LOG = logging.getLogger(__name__)
+
+UUID_RE = re.compile('^[0-9a-fA-F]{32}$')
+
+DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$')
+
+# Entries are handed to the worker processes in chunks of this size
+CHUNK_SIZE = 64
+
+
+def _parse_args():
+    """Parse sys.argv arguments"""
+
+    parser = argparse.ArgumentParser(
+                        description='Verify entries written by import runs')
+
+    parser.add_argument('folder', nargs='?', default=None,
+                        help='Journal folder to verify completely')
+
+    parser.add_argument('--run', default=None, action='store',
+                        dest='run', required=False, metavar='RUN_ID',
+                        help='Only verify the entries of this run')
+
+    parser.add_argument('-j', '--jobs', default=multiprocessing.cpu_count(),
+                        type=int, dest='jobs', required=False,
+                        help=('Number of worker processes, default: one per '
+                              'core'))
+
+    parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                        dest='verbose', required=False,
+                        help='Verbose debugging information')
+
+    log.add_arguments(parser)
+
+    return vars(parser.parse_args())
+
+
+class _PlistKeys(object):
+    """expat handlers collecting the values of interesting top-level keys"""
+
+    KEYS = ('UUID', 'Creation Date', 'Tags')
+
+    def __init__(self):
+        self.values = {}
+        self._depth = 0
+        self._key = None
+        self._text = []
+
+    def start(self, name, attrs):
+        self._depth += 1
+        self._text = []
+
+        # plist > dict > key and value, array values one level deeper
+        if self._depth == 3 and name == 'array' and self._key in self.KEYS:
+            self.values[self._key] = []
+
+    def end(self, name):
+        text = ''.join(self._text)
+        self._text = []
+
+        if self._depth == 3:
+            if name == 'key':
+                self._key = text
+            elif name != 'array' and self._key in self.KEYS:
+                self.values[self._key] = text.strip()
+        elif (self._depth == 4 and name == 'string' and
+              isinstance(self.values.get(self._key), list)):
+            self.values[self._key].append(text.strip())
+
+        self._depth -= 1
+
+    def data(self, text):
+        self._text.append(text)
+
+
+def check_entry(path, checksum=None):
+    """
+    Return list of problems with entry file path, empty if it's fine
+
+    checksum is the SHA-1 from a manifest to compare to if given.
+    """
+
+    try:
+        with open(path, 'rb') as file_obj:
+            data = file_obj.read()
+    except IOError as err:
+        if not os.path.exists(path):
+            return ['missing']
+        return ['unreadable: %s' % (err.strerror)]
+
+    problems = []
+    if checksum is not None and hashlib.sha1(data).hexdigest() != checksum:
+        problems.append('changed since it was written')
+
+    keys = _PlistKeys()
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = keys.start
+    parser.EndElementHandler = keys.end
+    parser.CharacterDataHandler = keys.data
+
+    try:
+        # Entries have a blank line before the XML declaration
+        parser.Parse(data.lstrip(), True)
+    except expat.ExpatError as err:
+        problems.append('invalid plist: %s' % (err))
+        return problems
+
+    uuid_str = keys.values.get('UUID')
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if uuid_str is None or not UUID_RE.match(uuid_str):
+        problems.append('invalid UUID %r' % (uuid_str))
+    elif UUID_RE.match(stem) and stem.lower() != uuid_str.lower():
+        problems.append('UUID %s does not match the file name' % (uuid_str))
+
+    date = keys.values.get('Creation Date')
+    if date is None or not DATE_RE.match(date):
+        problems.append('invalid creation date %r' % (date))
+
+    if not keys.values.get('Tags'):
+        problems.append('no tags')
+
+    return problems
+
+
+def _check_task(task):
+    """check_entry() for a (path, checksum) task, returns (path, problems)"""
+
+    path, checksum = task
+    return path, check_entry(path, checksum)
+
+
+def _run_entries(run_id, folder=None):
+    """Return list of (path, checksum) for the entries of run_id"""
+
+    header, entries = manifest.load(run_id)
+    folder = folder or header['destination']
+    if 'rolled_back' in header:
+        LOG.warning('Run %s was rolled back %s', run_id, header['rolled_back'])
+
+    checksums = dict((name, sha1) for name, sha1, _ in entries)
+    return [(os.path.join(folder, name), checksum)
+            for name, checksum in sorted(checksums.iteritems())]
+
+
+def _folder_entries(folder):
+    """
+    Return list of (path, checksum) for every entry in folder and every entry
+    written into folder according to the manifests
+    """
+
+    folder = os.path.abspath(folder)
+    checksums = dict((name, None) for name in os.listdir(folder)
+                     if name.endswith('.doentry'))
+
+    # Later runs overwrite what earlier runs wrote
+    for run_id in manifest.run_ids():
+        header, entries = manifest.load(run_id)
+        if (header.get('destination') == folder and
+                'rolled_back' not in header):
+            checksums.update((name, sha1) for name, sha1, _ in entries)
+
+    return [(os.path.join(folder, name), checksum)
+            for name, checksum in sorted(checksums.iteritems())]
+
+
+def verify(tasks, jobs):
+    """Check all (path, checksum) tasks and yield (path, problems)"""
+
+    if jobs <= 1 or len(tasks) <= CHUNK_SIZE:
+        for task in tasks:
+            yield _check_task(task)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap_unordered(_check_task, tasks, CHUNK_SIZE):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def main():
+    args = _parse_args()
+    log.setup(args)
+
+    if args['run'] is not None:
+        try:
+            tasks = _run_entries(args['run'], args['folder'])
+        except IOError:
+            sys.exit('No run %s' % (args['run']))
+    elif args['folder'] is not None:
+        if not os.path.isdir(args['folder']):
+            sys.exit('No journal folder %s' % (args['folder']))
+
+        tasks = _folder_entries(args['folder'])
+    else:
+        runs = manifest.run_ids()
+        if not runs:
+            sys.exit('No runs recorded yet, give a journal folder to verify')
+
+        LOG.info('Verifying run %s', runs[-1])
+        tasks = _run_entries(runs[-1])
+
+    bad = missing = 0
+    for path, problems in verify(tasks, args['jobs']):
+        if problems == ['missing']:
+            missing += 1
+        elif problems:
+            bad += 1
+
+        for problem in problems:
+            print '%s: %s' % (path, problem)
+
+    print 'Checked %d entries, %d bad, %d missing' % (len(tasks), bad,
+                                                      missing)
+
+    if bad or missing:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
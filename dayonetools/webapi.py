@@ -0,0 +1,236 @@
+"""
+Web API sources as an alternative to manually exported files
+
+Services supporting it take --api URL instead of -f FILE.  Pages are fetched
+through a pool of keep-alive HTTP connections with up to --api-concurrency
+requests in flight, and their records are handed on in page order, so the
+service sees the same stream of records as from an export.
+
+The newest record date imported is stored as a cursor in the state folder and
+the next run only asks for records after it, delete the cursor or use
+--api-full to fetch everything again.  dayonetools.stubserver replays recorded
+pages locally for testing and benchmarking without network access.
+"""
+
+import collections
+import hashlib
+import httplib
+import json
+import os
+import Queue
+import socket
+import threading
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+from dayonetools.services import get_state_folder
+
+DEFAULT_CONCURRENCY = 4
+
+DEFAULT_TIMEOUT = 30
+
+# Records asked for per page
+PAGE_SIZE = 100
+
+
+def add_arguments(parser, source_group=None):
+    """
+    Add web API related arguments to given argparse parser
+
+    --api is added to source_group if given, the mutually exclusive group of
+    the other input options.
+    """
+
+    group = source_group or parser
+    group.add_argument('--api', default=None, action='store',
+                       dest='api_url', metavar='URL',
+                       help='Read records from the web API at URL')
+
+    parser.add_argument('--api-token', default=None, action='store',
+                        dest='api_token', required=False,
+                        help=('Access token for the web API, default: '
+                              '$DAYONETOOLS_API_TOKEN'))
+
+    parser.add_argument('--api-concurrency', default=DEFAULT_CONCURRENCY,
+                        type=int, dest='api_concurrency', required=False,
+                        help=('Maximum number of API requests in flight, '
+                              'default: %d' % (DEFAULT_CONCURRENCY)))
+
+    parser.add_argument('--api-full', default=False, action='store_true',
+                        dest='api_full', required=False,
+                        help='Ignore the stored cursor and fetch everything')
+
+
+class NotFound(IOError):
+    """Raised for a 404 response"""
+
+
+def api_token(args):
+    """Return token given on the command line or in the environment"""
+
+    return args.get('api_token') or os.environ.get('DAYONETOOLS_API_TOKEN')
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP(S) connections to one host shared by several threads
+
+    At most size connections are opened, get_json() waits for a free one.
+    """
+
+    def __init__(self, url, size=DEFAULT_CONCURRENCY, token=None,
+                 auth_scheme='Bearer', timeout=DEFAULT_TIMEOUT):
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported API URL %s' % (url))
+
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.base_path = parts.path.rstrip('/')
+        self.size = max(1, size)
+        self.timeout = timeout
+
+        self.headers = {'Accept': 'application/json'}
+        if token:
+            self.headers['Authorization'] = '%s %s' % (auth_scheme, token)
+
+        self._idle = Queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._all = []
+
+    def _connect(self):
+        """Return new connection object, connecting happens on first use"""
+
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.netloc, timeout=self.timeout)
+
+        return httplib.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    def _acquire(self):
+        """Return an idle connection, a new one or wait for one"""
+
+        try:
+            return self._idle.get_nowait()
+        except Queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+
+        return self._idle.get()
+
+    def get_json(self, path):
+        """GET path below the base URL and return the decoded JSON body"""
+
+        url = self.base_path + path
+        conn = self._acquire()
+
+        try:
+            try:
+                conn.request('GET', url, headers=self.headers)
+                response = conn.getresponse()
+            except (httplib.HTTPException, socket.error):
+                # The server may have dropped an idle keep-alive connection,
+                # try once more on a fresh one.
+                conn.close()
+                conn.request('GET', url, headers=self.headers)
+                response = conn.getresponse()
+
+            body = response.read()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            raise
+        finally:
+            self._idle.put(conn)
+
+        if response.status != httplib.OK:
+            error = IOError
+            if response.status == httplib.NOT_FOUND:
+                error = NotFound
+
+            raise error('GET %s://%s%s failed: %d %s' % (
+                          self.scheme, self.netloc, url, response.status,
+                          response.reason))
+
+        return json.loads(body)
+
+    def close(self):
+        """Close all connections"""
+
+        for conn in self._all:
+            conn.close()
+
+
+def iter_pages(pool, page_path, records, concurrency=DEFAULT_CONCURRENCY,
+               page_size=None):
+    """
+    Yield all records of consecutive pages in page order
+
+    page_path(n) returns the path of page n counting from 0 and records(body)
+    the list of records in a decoded page.  Up to concurrency pages are
+    requested ahead, the first page with less than page_size records, PAGE_SIZE
+    by default, is the last one.  A 404 for a page after the first one ends
+    the records too, it's past the end when the last page was full.
+    """
+
+    page_size = page_size or PAGE_SIZE
+    workers = ThreadPool(max(1, concurrency))
+    in_flight = collections.deque()
+    next_page = 0
+    first_page = True
+
+    try:
+        while True:
+            while len(in_flight) < max(1, concurrency):
+                in_flight.append(workers.apply_async(pool.get_json,
+                                                     (page_path(next_page),)))
+                next_page += 1
+
+            try:
+                page = records(in_flight.popleft().get())
+            except NotFound:
+                if first_page:
+                    raise
+                break
+
+            first_page = False
+            for record in page:
+                yield record
+
+            if len(page) < page_size:
+                break
+    finally:
+        # Pages requested past the last one are simply dropped
+        workers.terminate()
+
+
+class Cursor(object):
+    """Newest record date imported from an API, kept in the state folder"""
+
+    def __init__(self, service, url):
+        key = hashlib.sha1(url).hexdigest()[:16]
+        self.path = os.path.join(get_state_folder('cursors'),
+                                 '%s-%s.json' % (service, key))
+
+    def load(self):
+        """Return stored cursor or None"""
+
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'r') as file_obj:
+            return json.load(file_obj)['cursor']
+
+    def save(self, value):
+        """Atomically store value as the cursor"""
+
+        temp_name = self.path + '.tmp'
+        with open(temp_name, 'w') as file_obj:
+            json.dump({'cursor': value}, file_obj)
+
+        os.rename(temp_name, self.path)
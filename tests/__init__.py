@@ -0,0 +1,66 @@
+"""
+Tests of dayonetools, run them with 'make test'
+
+Every test case gets its own state folder and working folder so runs never
+touch ~/.dayonetools or a real journal.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from dayonetools.services import get_service_module
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fixtures')
+
+
+class StateTestCase(unittest.TestCase):
+    """Test case with DAYONETOOLS_HOME and a journal folder in a temp dir"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='dayonetools-test-')
+        self.journal = os.path.join(self.temp_dir, 'entries')
+        os.mkdir(self.journal)
+
+        self._home = os.environ.get('DAYONETOOLS_HOME')
+        os.environ['DAYONETOOLS_HOME'] = os.path.join(self.temp_dir, 'state')
+
+    def tearDown(self):
+        if self._home is None:
+            del os.environ['DAYONETOOLS_HOME']
+        else:
+            os.environ['DAYONETOOLS_HOME'] = self._home
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def run_service(self, service, *argv, **kwargs):
+        """
+        Run main() of service with argv as command line in the temp dir, -t
+        runs write into the 'test' folder there
+
+        Give folder to run in a sub folder of the temp dir instead, e.g. for
+        services that keep files in '../temp'.
+        """
+
+        cwd, sys_argv = os.getcwd(), sys.argv
+        os.chdir(self.path(kwargs.get('folder', '')))
+        sys.argv = [service] + list(argv)
+
+        try:
+            get_service_module(service).main()
+        finally:
+            os.chdir(cwd)
+            sys.argv = sys_argv
+
+    def path(self, *parts):
+        """Return path below the temp dir of the test"""
+
+        return os.path.join(self.temp_dir, *parts)
+
+    def entries(self):
+        """Return sorted names of the entries in the journal folder"""
+
+        return sorted(os.listdir(self.journal))
@@ -0,0 +1,114 @@
+"""Tests of running imports in background threads with dayonetools.api"""
+
+import os
+
+from dayonetools import api
+
+from tests import StateTestCase
+
+SLEEP_HEADER = ('Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n')
+
+
+class ImportJobTest(StateTestCase):
+
+    def _export(self, count, bad_row=None):
+        """Write sleep cycle export of count nights, return its path"""
+
+        export = self.path('sleep.csv')
+        with open(export, 'w') as export_file:
+            export_file.write(SLEEP_HEADER)
+            for num in xrange(count):
+                if num == bad_row:
+                    export_file.write('garbage;x\n')
+                    continue
+
+                export_file.write(
+                    '2013-%02d-%02d 23:10:00;2013-01-01 07:00:00;60%%;7:50;'
+                    ':|;Coffee;60;%d\n' % (num // 28 + 1, num % 28 + 1, num))
+
+        return export
+
+    def test_result(self):
+        job = api.ImportJob('sleep_cycle', self._export(5), self.journal)
+
+        names = job.result()
+        self.assertEqual(sorted(os.path.basename(name) for name in names),
+                         self.entries())
+        self.assertEqual((len(names), job.count), (5, 5))
+        self.assertTrue(job.wait(1))
+
+    def test_error(self):
+        job = api.ImportJob('sleep_cycle', self._export(5, bad_row=3),
+                            self.journal)
+
+        self.assertRaises(ValueError, job.result)
+        self.assertEqual(len(self.entries()), 3)
+
+    def test_no_library_import(self):
+        self.assertRaises(ValueError, api.ImportJob, 'pedometerpp',
+                          self.path('backup'), self.journal)
+
+    def test_cancel(self):
+        job = api.ImportJob('sleep_cycle', self._export(200), self.journal,
+                            queue_size=1)
+
+        names = iter(job)
+        next(names)
+        job.cancel()
+
+        self.assertTrue(job.wait(5))
+        self.assertTrue(job.cancelled)
+        list(names)
+
+        # The import stops once the queue is full
+        self.assertTrue(job.count <= 3)
+        self.assertEqual(len(self.entries()), job.count)
+
+
+class ImporterTest(StateTestCase):
+
+    def _export(self, name, count):
+        """Write sleep cycle export name of count nights, return its path"""
+
+        export = self.path(name)
+        with open(export, 'w') as export_file:
+            export_file.write(SLEEP_HEADER)
+            for num in xrange(count):
+                export_file.write(
+                    '2013-01-%02d 23:10:00;2013-01-%02d 07:00:00;60%%;7:50;'
+                    ':|;%s;60;%d\n' % (num + 1, num + 2, name, num))
+
+        return export
+
+    def test_concurrency(self):
+        importer = api.Importer(max_concurrent=1, queue_size=1)
+        first = importer.submit('sleep_cycle', self._export('a.csv', 20),
+                                self.journal)
+        second = importer.submit('sleep_cycle', self._export('b.csv', 3),
+                                 self.journal)
+
+        # The second job waits for the slot the first one holds
+        self.assertFalse(second.wait(0.3))
+        self.assertEqual(second.count, 0)
+
+        self.assertEqual(len(first.result()), 20)
+        self.assertEqual(len(second.result()), 3)
+
+    def test_cancel_all(self):
+        importer = api.Importer(max_concurrent=1, queue_size=1)
+        jobs = [importer.submit('sleep_cycle',
+                                self._export('%d.csv' % num, 20),
+                                self.journal)
+                for num in xrange(3)]
+
+        importer.cancel_all()
+
+        for job in jobs:
+            self.assertTrue(job.wait(5))
+            self.assertTrue(job.cancelled)
+            job.result()
+
+        # Waiting jobs never started
+        self.assertEqual([job.count for job in jobs[1:]], [0, 0])
+        self.assertTrue(jobs[0].count <= 2)
@@ -0,0 +1,125 @@
+"""Tests of the parsed input cache of dayonetools.cache"""
+
+import hashlib
+import os
+import shutil
+
+from dayonetools import cache
+from dayonetools.services import sleep_cycle
+
+from tests import StateTestCase
+
+SLEEP_HEADER = ('Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n')
+
+
+class CachedRecordsTest(StateTestCase):
+
+    def setUp(self):
+        super(CachedRecordsTest, self).setUp()
+
+        self.export = self.path('export.csv')
+        self._write('a\nb\n')
+        self.parsed = []
+
+    def _write(self, text):
+        """Write text into the export keeping its modification time"""
+
+        with open(self.export, 'w') as export:
+            export.write(text)
+        os.utime(self.export, (1000000000, 1000000000))
+
+    def _parse(self, filename):
+        """Parser recording every call, one record per line"""
+
+        self.parsed.append(filename)
+        with open(filename, 'r') as export:
+            return [line.strip() for line in export]
+
+    def _records(self, version=1, settings=None):
+        """Return records of the export through the cache"""
+
+        return cache.cached_records('test', self.export, version,
+                                    settings or {}, self._parse)
+
+    def _cache_files(self):
+        """Return names of the files in the cache folder"""
+
+        return os.listdir(self.path('state', 'cache'))
+
+    def test_same_fingerprint_is_reused(self):
+        self.assertEqual(self._records(), ['a', 'b'])
+        self.assertEqual(self._records(), ['a', 'b'])
+        self.assertEqual(len(self.parsed), 1)
+
+    def test_changed_export_is_parsed_again(self):
+        self._records()
+
+        # Same size and modification time, only the content hash differs
+        self._write('c\nd\n')
+        self.assertEqual(self._records(), ['c', 'd'])
+        self.assertEqual(len(self.parsed), 2)
+
+        # The cache of the old content was removed
+        self.assertEqual(len(self._cache_files()), 1)
+
+    def test_version_and_settings_are_part_of_the_key(self):
+        self._records()
+        self._records(version=2)
+        self._records(version=2, settings={'tolerant': True})
+        self.assertEqual(len(self.parsed), 3)
+
+        self._records(version=2, settings={'tolerant': True})
+        self.assertEqual(len(self.parsed), 3)
+
+    def test_stdin_is_not_cached(self):
+        self.assertEqual(cache.cached_records('test', '-', 1, {},
+                                              lambda name: iter([name])),
+                         ['-'])
+        self.assertFalse(os.path.exists(self.path('state', 'cache')))
+
+    def test_fingerprint(self):
+        size, mtime, digest = cache.fingerprint(self.export)
+        self.assertEqual((size, mtime), (4, 1000000000))
+        self.assertEqual(digest, hashlib.sha1('a\nb\n').hexdigest())
+
+        # Empty files can't be mapped
+        self._write('')
+        self.assertEqual(cache.fingerprint(self.export)[2],
+                         hashlib.sha1('').hexdigest())
+
+
+class CachedRunTest(StateTestCase):
+
+    def setUp(self):
+        super(CachedRunTest, self).setUp()
+
+        self.parsed = []
+        self._parse_rows = sleep_cycle._parse_rows
+
+        def _parse_rows(*args, **kwargs):
+            self.parsed.append(args[0])
+            return self._parse_rows(*args, **kwargs)
+
+        sleep_cycle._parse_rows = _parse_rows
+
+    def tearDown(self):
+        sleep_cycle._parse_rows = self._parse_rows
+        super(CachedRunTest, self).tearDown()
+
+    def test_rerun_uses_cache(self):
+        export = self.path('sleep.csv')
+        with open(export, 'w') as export_file:
+            export_file.write(SLEEP_HEADER)
+            for num in xrange(5):
+                export_file.write(
+                    '2013-01-%02d 23:10:00;2013-01-%02d 07:00:00;60%%;7:50;'
+                    ':|;Coffee;60;%d\n' % (num + 1, num + 2, 1000 + num))
+
+        for _ in xrange(2):
+            self.run_service('sleep_cycle', '-f', export, '-t', '-q',
+                             '--cache')
+            self.assertEqual(len(os.listdir(self.path('test'))), 5)
+            shutil.rmtree(self.path('test'))
+
+        self.assertEqual(len(self.parsed), 1)
@@ -0,0 +1,102 @@
+"""Tests of resumable runs with dayonetools.checkpoint"""
+
+import os
+import signal
+
+from dayonetools import checkpoint
+
+from tests import StateTestCase
+
+SLEEP_HEADER = ('Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n')
+
+
+class CheckpointTest(StateTestCase):
+
+    def test_interrupted_run_keeps_position(self):
+        progress = checkpoint.Checkpoint('sleep_cycle', 'a.csv', interval=10)
+        progress.commit(3)
+        progress.close()
+
+        progress = checkpoint.Checkpoint('sleep_cycle', 'a.csv')
+        self.assertEqual(progress.load(), 3)
+        progress.close(completed=True)
+
+        self.assertFalse(os.path.exists(progress.path))
+        self.assertEqual(checkpoint.Checkpoint('sleep_cycle', 'a.csv').load(),
+                         None)
+
+    def test_keep(self):
+        progress = checkpoint.Checkpoint('pedometerpp', 'a.db')
+        progress.keep = True
+        progress.commit({'day': '2014-01-01'})
+        progress.close(completed=True)
+
+        self.assertEqual(checkpoint.Checkpoint('pedometerpp', 'a.db').load(),
+                         {'day': '2014-01-01'})
+
+    def test_nothing_committed(self):
+        progress = checkpoint.Checkpoint('sleep_cycle', 'a.csv')
+        progress.close()
+        self.assertFalse(os.path.exists(progress.path))
+
+    def test_disabled(self):
+        handler = signal.getsignal(signal.SIGTERM)
+        progress = checkpoint.Checkpoint('sleep_cycle', 'a.csv',
+                                         enabled=False)
+        self.assertEqual(signal.getsignal(signal.SIGTERM), handler)
+
+        progress.commit(3)
+        progress.close()
+        self.assertFalse(os.path.exists(progress.path))
+
+    def test_sigterm_handler_restored(self):
+        handler = signal.getsignal(signal.SIGTERM)
+        progress = checkpoint.Checkpoint('sleep_cycle', 'a.csv')
+        self.assertEqual(signal.getsignal(signal.SIGTERM),
+                         checkpoint._terminate)
+
+        progress.close()
+        self.assertEqual(signal.getsignal(signal.SIGTERM), handler)
+
+
+class ResumeTest(StateTestCase):
+
+    def _export(self, first, count):
+        """Write count nights starting with night first, return the path"""
+
+        export = self.path('sleep.csv')
+        with open(export, 'w') as export_file:
+            export_file.write(SLEEP_HEADER)
+            for num in xrange(first, first + count):
+                export_file.write(
+                    '2013-01-%02d 23:10:00;2013-01-%02d 07:00:00;60%%;7:50;'
+                    ':|;Coffee;60;%d\n' % (num + 1, num + 2, 1000 + num))
+
+        return export
+
+    def test_resume_after_completed_run(self):
+        self.run_service('sleep_cycle', '-f', self._export(0, 5), '-t', '-q',
+                         '--checkpoint-every', '1')
+        self.assertEqual(len(os.listdir(self.path('test'))), 5)
+
+        # A new export at the same path, nothing of it was imported yet
+        self.run_service('sleep_cycle', '-f', self._export(10, 3), '-t',
+                         '-q', '--resume')
+        self.assertEqual(len(os.listdir(self.path('test'))), 8)
+
+    def test_resume_after_interrupted_run(self):
+        export = self._export(0, 8)
+        with open(export, 'r') as export_file:
+            lines = export_file.readlines()
+        with open(export, 'w') as export_file:
+            export_file.writelines(lines[:6] + ['garbage;x\n'] + lines[6:])
+
+        self.assertRaises(ValueError, self.run_service, 'sleep_cycle', '-f',
+                          export, '-t', '-q', '--checkpoint-every', '1')
+        self.assertEqual(len(os.listdir(self.path('test'))), 5)
+
+        self._export(0, 8)
+        self.run_service('sleep_cycle', '-f', export, '-t', '-q', '--resume')
+        self.assertEqual(len(os.listdir(self.path('test'))), 8)
+        self.assertEqual(os.listdir(self.path('state', 'checkpoints')), [])
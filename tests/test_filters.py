@@ -0,0 +1,122 @@
+"""Tests of the record filters of dayonetools.filters"""
+
+import argparse
+import os
+from StringIO import StringIO
+import sys
+
+from dayonetools import filters
+from dayonetools import shard
+
+from tests import StateTestCase
+
+HEADER = ('Start', 'Sleep quality', 'Sleep Notes')
+
+ROWS = [('2014-01-01 23:00:00', '53%', 'Coffee'),
+        ('2014-01-02 23:00:00', '80%', 'Tea #late'),
+        ('2014-01-03 23:00:00', '95%', ''),
+        ('2014-01-04 23:00:00', '', 'Coffee #late')]
+
+
+def _parse(*argv):
+    """Return parser and parsed arguments dict of filter options argv"""
+
+    parser = argparse.ArgumentParser()
+    filters.add_arguments(parser, tags=True, devices=True)
+    shard.add_arguments(parser)
+    return parser, vars(parser.parse_args(argv))
+
+
+def _kept(argv, header=HEADER, rows=ROWS, date_field='Start',
+          shard_key=None):
+    """Return rows kept by the filters of argv"""
+
+    _, args = _parse(*argv)
+    keep = filters.Filter.from_args(args).row_predicate(header, date_field,
+                                                        shard_key)
+    return [row for row in rows if keep is None or keep(row)]
+
+
+class FilterTest(StateTestCase):
+
+    def test_no_filters(self):
+        _, args = _parse()
+        self.assertEqual(
+            filters.Filter.from_args(args).row_predicate(HEADER, 'Start'),
+            None)
+
+    def test_until(self):
+        self.assertEqual(_kept(['--until', '2014-01-02']), ROWS[:2])
+
+    def test_min_takes_first_number(self):
+        # Fields are matched ignoring case, spaces and underscores alike
+        self.assertEqual(_kept(['--min', 'sleep_quality=80']), ROWS[1:3])
+
+    def test_match_and_min_all_pass(self):
+        self.assertEqual(_kept(['--min', 'Sleep Quality=50',
+                                '--match', 'sleep_notes=^C']), ROWS[:1])
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, _kept, ['--match', 'notes=x'])
+
+    def test_tags(self):
+        header = ('date', 'text')
+        rows = [(row[0], row[2]) for row in ROWS]
+        self.assertEqual(_kept(['--tag', '#LATE'], header, rows, 'date'),
+                         [rows[1], rows[3]])
+        self.assertEqual(_kept(['--exclude-tag', 'late'], header, rows,
+                               'date'),
+                         [rows[0], rows[2]])
+
+    def test_devices(self):
+        header = ('start_time', 'device')
+        rows = [('2014-01-01', 'FUELBAND'), ('2014-01-02', 'iPhone')]
+        self.assertEqual(_kept(['--device', 'fuelband'], header, rows,
+                               'start_time'),
+                         rows[:1])
+        self.assertEqual(_kept(['--exclude-device', 'IPHONE'], header, rows,
+                               'start_time'),
+                         rows[:1])
+
+    def test_shards_split_rows(self):
+        shard_key = lambda row: row[0]
+        kept = [_kept(['--shard', '%d/3' % index], shard_key=shard_key)
+                for index in range(3)]
+
+        self.assertEqual(sorted(sum(kept, [])), ROWS)
+
+    def test_minimum(self):
+        _, args = _parse('--min', 'steps=10', '--min', 'Steps=20')
+        record_filter = filters.Filter.from_args(args)
+        self.assertEqual(record_filter.minimum('steps'), 20)
+        self.assertEqual(record_filter.minimum('fuel'), None)
+
+
+class CheckFieldsTest(StateTestCase):
+
+    def setUp(self):
+        super(CheckFieldsTest, self).setUp()
+
+        # argparse prints the usage of errors
+        self._stderr, sys.stderr = sys.stderr, StringIO()
+
+    def tearDown(self):
+        sys.stderr = self._stderr
+        super(CheckFieldsTest, self).tearDown()
+
+    def test_known_fields(self):
+        parser, args = _parse('--min', 'sleep quality=50',
+                              '--match', 'Sleep_Notes=x')
+        filters.check_fields(parser, args, HEADER)
+
+    def test_unknown_field(self):
+        parser, args = _parse('--min', 'quality=50')
+        self.assertRaises(SystemExit, filters.check_fields, parser, args,
+                          HEADER)
+        self.assertIn("No field 'quality' to filter on", sys.stderr.getvalue())
+
+    def test_service_exits_before_reading(self):
+        export = self.path('missing.csv')
+        self.assertRaises(SystemExit, self.run_service, 'sleep_cycle',
+                          '-f', export, '-t', '--match', 'notes=x')
+        self.assertFalse(os.path.exists(self.path('test')))
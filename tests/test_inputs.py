@@ -0,0 +1,160 @@
+"""Tests of opening compressed exports and stdin with dayonetools.inputs"""
+
+import bz2
+import gzip
+import os
+from StringIO import StringIO
+import sys
+import zipfile
+
+from dayonetools import inputs
+from dayonetools.mmapfile import MappedFile
+
+from tests import StateTestCase
+
+SLEEP_HEADER = ('Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n')
+
+TEXT = ''.join('line %d\n' % num for num in xrange(1000)) + 'last'
+
+
+class OpenInputTest(StateTestCase):
+
+    def setUp(self):
+        super(OpenInputTest, self).setUp()
+
+        self._chunk_size = inputs.CHUNK_SIZE
+        inputs.CHUNK_SIZE = 100
+
+    def tearDown(self):
+        inputs.CHUNK_SIZE = self._chunk_size
+        super(OpenInputTest, self).tearDown()
+
+    def _gzip(self, name, text=TEXT):
+        """Write text gzipped into name in the temp dir, return its path"""
+
+        with gzip.open(self.path(name), 'wb') as compressed:
+            compressed.write(text)
+
+        return self.path(name)
+
+    def _zip(self, name, members):
+        """Write zip archive name of (member, text) pairs, return its path"""
+
+        with zipfile.ZipFile(self.path(name), 'w') as archive:
+            for member, text in members:
+                archive.writestr(member, text)
+
+        return self.path(name)
+
+    def _lines(self, filename):
+        """Return lines of filename read through open_input()"""
+
+        with inputs.open_input(filename) as opened:
+            self.assertIsInstance(opened, inputs.StreamedFile)
+            lines = list(opened.lines())
+            self.assertEqual(opened.offset, len(TEXT))
+
+        return lines
+
+    def test_plain_file_is_mapped(self):
+        with open(self.path('export.csv'), 'w') as export:
+            export.write(TEXT)
+
+        with inputs.open_input(self.path('export.csv')) as opened:
+            self.assertEqual(type(opened), MappedFile)
+            self.assertEqual(''.join(opened.lines()), TEXT)
+
+    def test_gz(self):
+        self.assertEqual(''.join(self._lines(self._gzip('export.csv.gz'))),
+                         TEXT)
+
+    def test_bz2(self):
+        with open(self.path('export.csv.bz2'), 'wb') as compressed:
+            compressed.write(bz2.compress(TEXT))
+
+        lines = self._lines(self.path('export.csv.bz2'))
+        self.assertEqual(lines, TEXT.splitlines(True))
+
+    def test_zip(self):
+        archive = self._zip('export.zip', [('folder/', ''),
+                                           ('folder/export.csv', TEXT)])
+        self.assertEqual(''.join(self._lines(archive)), TEXT)
+
+    def test_zip_member(self):
+        archive = self._zip('exports.zip', [('a.csv', 'a'), ('b.csv', TEXT)])
+        self.assertEqual(''.join(self._lines(archive + ':b.csv')), TEXT)
+
+        self.assertRaises(IOError, inputs.open_input, archive)
+
+    def test_stdin(self):
+        stdin, sys.stdin = sys.stdin, StringIO(TEXT)
+        try:
+            self.assertEqual(''.join(self._lines(inputs.STDIN)), TEXT)
+        finally:
+            sys.stdin = stdin
+
+    def test_xz(self):
+        if inputs.lzma is None:
+            self.assertRaises(IOError, inputs.open_input,
+                              self.path('export.csv.xz'))
+            return
+
+        with open(self.path('export.csv.xz'), 'wb') as compressed:
+            compressed.write(inputs.lzma.compress(TEXT))
+
+        self.assertEqual(''.join(self._lines(self.path('export.csv.xz'))),
+                         TEXT)
+
+    def test_whole_input(self):
+        with inputs.open_input(self._gzip('export.csv.gz')) as opened:
+            self.assertEqual(opened.count('\n'), 1000)
+            self.assertEqual(opened.rfind('\n'), len(TEXT) - 5)
+            self.assertEqual(list(opened.lines(TEXT.index('line 999'))),
+                             ['line 999\n', 'last'])
+
+    def test_streamed_once(self):
+        with inputs.open_input(self._gzip('export.csv.gz')) as opened:
+            list(opened.lines())
+            self.assertRaises(IOError, list, opened.lines())
+            self.assertRaises(IOError, opened.find, 'line')
+
+    def test_error_while_reading(self):
+        with open(self.path('broken.csv.gz'), 'wb') as compressed:
+            compressed.write('not gzip at all')
+
+        with inputs.open_input(self.path('broken.csv.gz')) as opened:
+            self.assertRaises(IOError, list, opened.lines())
+
+    def test_close_while_reading(self):
+        opened = inputs.open_input(self._gzip('export.csv.gz', TEXT * 20))
+        lines = opened.lines()
+        next(lines)
+        opened.close()
+
+        self.assertFalse(opened._thread.is_alive())
+
+    def test_names(self):
+        self.assertTrue(inputs.is_stream('-'))
+        self.assertTrue(inputs.is_stream('a.CSV.GZ'))
+        self.assertTrue(inputs.is_stream('a.zip:b.csv'))
+        self.assertFalse(inputs.is_stream('a.csv'))
+
+        self.assertEqual(inputs.source_path('-'), None)
+        self.assertEqual(inputs.source_path('a.zip:b.csv'), 'a.zip')
+        self.assertEqual(inputs.source_path('a.csv.bz2'), 'a.csv.bz2')
+
+
+class CompressedRunTest(StateTestCase):
+
+    def test_sleep_cycle(self):
+        rows = ['2013-01-%02d 23:10:00;2013-01-%02d 07:00:00;60%%;7:50;:|;'
+                'Coffee;60;%d\n' % (num + 1, num + 2, num)
+                for num in xrange(4)]
+
+        with bz2.BZ2File(self.path('sleep.csv.bz2'), 'w') as compressed:
+            compressed.writelines([SLEEP_HEADER] + rows)
+
+        self.run_service('sleep_cycle', '-f', self.path('sleep.csv.bz2'),
+                         '-t', '-q')
+        self.assertEqual(len(os.listdir(self.path('test'))), 4)
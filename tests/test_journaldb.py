@@ -0,0 +1,125 @@
+"""Tests of the journal database output of dayonetools.journaldb"""
+
+import json
+import os
+import plistlib
+import sqlite3
+
+from dayonetools import journaldb
+from dayonetools import templates
+
+from tests import StateTestCase
+
+ENTRY_TEMPLATE = """
+<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+    <key>Creation Date</key>
+    <date>{date}</date>
+    <key>Entry Text</key>
+    <string>{entry_title} &amp; more
+{text}</string>
+    <key>Location</key>
+    <dict>
+        <key>Place Name</key>
+        <string>{place}</string>
+        <key>Visits</key>
+        <integer>{visits}</integer>
+    </dict>
+    <key>Starred</key>
+    <true/>
+    <key>Tags</key>
+    <array>
+        <string>test</string>
+        <string>{tag}</string>
+    </array>
+    <key>UUID</key>
+    <string>{uuid_str}</string>
+</dict>
+</plist>
+"""
+
+TEMPLATE = templates.Template(ENTRY_TEMPLATE,
+                              ('date', 'text', 'place', 'visits', 'tag',
+                               'uuid_str'),
+                              'Notes')
+
+VALUES = {'entry_title': 'Notes', 'date': '2014-01-02T08:00:00Z',
+          'text': 'Wine & cheese <3', 'place': 'Fish & Chips <Pier>',
+          'visits': 3, 'tag': 'a&b', 'uuid_str': 'ABC'}
+
+
+class PlistTemplateTest(StateTestCase):
+
+    def test_fill_matches_parsed_plist(self):
+        values = dict(VALUES, text='Cheese', place='Pier', tag='ab')
+        parsed = plistlib.readPlistFromString(
+            TEMPLATE.render(values).strip())
+        filled = journaldb.PlistTemplate(TEMPLATE).fill(values)
+
+        # Dates are kept as the text of the template
+        self.assertEqual(filled.pop('Creation Date'), '2014-01-02T08:00:00Z')
+        del parsed['Creation Date']
+        self.assertEqual(filled, parsed)
+
+    def test_field_outside_value(self):
+        template = templates.Template(
+            '<plist version="1.0"><dict><key>{name}</key>'
+            '<string>x</string></dict></plist>', ('name',), 'Title')
+        self.assertRaises(ValueError, journaldb.PlistTemplate, template)
+
+
+class JournalDBOutputTest(StateTestCase):
+
+    def setUp(self):
+        super(JournalDBOutputTest, self).setUp()
+        self.db_file = self.path('journal.db')
+
+    def query(self, sql):
+        connection = sqlite3.connect(self.db_file)
+        try:
+            return connection.execute(sql).fetchall()
+        finally:
+            connection.close()
+
+    def test_markup_in_values(self):
+        output = journaldb.JournalDBOutput(self.db_file)
+        written = []
+        output.on_written = written.append
+        name = output.add_entry('ABC.doentry', TEMPLATE, VALUES)
+        output.close()
+
+        self.assertEqual(written, [name])
+        self.assertEqual(os.path.basename(name), 'ABC')
+        self.assertEqual(
+            self.query('SELECT * FROM entries'),
+            [(u'ABC', u'ABC', u'2014-01-02T08:00:00Z', None, 1,
+              u'Notes & more\nWine & cheese <3')])
+        self.assertEqual(
+            self.query('SELECT t.name FROM entry_tags e JOIN tags t '
+                       'ON e.tag = t.id ORDER BY t.name'),
+            [(u'a&b',), (u'test',)])
+
+        (key, value), = self.query('SELECT key, value FROM entry_metadata')
+        self.assertEqual(key, u'Location')
+        self.assertEqual(json.loads(value),
+                         {u'Place Name': u'Fish & Chips <Pier>',
+                          u'Visits': 3})
+
+    def test_service_run(self):
+        export = self.path('sleep.csv')
+        with open(export, 'w') as export_file:
+            export_file.write(
+                'Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n'
+                '2013-01-01 23:10:00;2013-01-02 07:00:00;53%;7:50;:|;'
+                'Tea & <cake>;60;2459\n')
+
+        self.run_service('sleep_cycle', '-f', export, '-q',
+                         '--journal-db', self.db_file)
+
+        (text,), = self.query('SELECT text FROM entries')
+        self.assertIn('- Notes: Tea & <cake>\n', text)
+        self.assertEqual(self.query('SELECT name FROM tags'), [(u'sleep',)])
+        self.assertEqual(len(self.query('SELECT * FROM entry_tags')), 1)
@@ -0,0 +1,154 @@
+"""Tests of importing overlapping exports with dayonetools.merge"""
+
+import gzip
+import os
+import plistlib
+import shutil
+
+from dayonetools import merge
+
+from tests import StateTestCase
+
+SLEEP_HEADER = ('Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n')
+
+
+def _sleep_row(num):
+    """Return CSV row of night num of a sleep cycle export"""
+
+    return ('2013-01-%02d 23:10:00;2013-01-%02d 07:00:00;%d%%;7:50;:|;'
+            'Coffee;60;%d\n' % (num + 1, num + 2, 50 + num, 1000 + num))
+
+
+class MergedTest(StateTestCase):
+
+    def test_order(self):
+        exports = {'a': [1, 4, 5], 'b': [2, 3, 6], 'c': []}
+        self.assertEqual(list(merge.merged(['a', 'b', 'c'], exports.get,
+                                           order=lambda num: num)),
+                         [1, 2, 3, 4, 5, 6])
+
+    def test_reverse(self):
+        exports = {'a': [5, 4, 1], 'b': [6, 3, 2]}
+        self.assertEqual(list(merge.merged(['a', 'b'], exports.get,
+                                           order=lambda num: num,
+                                           reverse=True)),
+                         [6, 5, 4, 3, 2, 1])
+
+    def test_ties_keep_export_order(self):
+        exports = {'a': [(1, 'a')], 'b': [(1, 'b'), (2, 'b')]}
+        self.assertEqual(list(merge.merged(['b', 'a'], exports.get,
+                                           order=lambda item: item[0])),
+                         [(1, 'b'), (1, 'a'), (2, 'b')])
+
+    def test_without_order(self):
+        exports = {'a': [3, 1], 'b': [2]}
+        self.assertEqual(list(merge.merged(['a', 'b'], exports.get)),
+                         [3, 1, 2])
+
+    def test_many_records(self):
+        count = merge.READ_AHEAD * 3
+        records = list(merge.merged(['a', 'b'],
+                                    lambda name: xrange(count),
+                                    order=lambda num: num))
+        self.assertEqual(records, sorted(range(count) * 2))
+
+    def test_error_of_reader(self):
+        def _read(name):
+            yield 1
+            raise ValueError('bad record in %s' % name)
+
+        records = merge.merged(['a'], _read, order=lambda num: num)
+        self.assertEqual(next(records), 1)
+        self.assertRaises(ValueError, list, records)
+
+    def test_stop_early(self):
+        closed = []
+
+        def _read(name):
+            try:
+                for num in xrange(merge.READ_AHEAD * 3):
+                    yield num
+            finally:
+                closed.append(name)
+
+        records = merge.merged(['a', 'b'], _read, order=lambda num: num)
+        self.assertEqual(next(records), 0)
+        records.close()
+        self.assertEqual(sorted(closed), ['a', 'b'])
+
+
+class UniqueTest(StateTestCase):
+
+    def test_unique(self):
+        for max_memory in (None, 512):
+            records = [('key %d' % (num % 40), num) for num in xrange(100)]
+            self.assertEqual(list(merge.unique(records, lambda item: item[0],
+                                               max_memory)),
+                             records[:40])
+
+
+class SourceTest(StateTestCase):
+
+    def test_source(self):
+        self.assertEqual(merge.source(['a.csv']), 'a.csv')
+        self.assertEqual(merge.source(['a.csv', '/b.csv']),
+                         '%s;/b.csv' % os.path.abspath('a.csv'))
+
+
+class OverlappingExportsTest(StateTestCase):
+
+    def _entries(self, service, *filenames):
+        """Run service on filenames, return {entry date: entry text}"""
+
+        self.run_service(service, '-f', *(filenames + ('-t', '-q')))
+
+        entries = {}
+        for name in os.listdir(self.path('test')):
+            with open(self.path('test', name), 'r') as file_obj:
+                entry = plistlib.readPlistFromString(file_obj.read().strip())
+            self.assertNotIn(entry['Creation Date'], entries)
+            entries[entry['Creation Date']] = entry['Entry Text']
+
+        shutil.rmtree(self.path('test'))
+        return entries
+
+    def _export(self, name, lines, compress=False):
+        """Write lines into export name of the temp dir, return its path"""
+
+        open_export = gzip.open if compress else open
+        with open_export(self.path(name), 'wb') as export:
+            export.writelines(lines)
+
+        return self.path(name)
+
+    def test_sleep_cycle(self):
+        rows = [_sleep_row(num) for num in xrange(20)]
+        whole = self._export('whole.csv', [SLEEP_HEADER] + rows)
+        first = self._export('first.csv', [SLEEP_HEADER] + rows[:12])
+        later = self._export('later.csv.gz', [SLEEP_HEADER] + rows[5:],
+                             compress=True)
+
+        entries = self._entries('sleep_cycle', whole)
+        self.assertEqual(len(entries), 20)
+        self.assertEqual(self._entries('sleep_cycle', first, later), entries)
+
+    def test_idonethis(self):
+        # Exports list the newest day first
+        dones = ['2013-07-%02d,"did thing %d"\n' % (4 - num // 3, num)
+                 for num in xrange(12)]
+        whole = self._export('whole.csv', dones)
+        first = self._export('first.csv', dones[:8])
+        later = self._export('later.csv', dones[4:])
+
+        entries = self._entries('idonethis', whole)
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(self._entries('idonethis', first, later), entries)
+
+        # Dones of a day missing in the first export given come after the
+        # ones it has
+        reordered = self._entries('idonethis', later, first)
+        self.assertEqual(dict((day, sorted(text.splitlines()))
+                              for day, text in reordered.items()),
+                         dict((day, sorted(text.splitlines()))
+                              for day, text in entries.items()))
@@ -0,0 +1,126 @@
+"""Tests of reading exports through dayonetools.mmapfile"""
+
+from dayonetools import rejects
+from dayonetools.mmapfile import MappedFile
+from dayonetools.services import sleep_cycle
+
+from tests import StateTestCase
+
+SLEEP_HEADER = ('Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n')
+
+
+def _sleep_row(num):
+    """Return CSV row of night num of a sleep cycle export"""
+
+    return ('2013-%02d-%02d 23:10:00;2013-01-01 07:00:00;%d%%;7:50;:|;'
+            'Coffee;60;%d\n' % (num // 28 + 1, num % 28 + 1, num % 100,
+                                1000 + num))
+
+
+class MappedFileTest(StateTestCase):
+
+    def _mapped(self, text):
+        """Return MappedFile of a file holding text"""
+
+        with open(self.path('export.csv'), 'wb') as export:
+            export.write(text)
+
+        return MappedFile(self.path('export.csv'))
+
+    def test_view(self):
+        with self._mapped('header\nrow 1\nrow 2\n') as mapped:
+            view = mapped.view(7, 12)
+            self.assertIsInstance(view, buffer)
+            self.assertEqual(str(view), 'row 1')
+            self.assertEqual(str(mapped.view()), 'header\nrow 1\nrow 2\n')
+
+    def test_split(self):
+        text = ''.join('row %d\n' % num for num in xrange(100))
+        with self._mapped(text + 'last') as mapped:
+            ranges = mapped.split(7, start=6)
+
+            self.assertEqual(ranges[0][0], 6)
+            self.assertEqual(ranges[-1][1], mapped.size)
+            for (_, end), (begin, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, begin)
+                self.assertEqual(mapped.read(end - 1, end), '\n')
+
+            self.assertEqual(''.join(''.join(mapped.lines(begin, end))
+                                     for begin, end in ranges),
+                             text[6:] + 'last')
+
+    def test_empty(self):
+        with self._mapped('') as mapped:
+            self.assertEqual(str(mapped.view()), '')
+            self.assertEqual(mapped.split(4), [])
+
+
+class ParallelParsingTest(StateTestCase):
+
+    def setUp(self):
+        super(ParallelParsingTest, self).setUp()
+
+        self._parallel_size = sleep_cycle.PARALLEL_SIZE
+        self._cpu_count = sleep_cycle.multiprocessing.cpu_count
+        sleep_cycle.multiprocessing.cpu_count = lambda: 3
+
+    def tearDown(self):
+        sleep_cycle.PARALLEL_SIZE = self._parallel_size
+        sleep_cycle.multiprocessing.cpu_count = self._cpu_count
+        super(ParallelParsingTest, self).tearDown()
+
+    def _export(self, rows):
+        """Write sleep cycle export of rows, return its path"""
+
+        export = self.path('sleep.csv')
+        with open(export, 'wb') as export_file:
+            export_file.write(SLEEP_HEADER)
+            export_file.writelines(rows)
+
+        return export
+
+    def _parsed(self, export, parallel, start_row=0, reject_file=None):
+        """Return rows _parse_rows() yields for export"""
+
+        sleep_cycle.PARALLEL_SIZE = 0 if parallel else self._parallel_size
+        return list(sleep_cycle._parse_rows(export, start_row, reject_file))
+
+    def test_same_rows(self):
+        export = self._export([_sleep_row(num) for num in xrange(300)])
+
+        for start_row in (0, 1, 120):
+            rows = self._parsed(export, True, start_row)
+            self.assertEqual(len(rows), 301 - start_row)
+            self.assertEqual(rows, self._parsed(export, False, start_row))
+
+    def test_bad_rows(self):
+        rows = [_sleep_row(num) for num in xrange(50)]
+        rows[30] = 'garbage;x\n'
+        export = self._export(rows)
+
+        self.assertRaises(ValueError, self._parsed, export, True)
+
+        rejected = {}
+        for parallel in (True, False):
+            reject_file = rejects.RejectFile(
+                self.path('rejects-%s.tsv' % parallel), 'sleep_cycle')
+            parsed = self._parsed(export, parallel, reject_file=reject_file)
+            reject_file.close()
+
+            self.assertEqual([row[0] for row in parsed[30:32]], [30, 32])
+            with open(reject_file.filename, 'r') as reject_lines:
+                rejected[parallel] = [line for line in reject_lines
+                                      if not line.startswith('#')]
+
+        self.assertEqual(len(rejected[True]), 1)
+        self.assertTrue(rejected[True][0].startswith('line 32\t'))
+        self.assertEqual(rejected[True], rejected[False])
+
+    def test_quotes_are_not_split(self):
+        rows = [_sleep_row(num) for num in xrange(10)]
+        rows[4] = rows[4].replace('Coffee', '"Coffee\nand tea"')
+        export = self._export(rows)
+
+        self.assertEqual(self._parsed(export, True),
+                         self._parsed(export, False))
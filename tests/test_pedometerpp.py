@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Tests of the pedometerpp service"""
+
+import os
+import plistlib
+import sqlite3
+import time
+
+from dayonetools.services import pedometerpp
+
+from tests import StateTestCase
+
+
+class PedometerTestCase(StateTestCase):
+    """Test case with a Pedometer++ backup of January 2013 in the temp dir"""
+
+    # Odd days of January have 8000 steps, even days 2000
+    JANUARY = dict(('2013-01-%02d' % day, 8000 if day % 2 else 2000)
+                   for day in range(1, 32))
+
+    def setUp(self):
+        super(PedometerTestCase, self).setUp()
+        os.mkdir(self.path('work'))
+        os.mkdir(self.path('backup'))
+        self.write_backup(self.JANUARY)
+
+    def write_backup(self, days):
+        """Write backup database with steps of the days dict"""
+
+        database = self.path('backup', pedometerpp.DATABASE)
+        if os.path.exists(database):
+            os.remove(database)
+
+        connection = sqlite3.connect(database)
+        connection.execute('CREATE TABLE ZSTEPCOUNT (Z_PK INTEGER PRIMARY KEY, '
+                           'Z_ENT INTEGER, Z_OPT INTEGER, ZSTEPS INTEGER, '
+                           'ZTIMESTAMP REAL, ZDATESTRING VARCHAR)')
+        connection.executemany(
+            'INSERT INTO ZSTEPCOUNT VALUES (NULL, 1, 1, ?, ?, ?)',
+            [(steps, pedometerpp._ztimestamp(day_str) + 12 * 60 * 60, 'x')
+             for day_str, steps in sorted(days.items())])
+        connection.commit()
+        connection.close()
+
+        # Backups are ordered by modification time
+        os.utime(database, (time.time(), time.time()))
+
+    def run_pedometer(self, *argv):
+        """Run pedometerpp on the backup into the journal folder"""
+
+        self.run_service('pedometerpp', '-d', self.path('backup'),
+                         '-o', self.journal, '-q', *argv, folder='work')
+
+    def written(self):
+        """Return {(kind, 'YYYY-MM-DD'): steps} of the entries written"""
+
+        entries = {}
+        for name in os.listdir(self.journal):
+            entry = plistlib.readPlist(os.path.join(self.journal, name))
+            day_str = entry['Creation Date'].strftime('%Y-%m-%d')
+            entries[(entry['Tags'][-1], day_str)] = entry['Step Count']
+
+        return entries
+
+
+class FilterTest(PedometerTestCase):
+
+    def test_min_still_sums_all_days(self):
+        self.run_pedometer('--min', 'steps=5000')
+
+        entries = self.written()
+        days = sorted(day_str for kind, day_str in entries
+                      if kind == u'∑ Day')
+        self.assertEqual(days, sorted(day_str for day_str, steps
+                                      in self.JANUARY.items()
+                                      if steps >= 5000))
+        self.assertEqual(entries[(u'∑ Month', '2013-01-31')],
+                         sum(self.JANUARY.values()))
+        self.assertEqual(entries[(u'∑ Week', '2013-01-13')],
+                         4 * 8000 + 3 * 2000)
+
+    def test_since_and_until_sum_whole_periods(self):
+        self.run_pedometer('--since', '2013-01-09', '--until', '2013-01-10')
+
+        entries = self.written()
+        self.assertEqual(sorted(day_str for kind, day_str in entries
+                                if kind == u'∑ Day'),
+                         ['2013-01-09', '2013-01-10'])
+        self.assertEqual(entries[(u'∑ Week', '2013-01-13')],
+                         4 * 8000 + 3 * 2000)
+        self.assertEqual(entries[(u'∑ Month', '2013-01-31')],
+                         sum(self.JANUARY.values()))
+        self.assertEqual(len(entries), 4)
+
+
+class WatermarkTest(PedometerTestCase):
+
+    def _watermark(self):
+        """Return contents of the checkpoint files"""
+
+        folder = self.path('state', 'checkpoints')
+        return dict((name, open(os.path.join(folder, name)).read())
+                    for name in os.listdir(folder))
+
+    def test_filtered_run_then_incremental_run(self):
+        self.run_pedometer('--min', 'steps=5000')
+        self.assertEqual(self._watermark(), {})
+
+        self.run_pedometer()
+
+        entries = self.written()
+        self.assertEqual(sorted(day_str for kind, day_str in entries
+                                if kind == u'∑ Day'),
+                         sorted(self.JANUARY))
+        self.assertEqual(entries[(u'∑ Month', '2013-01-31')],
+                         sum(self.JANUARY.values()))
+
+    def test_partial_run_keeps_watermark(self):
+        self.write_backup(dict(day for day in self.JANUARY.items()
+                               if day[0] <= '2013-01-15'))
+        self.run_pedometer()
+        watermark = self._watermark()
+        self.assertEqual(len(watermark), 1)
+
+        self.write_backup(self.JANUARY)
+        for argv in (('--until', '2013-01-05'), ('--since', '2013-01-20')):
+            self.run_pedometer(*argv)
+            self.assertEqual(self._watermark(), watermark)
+
+        self.run_pedometer()
+
+        entries = self.written()
+        self.assertEqual(sorted(day_str for kind, day_str in entries
+                                if kind == u'∑ Day'),
+                         sorted(self.JANUARY))
+        self.assertEqual(entries[(u'∑ Month', '2013-01-31')],
+                         sum(self.JANUARY.values()))
+        self.assertEqual(entries[(u'∑ Week', '2013-01-20')],
+                         3 * 8000 + 4 * 2000)
+
+
+class BackupCopyTest(PedometerTestCase):
+
+    def test_copies_are_removed(self):
+        self.run_pedometer()
+        self.assertEqual(len(self.written()), 31 + 4 + 1)
+        self.assertEqual(os.listdir(self.path('temp', 'pedometerpp')), [])
+
+    def test_copies_are_private(self):
+        # Runs reading the same backup never share a copy
+        copies = set()
+
+        def _copy(source, destination):
+            copies.add(destination)
+            copy(source, destination)
+
+        copy, pedometerpp.shutil.copy = pedometerpp.shutil.copy, _copy
+        try:
+            self.run_pedometer()
+            self.run_pedometer('--full')
+        finally:
+            pedometerpp.shutil.copy = copy
+
+        self.assertEqual(len(copies), 2)
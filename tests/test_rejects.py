@@ -0,0 +1,135 @@
+"""Tests of skipping bad records with dayonetools.rejects"""
+
+import json
+import os
+
+from dayonetools import rejects
+
+from tests import StateTestCase
+
+SLEEP_HEADER = ('Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n')
+
+
+def _read_rejects(filename):
+    """Return (header dict, list of record lines split at tabs)"""
+
+    header = {}
+    records = []
+    with open(filename, 'r') as file_obj:
+        for line in file_obj:
+            line = line.rstrip('\n')
+            if line.startswith('#'):
+                key, _, value = line[1:].partition(' ')
+                header[key] = value
+            else:
+                records.append(line.split('\t'))
+
+    return header, records
+
+
+class RejectFileTest(StateTestCase):
+
+    def test_records(self):
+        reject_file = rejects.RejectFile(self.path('a.rejects'), 'test')
+        reject_file.add('a.csv', 'line 2', ValueError('bad\ndate'), ['x', 'y'])
+        reject_file.add('b.json', 'byte 7', KeyError('name'), {'a': 1})
+        reject_file.close()
+
+        header, records = _read_rejects(self.path('a.rejects'))
+        self.assertEqual(header['service'], 'test')
+        self.assertEqual(header['input'], 'b.json')
+        self.assertEqual(records,
+                         [['line 2', 'ValueError: bad date', '["x", "y"]'],
+                          ['byte 7', "KeyError: 'name'", '{"a": 1}']])
+        self.assertEqual(reject_file.count, 2)
+
+    def test_stops_after_max_errors(self):
+        reject_file = rejects.RejectFile(self.path('a.rejects'), 'test',
+                                         max_errors=2)
+        for num in (1, 2):
+            reject_file.add('a.csv', 'line %d' % num, ValueError('bad'), [])
+
+        self.assertRaises(ValueError, reject_file.add, 'a.csv', 'line 3',
+                          ValueError('bad'), [])
+
+        # The record going over the limit is still written
+        self.assertEqual(len(_read_rejects(self.path('a.rejects'))[1]), 3)
+
+    def test_not_utf8(self):
+        reject_file = rejects.RejectFile(self.path('a.rejects'), 'test')
+        reject_file.add('a.csv', 'line 2', ValueError('bad'), ['\xff'])
+        reject_file.close()
+
+        record = _read_rejects(self.path('a.rejects'))[1][0][2]
+        self.assertEqual(json.loads(record), repr(['\xff']))
+
+    def test_from_args(self):
+        self.assertEqual(rejects.from_args({}, 'test'), None)
+
+        reject_file = rejects.from_args({'max_errors': 5}, 'test')
+        self.assertEqual(reject_file.max_errors, 5)
+        self.assertEqual(reject_file.filename,
+                         self.path('state', 'rejects', 'test.rejects'))
+
+        reject_file = rejects.from_args({'rejects': self.path('x')}, 'test')
+        self.assertEqual((reject_file.filename, reject_file.max_errors),
+                         (self.path('x'), None))
+
+
+class MaxErrorsTest(StateTestCase):
+
+    def setUp(self):
+        super(MaxErrorsTest, self).setUp()
+
+        # Rows 3, 6 and 9 of ten are too short
+        self.export = self.path('sleep.csv')
+        with open(self.export, 'w') as export_file:
+            export_file.write(SLEEP_HEADER)
+            for num in xrange(1, 11):
+                if num % 3 == 0:
+                    export_file.write('2013-01-%02d 23:10:00;short\n' % num)
+                else:
+                    export_file.write(
+                        '2013-01-%02d 23:10:00;2013-01-%02d 07:00:00;60%%;'
+                        '7:50;:|;Coffee;60;%d\n' % (num, num + 1, num))
+
+        self.rejects = self.path('state', 'rejects', 'sleep_cycle.rejects')
+
+    def _run(self, *argv):
+        """Import the export into the test folder with extra argv"""
+
+        self.run_service('sleep_cycle', '-f', self.export, '-t', '-q', *argv)
+
+    def _written(self):
+        """Return number of entries written into the test folder"""
+
+        return len(os.listdir(self.path('test')))
+
+    def test_stops_at_first_bad_record(self):
+        self.assertRaises(ValueError, self._run)
+        self.assertEqual(self._written(), 2)
+        self.assertFalse(os.path.exists(self.rejects))
+
+    def test_stops_after_max_errors(self):
+        self.assertRaises(ValueError, self._run, '--max-errors', '2')
+
+        # Rows before the third bad one were imported
+        self.assertEqual(self._written(), 6)
+        self.assertEqual([record[0] for record in
+                          _read_rejects(self.rejects)[1]],
+                         ['line 4', 'line 7', 'line 10'])
+
+    def test_skips_up_to_max_errors(self):
+        self._run('--max-errors', '3')
+
+        self.assertEqual(self._written(), 7)
+        header, records = _read_rejects(self.rejects)
+        self.assertEqual(header['input'], self.export)
+        self.assertEqual(len(records), 3)
+
+    def test_rejects_without_limit(self):
+        self._run('--rejects', self.path('bad.rejects'))
+
+        self.assertEqual(self._written(), 7)
+        self.assertEqual(len(_read_rejects(self.path('bad.rejects'))[1]), 3)
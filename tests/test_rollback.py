@@ -0,0 +1,109 @@
+"""Tests of run manifests and dayonetools.rollback"""
+
+import os
+
+from dayonetools import manifest
+from dayonetools import rollback
+
+from tests import FIXTURES, StateTestCase
+
+
+class RollbackTest(StateTestCase):
+
+    def _write(self, name, text, folder=None):
+        """Write text into file name below folder, the temp dir by default"""
+
+        path = os.path.join(folder or self.temp_dir, name)
+        with open(path, 'w') as file_obj:
+            file_obj.write(text)
+
+        return path
+
+    def _read(self, name):
+        """Return text of entry name in the journal"""
+
+        with open(os.path.join(self.journal, name), 'r') as file_obj:
+            return file_obj.read()
+
+    def _run(self, entries):
+        """Place dict of entry name: text into the journal, return run id"""
+
+        run = manifest.Manifest('test', self.journal)
+        for name, text in sorted(entries.items()):
+            run.place(self._write(name, text),
+                      os.path.join(self.journal, name))
+        run.close()
+
+        return run.run_id
+
+    def test_removes_created_and_restores_replaced(self):
+        self._write('B.doentry', 'old b', self.journal)
+        self._write('C.doentry', 'by hand', self.journal)
+        run_id = self._run({'A.doentry': 'a', 'B.doentry': 'new b'})
+
+        removed, restored, skipped = rollback.rollback(run_id)
+
+        self.assertEqual(removed, [os.path.join(self.journal, 'A.doentry')])
+        self.assertEqual(restored, [os.path.join(self.journal, 'B.doentry')])
+        self.assertEqual(skipped, [])
+        self.assertEqual(self.entries(), ['B.doentry', 'C.doentry'])
+        self.assertEqual(self._read('B.doentry'), 'old b')
+        self.assertEqual(self._read('C.doentry'), 'by hand')
+
+    def test_first_prior_version_is_restored(self):
+        self._write('A.doentry', 'before', self.journal)
+        run = manifest.Manifest('test', self.journal)
+        for text in ('first', 'second'):
+            run.place(self._write('A.doentry', text),
+                      os.path.join(self.journal, 'A.doentry'))
+        run.close()
+
+        rollback.rollback(run.run_id)
+        self.assertEqual(self._read('A.doentry'), 'before')
+
+    def test_changed_entries_are_skipped(self):
+        run_id = self._run({'A.doentry': 'a', 'B.doentry': 'b'})
+        self._write('B.doentry', 'edited', self.journal)
+
+        removed, _, skipped = rollback.rollback(run_id)
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(skipped, [os.path.join(self.journal, 'B.doentry')])
+        self.assertEqual(self._read('B.doentry'), 'edited')
+
+    def test_force(self):
+        run_id = self._run({'A.doentry': 'a'})
+        self._write('A.doentry', 'edited', self.journal)
+
+        rollback.rollback(run_id, force=True)
+        self.assertEqual(self.entries(), [])
+
+    def test_dry_run(self):
+        run_id = self._run({'A.doentry': 'a'})
+
+        removed, _, _ = rollback.rollback(run_id, dry_run=True)
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(self.entries(), ['A.doentry'])
+
+        # Still possible for real afterwards
+        rollback.rollback(run_id)
+        self.assertEqual(self.entries(), [])
+
+    def test_errors(self):
+        run_id = self._run({'A.doentry': 'a'})
+        rollback.rollback(run_id)
+
+        self.assertRaises(ValueError, rollback.rollback, run_id)
+        self.assertRaises(IOError, rollback.rollback, 'test-nosuchrun')
+
+    def test_service_run(self):
+        self.run_service('habit_list', '-f',
+                         os.path.join(FIXTURES, 'habits.json'), '-t', '-q')
+        self.assertTrue(os.listdir(self.path('test')))
+
+        [run_id] = manifest.run_ids()
+        header, entries = manifest.load(run_id)
+        self.assertEqual(header['service'], 'habit_list')
+        self.assertEqual(len(entries), len(os.listdir(self.path('test'))))
+
+        rollback.rollback(run_id)
+        self.assertEqual(os.listdir(self.path('test')), [])
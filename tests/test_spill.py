@@ -0,0 +1,128 @@
+"""Tests of the memory budget of dayonetools.spill"""
+
+import argparse
+import os
+import plistlib
+import shutil
+from datetime import datetime
+
+from dateutil import tz
+
+from dayonetools import spill
+
+from tests import FIXTURES, StateTestCase
+
+
+class PartitionsTest(StateTestCase):
+
+    def _values(self, max_memory, unique=False):
+        """Add the same values to Partitions, return (runs, items)"""
+
+        zone = tz.gettz('Europe/Berlin')
+        with spill.Partitions(max_memory, unique) as parts:
+            for num in xrange(200):
+                day_str = '2014-01-%02d' % (num % 28 + 1)
+                parts.add(day_str, ('habit %d' % (num % 3),
+                                    datetime(2014, 1, 1, tzinfo=zone)))
+
+            items = list(parts.items())
+            file_name = parts._file_name
+            runs = parts.runs
+
+        # The temporary file is removed on close
+        self.assertTrue(file_name is None or not os.path.exists(file_name))
+
+        return runs, items
+
+    def test_spilled_items_match_memory(self):
+        runs, in_memory = self._values(None)
+        self.assertEqual(runs, 0)
+
+        runs, spilled = self._values(2048)
+        self.assertTrue(runs > 1)
+        self.assertEqual(spilled, in_memory)
+        self.assertEqual([key for key, _ in spilled],
+                         sorted(key for key, _ in spilled))
+
+    def test_unique(self):
+        runs, spilled = self._values(2048, unique=True)
+        self.assertTrue(runs > 1)
+
+        _, in_memory = self._values(None, unique=True)
+        self.assertEqual(spilled, in_memory)
+        self.assertEqual(len(dict(spilled)['2014-01-01']), 3)
+
+    def test_shared_timezones(self):
+        _, spilled = self._values(2048)
+        zones = set(id(dt_obj.tzinfo) for _, values in spilled
+                    for _, dt_obj in values)
+        self.assertEqual(len(zones), 1)
+
+    def test_keys(self):
+        with spill.Partitions(512) as parts:
+            for key in ('b', 'a', 'c', 'a'):
+                parts.add(key, 'x' * 300)
+
+            self.assertEqual(len(parts), 3)
+            self.assertEqual(list(parts), ['a', 'b', 'c'])
+            self.assertTrue('a' in parts)
+            self.assertEqual(parts.count, 4)
+
+
+class KeySetTest(StateTestCase):
+
+    def test_add(self):
+        for max_memory in (None, 512):
+            with spill.KeySet(max_memory) as keys:
+                added = [keys.add('key %d' % (num % 150))
+                         for num in xrange(300)]
+
+                self.assertEqual(added, [True] * 150 + [False] * 150)
+                self.assertEqual(len(keys), 150)
+                self.assertEqual(keys.runs > 0, max_memory is not None)
+
+    def test_unicode(self):
+        with spill.KeySet() as keys:
+            self.assertTrue(keys.add(u'caf\xe9'))
+            self.assertFalse(keys.add(u'caf\xe9'.encode('utf-8')))
+
+
+class MemorySizeTest(StateTestCase):
+
+    def test_units(self):
+        self.assertEqual(spill._memory_size('512'), 512)
+        self.assertEqual(spill._memory_size('2k'), 2048)
+        self.assertEqual(spill._memory_size('1.5MB'), 1536 * 1024)
+        self.assertEqual(spill._memory_size('1G'), 1024 ** 3)
+
+    def test_invalid(self):
+        for str_ in ('', 'M', 'lots', '0', '-1K'):
+            self.assertRaises(argparse.ArgumentTypeError, spill._memory_size,
+                              str_)
+
+
+class HabitListBudgetTest(StateTestCase):
+
+    def _days(self, *argv):
+        """Run habit_list on the fixture, return {entry date: habit lines}"""
+
+        self.run_service('habit_list', '-f',
+                         os.path.join(FIXTURES, 'habits.json'), '-t', '-q',
+                         *argv)
+
+        days = {}
+        for name in os.listdir(self.path('test')):
+            with open(self.path('test', name), 'r') as file_obj:
+                entry = plistlib.readPlistFromString(file_obj.read().strip())
+
+            days[entry['Creation Date']] = sorted(
+                            line for line in entry['Entry Text'].splitlines()
+                            if line.startswith('- '))
+
+        shutil.rmtree(self.path('test'))
+        return days
+
+    def test_same_days_with_budget(self):
+        days = self._days()
+        self.assertTrue(len(days) > 40)
+        self.assertEqual(self._days('--max-memory', '2K'), days)
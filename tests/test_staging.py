@@ -0,0 +1,106 @@
+"""Tests of staged output with dayonetools.staging"""
+
+import os
+
+from dayonetools import manifest
+from dayonetools import staging
+
+from tests import StateTestCase
+
+SLEEP_HEADER = ('Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n')
+
+
+class StagerTest(StateTestCase):
+
+    def _stager(self, burst_size, run=None):
+        """Return Stager recording the names of every burst in bursts"""
+
+        stager = staging.Stager('test', self.journal, self.path('staging'),
+                                burst_size, pause=0, run=run)
+        stager.bursts_moved = []
+        move = stager._move
+
+        def _move(names):
+            stager.bursts_moved.append(list(names))
+            move(names)
+
+        stager._move = _move
+        return stager
+
+    def _stage(self, stager, name):
+        """Write entry name into the staging folder and add it"""
+
+        with open(os.path.join(stager.folder, name), 'w') as entry:
+            entry.write(name)
+
+        return stager.add(os.path.join(stager.folder, name))
+
+    def test_moves_in_bursts(self):
+        stager = self._stager(3)
+        names = ['%d.doentry' % num for num in xrange(8)]
+        for name in names:
+            self.assertEqual(self._stage(stager, name),
+                             os.path.join(self.journal, name))
+        stager.close()
+
+        self.assertEqual(stager.bursts_moved,
+                         [names[:3], names[3:6], names[6:]])
+        self.assertEqual((stager.moved, stager.bursts), (8, 3))
+        self.assertEqual(self.entries(), sorted(names))
+        self.assertEqual(os.listdir(stager.folder), [])
+
+    def test_recover(self):
+        os.mkdir(self.path('staging'))
+        for name in ('a.doentry', 'b.doentry', 'notes.txt'):
+            with open(self.path('staging', name), 'w') as entry:
+                entry.write(name)
+
+        stager = self._stager(10)
+        stager.recover()
+        self._stage(stager, 'a.doentry')
+        stager.close()
+
+        # a was written again, it's moved only once
+        self.assertEqual(self.entries(), ['a.doentry', 'b.doentry'])
+        self.assertEqual(os.listdir(stager.folder), ['notes.txt'])
+
+    def test_manifest(self):
+        run = manifest.Manifest('test', self.journal)
+        stager = self._stager(2, run)
+        for num in xrange(3):
+            self._stage(stager, '%d.doentry' % num)
+        stager.close()
+
+        _, entries = manifest.load(run.run_id)
+        self.assertEqual([entry[0] for entry in entries],
+                         ['0.doentry', '1.doentry', '2.doentry'])
+
+    def test_move_error(self):
+        stager = self._stager(1)
+        stager.destination = self.path('missing')
+        self._stage(stager, 'a.doentry')
+
+        self.assertRaises(OSError, stager.close)
+
+
+class StagedRunTest(StateTestCase):
+
+    def test_staged_run(self):
+        export = self.path('sleep.csv')
+        with open(export, 'w') as export_file:
+            export_file.write(SLEEP_HEADER)
+            for num in xrange(5):
+                export_file.write(
+                    '2013-01-%02d 23:10:00;2013-01-%02d 07:00:00;60%%;7:50;'
+                    ':|;Coffee;60;%d\n' % (num + 1, num + 2, 1000 + num))
+
+        self.run_service('sleep_cycle', '-f', export, '-t', '-q', '--stage',
+                         '--stage-dir', self.path('staging'),
+                         '--burst-size', '2', '--burst-pause', '0')
+
+        self.assertEqual(len(os.listdir(self.path('test'))), 5)
+        self.assertEqual(os.listdir(self.path('staging')), [])
+
+        _, entries = manifest.load(manifest.run_ids()[-1])
+        self.assertEqual(len(entries), 5)
@@ -0,0 +1,129 @@
+"""Tests of the compiled entry templates of dayonetools.templates"""
+
+import os
+
+from dayonetools import templates
+from dayonetools.services import sleep_cycle
+
+from tests import StateTestCase
+
+FIELDS = ('name', 'count', 'ratio')
+
+VALUES = {'name': 'Coffee', 'count': 3, 'ratio': 0.5,
+          'entry_title': 'Title'}
+
+
+class TemplateTest(StateTestCase):
+
+    def _render(self, text, values=VALUES):
+        """Return text rendered by Template and by str.format()"""
+
+        template = templates.Template(text, FIELDS, 'Title')
+        return template.render(values), text.format(**values)
+
+    def test_same_as_format(self):
+        for text in ('{entry_title}: {name}',
+                     'no fields at all',
+                     '',
+                     '{count} cups, {ratio:.2f} full, {count:>4}|',
+                     '{name!r} and {count!s}',
+                     '{name}{name}{count}'):
+            rendered, formatted = self._render(text)
+            self.assertEqual(rendered, formatted)
+
+    def test_escaping(self):
+        for text in ('{{literal}} {name}',
+                     '100% of {count}, 5%s %d %%',
+                     'quotes \' " and \\ backslash {count}',
+                     '\n  indented\n{ratio}\t\n',
+                     u'unicode \xe9 {name}'):
+            rendered, formatted = self._render(text)
+            self.assertEqual(rendered, formatted)
+
+        self.assertEqual(self._render('{{count}}')[0], '{count}')
+
+    def test_unicode_values(self):
+        values = dict(VALUES, name=u'Caf\xe9')
+        template = templates.Template('{name} {count}', FIELDS, 'Title')
+        self.assertEqual(template.render(values), u'Caf\xe9 3')
+
+    def test_unknown_field(self):
+        try:
+            templates.Template('{name} {steps}', FIELDS, 'Title', 'mine.txt')
+        except ValueError as err:
+            self.assertEqual(str(err),
+                             'mine.txt: unknown field {steps}, fields are: '
+                             'count, entry_title, name, ratio')
+        else:
+            self.fail('unknown field accepted')
+
+    def test_invalid_templates(self):
+        for text in ('{name', 'name}', '{count:{ratio}}', '{name!x}',
+                     '{name.upper}', '{0}'):
+            self.assertRaises(ValueError, templates.Template, text, FIELDS,
+                              'Title')
+
+
+class FromArgsTest(StateTestCase):
+
+    def _template_file(self, text):
+        """Write template text into a file, return its path"""
+
+        with open(self.path('template.txt'), 'w') as file_obj:
+            file_obj.write(text)
+
+        return self.path('template.txt')
+
+    def test_default(self):
+        default = sleep_cycle.TEMPLATE
+        self.assertIs(templates.from_args({}, default), default)
+
+        titled = templates.from_args({'title': 'Nights'}, default)
+        self.assertEqual((titled.text, titled.title), (default.text, 'Nights'))
+
+    def test_template_file_is_checked(self):
+        args = {'template': self._template_file('{Start} {Steps}')}
+        self.assertRaises(ValueError, templates.from_args, args,
+                          sleep_cycle.TEMPLATE)
+
+    def test_compiled_template_is_cached(self):
+        args = {'template': self._template_file('{entry_title} {Start}\n')}
+        values = {'entry_title': 'Sleep', 'Start': '2013-01-01 23:10:00'}
+
+        rendered = templates.from_args(args, sleep_cycle.TEMPLATE).render(
+                                                                    values)
+        self.assertEqual(rendered, 'Sleep 2013-01-01 23:10:00\n')
+
+        cached = os.listdir(self.path('state', 'templates'))
+        self.assertEqual(len(cached), 1)
+
+        # A broken cache file is compiled again
+        with open(self.path('state', 'templates', cached[0]), 'wb') as code:
+            code.write('x')
+
+        template = templates.from_args(args, sleep_cycle.TEMPLATE)
+        self.assertEqual(template.render(values), rendered)
+        self.assertEqual(os.listdir(self.path('state', 'templates')), cached)
+
+    def test_run_with_template(self):
+        export = self.path('sleep.csv')
+        with open(export, 'w') as export_file:
+            export_file.write('Start;End;Sleep quality;Time in bed;Wake up;'
+                              'Sleep Notes;Heart rate;Activity (steps)\n'
+                              '2013-01-01 23:10:00;2013-01-02 07:00:00;60%;'
+                              '7:50;:|;Coffee;60;1000\n')
+
+        template = self._template_file(
+            '\n<?xml version="1.0" encoding="UTF-8"?>\n<plist version="1.0">'
+            '<dict><key>Creation Date</key><date>{sleep_start}</date>'
+            '<key>Entry Text</key><string>{entry_title}: '
+            '{Sleep_quality} 100%</string><key>UUID</key>'
+            '<string>{uuid_str}</string></dict></plist>\n')
+
+        self.run_service('sleep_cycle', '-f', export, '-t', '-q',
+                         '--template', template, '--title', 'Night')
+
+        names = os.listdir(self.path('test'))
+        self.assertEqual(len(names), 1)
+        with open(self.path('test', names[0]), 'r') as entry:
+            self.assertIn('<string>Night: 60% 100%</string>', entry.read())
@@ -0,0 +1,87 @@
+"""Tests of the timezone timeline of dayonetools.timeline"""
+
+from datetime import datetime
+
+from dayonetools import timeline
+
+from tests import StateTestCase
+
+PERIODS = [('2014-03-01', '2014-03-15', 'America/New_York'),
+           ('2014-06-01', None, 'Asia/Tokyo')]
+
+
+class TimelineTest(StateTestCase):
+
+    def setUp(self):
+        super(TimelineTest, self).setUp()
+        self.timeline = timeline.Timeline('Europe/Berlin', PERIODS)
+
+    def test_zone_name_at(self):
+        at = self.timeline.zone_name_at
+        self.assertEqual(at(datetime(2014, 1, 1)), 'Europe/Berlin')
+
+        # Local midnight in New York is 05:00 UTC
+        self.assertEqual(at(datetime(2014, 3, 1, 4, 59)), 'Europe/Berlin')
+        self.assertEqual(at(datetime(2014, 3, 1, 5)), 'America/New_York')
+
+        # END is inclusive
+        self.assertEqual(at(datetime(2014, 3, 15, 23)), 'America/New_York')
+        self.assertEqual(at(datetime(2014, 3, 16, 5)), 'Europe/Berlin')
+
+        # Open period lasts forever
+        self.assertEqual(at(datetime(2020, 1, 1)), 'Asia/Tokyo')
+
+    def test_convert_keeps_order(self):
+        utc_dts = [datetime(2014, 7, 1, 20), datetime(2014, 1, 1, 12),
+                   datetime(2014, 3, 10, 3)]
+        converted = self.timeline.convert(utc_dts)
+
+        self.assertEqual([name for name, _ in converted],
+                         ['Asia/Tokyo', 'Europe/Berlin', 'America/New_York'])
+
+        # Late evening in UTC is the next local day in Tokyo and the day
+        # before in New York.
+        self.assertEqual([local.strftime('%Y-%m-%d %H') for _, local
+                          in converted],
+                         ['2014-07-02 05', '2014-01-01 13', '2014-03-09 23'])
+
+    def test_convert_matches_zone_name_at(self):
+        utc_dts = [datetime(2014, month, day, hour)
+                   for month in (2, 3, 5, 6) for day in (1, 15, 16)
+                   for hour in (0, 12)]
+
+        self.assertEqual([name for name, _ in self.timeline.convert(utc_dts)],
+                         [self.timeline.zone_name_at(utc_dt)
+                          for utc_dt in utc_dts])
+
+    def test_overlapping_periods(self):
+        tline = timeline.Timeline('UTC', [
+                    ('2014-01-01', '2014-01-31', 'Asia/Tokyo'),
+                    ('2014-01-10', '2014-01-12', 'America/New_York')])
+
+        self.assertEqual(tline.zone_name_at(datetime(2014, 1, 11)),
+                         'America/New_York')
+        self.assertEqual(tline.zone_name_at(datetime(2014, 1, 20)), 'UTC')
+
+    def test_load(self):
+        filename = self.path('timeline')
+        with open(filename, 'w') as file_obj:
+            file_obj.write('# START END ZONE\n'
+                           '2014-03-01  2014-03-15  America/New_York\n'
+                           '\n'
+                           '2014-06-01  Asia/Tokyo  # moved\n')
+
+        loaded = timeline.Timeline.load(filename, 'Europe/Berlin')
+        self.assertEqual(loaded.digest, self.timeline.digest)
+
+        self.assertEqual(timeline.Timeline.load(None, 'UTC').zone_name_at(
+                            datetime(2014, 1, 1)), 'UTC')
+
+    def test_load_errors(self):
+        filename = self.path('timeline')
+        for line in ('2014-03-01\n', '2014-03-01 Mars/Olympus_Mons\n'):
+            with open(filename, 'w') as file_obj:
+                file_obj.write(line)
+
+            self.assertRaises(ValueError, timeline.Timeline.load, filename,
+                              'UTC')
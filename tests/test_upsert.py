@@ -0,0 +1,64 @@
+"""Tests of the SQLite day index of dayonetools.upsert"""
+
+import json
+import os
+
+from dayonetools import upsert
+from dayonetools.services import get_state_folder
+
+from tests import StateTestCase
+
+
+class DayIndexTest(StateTestCase):
+
+    def test_unknown_day(self):
+        index = upsert.DayIndex('idonethis', self.journal)
+        self.assertEqual(index.merge('2014-01-01', [('a', 'b')]),
+                         (None, [['a', 'b']]))
+        index.close()
+
+    def test_merge_adds_only_new_items(self):
+        index = upsert.DayIndex('idonethis', self.journal)
+        index.put('2014-01-01', '/x/ABC.doentry', [['a', 'b']])
+        index.close()
+
+        index = upsert.DayIndex('idonethis', self.journal)
+        self.assertEqual(index.merge('2014-01-01', [('a', 'b')]),
+                         ('ABC', None))
+        self.assertEqual(index.merge('2014-01-01', [('a', 'b'), ('c', 'd')]),
+                         ('ABC', [['a', 'b'], ['c', 'd']]))
+        index.close()
+
+    def test_put_replaces_day(self):
+        index = upsert.DayIndex('habit_list', self.journal, interval=1)
+        index.put('2014-01-01', 'ABC.doentry', ['run'])
+        index.put('2014-01-01', 'ABC.doentry', ['run', 'read'])
+        self.assertEqual(index.get('2014-01-01'), ('ABC', ['run', 'read']))
+        self.assertEqual(index.get('2014-01-02'), None)
+        index.close()
+
+    def test_folders_have_own_index(self):
+        index = upsert.DayIndex('habit_list', self.journal)
+        index.put('2014-01-01', 'ABC.doentry', ['run'])
+        index.close()
+
+        other = upsert.DayIndex('habit_list', self.path('other'))
+        self.assertEqual(other.get('2014-01-01'), None)
+        other.close()
+
+    def test_imports_json_index(self):
+        index = upsert.DayIndex('habit_list', self.journal)
+        index.close()
+        os.remove(index.path)
+
+        json_path = index.path[:-len('.db')] + '.json'
+        with open(json_path, 'w') as file_obj:
+            json.dump({'2014-01-01': {'uuid': 'ABC', 'items': ['run']}},
+                      file_obj)
+
+        index = upsert.DayIndex('habit_list', self.journal)
+        self.assertEqual(index.get('2014-01-01'), ('ABC', ['run']))
+        self.assertFalse(os.path.exists(json_path))
+        self.assertEqual(os.listdir(get_state_folder('index')),
+                         [os.path.basename(index.path)])
+        index.close()
@@ -0,0 +1,154 @@
+"""Tests of checking written entries with dayonetools.verify"""
+
+import os
+from StringIO import StringIO
+import sys
+
+from dayonetools import manifest
+from dayonetools import verify
+
+from tests import StateTestCase
+
+SLEEP_HEADER = ('Start;End;Sleep quality;Time in bed;Wake up;Sleep Notes;'
+                'Heart rate;Activity (steps)\n')
+
+ENTRY = """
+<?xml version="1.0" encoding="UTF-8"?>
+<plist version="1.0">
+<dict>
+    <key>Creation Date</key>
+    <date>{date}</date>
+    <key>Entry Text</key>
+    <string>Sleep</string>
+    <key>Tags</key>
+    <array>
+        {tags}
+    </array>
+    <key>UUID</key>
+    <string>{uuid}</string>
+</dict>
+</plist>
+"""
+
+UUID = '0123456789abcdef0123456789ABCDEF'
+
+
+class CheckEntryTest(StateTestCase):
+
+    def _check(self, name=UUID + '.doentry', date='2013-01-01T23:10:00Z',
+               tags='<string>sleep</string>', uuid=UUID, checksum=None):
+        """Return problems check_entry() finds with an entry of the args"""
+
+        path = os.path.join(self.journal, name)
+        with open(path, 'w') as entry:
+            entry.write(ENTRY.format(date=date, tags=tags, uuid=uuid))
+
+        return verify.check_entry(path, checksum)
+
+    def test_good(self):
+        self.assertEqual(self._check(), [])
+        self.assertEqual(self._check(name='other.doentry'), [])
+
+    def test_bad_fields(self):
+        self.assertEqual(self._check(uuid='xyz'), ["invalid UUID u'xyz'"])
+        self.assertEqual(self._check(uuid=UUID[::-1]),
+                         ['UUID %s does not match the file name' % (
+                          UUID[::-1])])
+        self.assertEqual(self._check(date='2013-01-01'),
+                         ["invalid creation date u'2013-01-01'"])
+        self.assertEqual(self._check(tags=''), ['no tags'])
+
+    def test_changed(self):
+        self.assertEqual(self._check(checksum='0' * 40),
+                         ['changed since it was written'])
+
+    def test_invalid_plist(self):
+        path = os.path.join(self.journal, 'broken.doentry')
+        with open(path, 'w') as entry:
+            entry.write(ENTRY[:-20])
+
+        problems = verify.check_entry(path)
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith('invalid plist: '))
+
+    def test_missing(self):
+        self.assertEqual(verify.check_entry(self.path('missing.doentry')),
+                         ['missing'])
+
+
+class VerifyRunTest(StateTestCase):
+
+    def setUp(self):
+        super(VerifyRunTest, self).setUp()
+
+        export = self.path('sleep.csv')
+        with open(export, 'w') as export_file:
+            export_file.write(SLEEP_HEADER)
+            for num in xrange(4):
+                export_file.write(
+                    '2013-01-%02d 23:10:00;2013-01-%02d 07:00:00;60%%;7:50;'
+                    ':|;Coffee;60;%d\n' % (num + 1, num + 2, 1000 + num))
+
+        self.run_service('sleep_cycle', '-f', export, '-t', '-q')
+        self.folder = self.path('test')
+        self.names = sorted(os.listdir(self.folder))
+
+        self._stdout, sys.stdout = sys.stdout, StringIO()
+
+    def tearDown(self):
+        sys.stdout = self._stdout
+        super(VerifyRunTest, self).tearDown()
+
+    def _verify(self, *argv):
+        """Run verify with argv, return (exit status, printed lines)"""
+
+        sys_argv, sys.argv = sys.argv, ['verify'] + list(argv) + ['-q']
+        try:
+            verify.main()
+            status = 0
+        except SystemExit as err:
+            status = err.code
+        finally:
+            sys.argv = sys_argv
+
+        lines = sys.stdout.getvalue().splitlines()
+        sys.stdout = StringIO()
+        return status, lines
+
+    def test_good_run(self):
+        self.assertEqual(self._verify(),
+                         (0, ['Checked 4 entries, 0 bad, 0 missing']))
+
+    def test_bad_and_missing_entries(self):
+        bad, missing = [os.path.join(self.folder, name)
+                        for name in self.names[:2]]
+        with open(bad, 'a') as entry:
+            entry.write('edited')
+        os.remove(missing)
+
+        run_id = manifest.run_ids()[-1]
+        for argv in ((), ('--run', run_id), (self.folder,)):
+            status, lines = self._verify(*argv)
+
+            self.assertEqual(status, 1)
+            self.assertEqual(lines[-1], 'Checked 4 entries, 1 bad, 1 missing')
+            self.assertIn('%s: missing' % (missing), lines)
+            self.assertIn('%s: changed since it was written' % (bad), lines)
+            self.assertTrue([line for line in lines
+                             if line.startswith('%s: invalid plist' % (bad))])
+
+    def test_entries_not_in_a_run(self):
+        with open(os.path.join(self.folder, 'extra.doentry'), 'w') as entry:
+            entry.write('not a plist')
+
+        status, lines = self._verify(self.folder)
+        self.assertEqual(status, 1)
+        self.assertEqual(lines[-1], 'Checked 5 entries, 1 bad, 0 missing')
+
+    def test_many_entries_in_processes(self):
+        tasks = verify._folder_entries(self.folder) * verify.CHUNK_SIZE
+        results = list(verify.verify(tasks, jobs=2))
+
+        self.assertEqual(len(results), len(tasks))
+        self.assertEqual([problems for _, problems in results
+                          if problems], [])
@@ -0,0 +1,118 @@
+"""Tests of the --api sources against dayonetools.stubserver"""
+
+import os
+import plistlib
+
+from dayonetools import stubserver
+from dayonetools import webapi
+
+from tests import FIXTURES, StateTestCase
+
+
+class StubTestCase(StateTestCase):
+    """Test case replaying the recordings in fixtures/api with 2 per page"""
+
+    def setUp(self):
+        super(StubTestCase, self).setUp()
+        self._page_size = webapi.PAGE_SIZE
+        webapi.PAGE_SIZE = 2
+        self.server = None
+
+    def tearDown(self):
+        webapi.PAGE_SIZE = self._page_size
+        if self.server is not None:
+            self.server.stop()
+
+        super(StubTestCase, self).tearDown()
+
+    def serve(self, *folder):
+        """Replay recordings in folder below fixtures/api, return its URL"""
+
+        if self.server is not None:
+            self.server.stop()
+
+        self.server = stubserver.StubServer(
+                            os.path.join(FIXTURES, 'api', *folder)).start()
+        return self.server.url
+
+    def entry_texts(self):
+        """Return {file name: entry text} of the entries written with -t"""
+
+        texts = {}
+        for name in os.listdir(self.path('test')):
+            # Templates start with a line break before the XML declaration
+            with open(self.path('test', name), 'r') as file_obj:
+                entry = plistlib.readPlistFromString(file_obj.read().strip())
+
+            texts[name] = entry['Entry Text']
+
+        return texts
+
+
+class IterPagesTest(StubTestCase):
+
+    def _dones(self, folder, since=None):
+        pool = webapi.ConnectionPool(self.serve('idonethis', folder))
+        path = '/dones/?page=%d&page_size=2&order_by=-done_date'
+        if since:
+            path += '&done_date_after=' + since
+
+        try:
+            return [done['raw_text'] for done in webapi.iter_pages(
+                        pool, lambda page: path % (page + 1),
+                        lambda body: body['results'])]
+        finally:
+            pool.close()
+
+    def test_short_page_is_last(self):
+        self.assertEqual(len(self._dones('first')), 3)
+
+    def test_empty_page_is_last(self):
+        self.assertEqual(len(self._dones('later', '2014-03-03')), 4)
+
+    def test_missing_first_page(self):
+        self.assertRaises(webapi.NotFound, self._dones, 'first', '2014-01-01')
+
+    def test_missing_page_after_full_page(self):
+        pool = webapi.ConnectionPool(self.serve('nikeplus'))
+        path = '/me/sport/activities?count=2&offset=%d'
+
+        try:
+            activities = list(webapi.iter_pages(
+                                pool, lambda page: path % (page * 2 + 1),
+                                lambda body: body['data']))
+        finally:
+            pool.close()
+
+        self.assertEqual(len(activities), 4)
+
+
+class ServiceApiTest(StubTestCase):
+
+    def test_nikeplus(self):
+        self.run_service('nikeplus', '--api', self.serve('nikeplus'), '-t',
+                         '-q')
+
+        texts = self.entry_texts()
+        self.assertEqual(len(texts), 4)
+        self.assertTrue(any('7004' in text for text in texts.values()))
+
+    def test_idonethis_reads_cursor_day_again(self):
+        url = self.serve('idonethis', 'first')
+        self.run_service('idonethis', '--api', url, '-t', '-q')
+        self.assertEqual(len(self.entry_texts()), 3)
+
+        # Later the day of the cursor has another done and there is a new day
+        self.server.folder = os.path.join(FIXTURES, 'api', 'idonethis',
+                                          'later')
+        self.run_service('idonethis', '--api', url, '-t', '-q')
+
+        texts = sorted(self.entry_texts().values())
+        self.assertEqual(len(texts), 4)
+        self.assertEqual(sum('Wrote the release notes' in text
+                             for text in texts), 1)
+        self.assertTrue(any('Tagged the release' in text and
+                            'Wrote the release notes' in text
+                            for text in texts))
+        self.assertTrue(any('Answered support mail' in text
+                            for text in texts))